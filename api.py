@@ -1,25 +1,180 @@
-from flask import Flask, request, jsonify, send_file
-import os
-import cv2
-import numpy as np
-import base64
+from flask import Flask, request, jsonify, Response, stream_with_context
+import time
+import json
+import tarfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import io
-from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.admission import AdmissionController, Overloaded
+from app.cache import ResultCache
 from app.camera import Camera
+from app.models import InferenceOptions
+from app.preprocess import decode_image
+from app.responses import ResponseOptions, detection_payload, detection_response
+from app.scheduler import InferenceScheduler
+from app.sessions import FrameSession
+from app.simulated import SimulatedCamera
+from app import metrics, serving
+from config import Config
+from fetch import FetchError, ImageFetcher
 
-# Initialize Flask app
+try:
+    from flask_sock import Sock
+except ImportError:  # optional: the /api/session WebSocket endpoint needs flask-sock
+    Sock = None
+
+# Initialize Flask app; request bodies over MAX_CONTENT_LENGTH get a 413
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
+
+# Initialize camera; models load in the background (see Config.MODEL_LOADING).
+# SIMULATED_INFERENCE swaps in fake models for load testing without weights
+camera = SimulatedCamera() if Config.SIMULATED_INFERENCE else Camera()
+
+# All inference goes through the scheduler, which batches concurrent requests
+# and answers re-submitted images from the result cache
+result_cache = ResultCache() if Config.RESULT_CACHE_ENABLED else None
+scheduler = InferenceScheduler(camera, cache=result_cache)
+
+# Under load, requests are admitted at lower quality levels and finally shed
+# to hold Config.SLO_LATENCY_MS
+admission = AdmissionController(scheduler)
+
+# cv2.imdecode releases the GIL, so batch uploads are decoded on a thread pool
+decode_pool = ThreadPoolExecutor(max_workers=Config.DECODE_WORKERS, thread_name_prefix='decode')
+
+# Pooled, bounded downloads for /api/detect_url
+fetcher = ImageFetcher()
+
+metrics.registry.gauge('inference_queue_depth', 'Frames waiting in the scheduler queue', scheduler.pending)
+metrics.registry.gauge('admission_quality_level', 'Current quality level (0 is full quality)',
+                       lambda: admission.level)
+metrics.registry.gauge('admission_rejected_requests', 'Requests shed with 503 since start',
+                       lambda: admission.rejected)
 
-# Initialize camera with models
-camera = Camera()
+@app.errorhandler(Overloaded)
+def _overloaded(e):
+    """Shed request: 503 with a Retry-After estimated from the queue"""
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@app.errorhandler(RequestEntityTooLarge)
+def _too_large(e):
+    return jsonify({'error': f'Request body is larger than {Config.MAX_CONTENT_LENGTH} bytes'}), 413
+
+@app.before_request
+def _start_trace():
+    metrics.start_trace()
+
+@app.after_request
+def _record_request(response):
+    """Record the request duration and, with SERVER_TIMING, report its stage durations"""
+    trace = metrics.current_trace()
+    if trace is None or not Config.METRICS_ENABLED:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    if response.is_streamed:
+        # A streamed (NDJSON) body is generated after this hook returns, so the
+        # request is timed when the body has been sent
+        response.call_on_close(
+            lambda: metrics.REQUEST_SECONDS.observe(time.perf_counter() - trace.start, endpoint))
+        return response
+    elapsed = time.perf_counter() - trace.start
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint)
+    if Config.SERVER_TIMING and trace.timings:
+        response.headers['Server-Timing'] = f'{trace.server_timing()}, total;dur={1000 * elapsed:.2f}'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Latency histograms and memory gauges in the Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Simple health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'message': 'Object Detection and Depth Estimation API is running'
-    })
+    """Health check endpoint; answers immediately while the models are still warming"""
+    if camera.status == 'ready':
+        health = {
+            'status': 'healthy',
+            'message': 'Object Detection and Depth Estimation API is running',
+            'model_load_seconds': round(camera.load_time, 3)
+        }
+    elif camera.status == 'error':
+        health = {'status': 'error', 'message': f'Models failed to load: {camera.load_error}'}
+    else:
+        health = {'status': 'warming', 'message': 'Models are loading'}
+    if Config.SIMULATED_INFERENCE:
+        health['simulated'] = True
+    if result_cache is not None:
+        health['cache'] = result_cache.stats()
+    if admission.enabled:
+        health['admission'] = admission.stats()
+    if serving.worker_info:
+        health['worker'] = serving.worker_info
+    return jsonify(health), 200 if camera.status == 'ready' else 503
+
+def _decode_image(img_bytes):
+    """Decode image bytes into (BGR frame, scale to original coordinates); frame is None if invalid"""
+    with metrics.stage('decode'):
+        return decode_image(img_bytes)
+
+def _inference_options(values):
+    """Per-request InferenceOptions; class names are only looked up (waiting for the models) if given"""
+    return InferenceOptions.from_values(values, camera.class_names if values.get('classes') else None)
+
+def _infer(img, scale, quality, inference):
+    """Run the scheduler on a decoded frame (cropped to the roi) and report boxes in original-image coordinates"""
+    frame, roi = inference.crop(img, scale)
+    result = scheduler.submit(frame, quality, inference)
+    result.source_scale = scale
+    result.source_roi = roi
+    trace = metrics.current_trace()
+    if trace is not None:
+        trace.merge(result.timings)
+    return result
+
+def _archive_members(data):
+    """Yield (name, size, read) for every regular file in a zip or tar archive, without reading it"""
+    if zipfile.is_zipfile(data):
+        with zipfile.ZipFile(data) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: zf.read(info)
+        return
+    data.seek(0)
+    try:
+        with tarfile.open(fileobj=data) as tf:
+            for member in tf:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: tf.extractfile(member).read()
+    except tarfile.TarError:
+        raise ValueError('Archive must be a zip or tar file')
+
+def _read_archive(archive, max_files, max_bytes):
+    """Yield (name, bytes) for the regular files in a zip or tar upload.
+
+    Limits are checked against the sizes in the archive index before a member
+    is decompressed: raises ValueError after max_files files, for a file over
+    BATCH_MAX_IMAGE_BYTES or once the files add up to more than max_bytes.
+    """
+    for name, size, read in _archive_members(io.BytesIO(archive.read())):
+        if max_files <= 0:
+            raise ValueError(f'Too many images, the limit is {Config.BATCH_MAX_IMAGES}')
+        if size > Config.BATCH_MAX_IMAGE_BYTES:
+            raise ValueError(f'{name} is larger than {Config.BATCH_MAX_IMAGE_BYTES} bytes')
+        if size > max_bytes:
+            raise ValueError(f'Archive contents are larger than {Config.BATCH_MAX_ARCHIVE_BYTES} bytes')
+        try:
+            body = read()
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error):
+            raise ValueError(f'Archive member {name} is corrupt')
+        max_files -= 1
+        max_bytes -= len(body)
+        yield name, body
 
 @app.route('/api/detect', methods=['POST'])
 def detect_objects():
@@ -31,97 +186,177 @@ def detect_objects():
     if file.filename == '':
         return jsonify({'error': 'No image selected'}), 400
     
+    try:
+        options = ResponseOptions.from_values(request.values)
+        inference = _inference_options(request.values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Shed before decoding, so rejecting stays cheap under overload
+    quality = admission.admit()
+    
     # Read and process the image
-    img_bytes = file.read()
-    nparr = np.frombuffer(img_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    img, scale = _decode_image(file.read())
     
     if img is None:
         return jsonify({'error': 'Invalid image format'}), 400
     
     try:
         # Process the image (object detection + depth estimation)
-        processed_img = camera.process_frame(img)
-        
-        # Convert the processed image to base64 for response
-        _, buffer = cv2.imencode('.jpg', processed_img)
-        img_str = base64.b64encode(buffer).decode('utf-8')
-        
-        # Get raw detection results
-        detections = camera.detect_objects(img)
-        detection_results = []
-        
-        for detection in detections:
-            x1, y1, x2, y2, conf, cls = detection
-            class_name = camera.yolo_model.names[int(cls)]
-            detection_results.append({
-                'class': class_name,
-                'confidence': float(conf),
-                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-            })
-        
-        return jsonify({
-            'success': True,
-            'detections': detection_results,
-            'processed_image': img_str
-        })
+        return detection_response(_infer(img, scale, quality, inference), options)
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/detect_url', methods=['POST'])
 def detect_from_url():
-    """API endpoint to detect objects and estimate depth from an image URL"""
-    import requests
-    
-    data = request.get_json()
-    if not data or 'url' not in data:
+    """API endpoint to detect objects and estimate depth from an image URL.
+
+    With a `urls` list instead of `url` the images are downloaded concurrently
+    and the results stream back as newline-delimited JSON, like detect_batch.
+    """
+    data = request.get_json(silent=True)
+    if not data or not ('url' in data or 'urls' in data):
         return jsonify({'error': 'No image URL provided'}), 400
     
-    image_url = data['url']
+    try:
+        options = ResponseOptions.from_values(data)
+        inference = _inference_options(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if 'urls' in data:
+        urls = data['urls']
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+            return jsonify({'error': 'urls must be a non-empty list of URLs'}), 400
+        if len(urls) > Config.BATCH_MAX_IMAGES:
+            return jsonify({'error': f'Too many images, the limit is {Config.BATCH_MAX_IMAGES}'}), 400
+        quality = admission.admit()
+        items = [({'index': index, 'url': url}, body)
+                 for index, (url, body) in enumerate(zip(urls, fetcher.fetch_many(urls)))]
+        return _stream_results(items, options, quality, inference)
     
+    quality = admission.admit()
     try:
         # Download the image
-        response = requests.get(image_url, stream=True)
-        if response.status_code != 200:
-            return jsonify({'error': f'Failed to download image, status code: {response.status_code}'}), 400
-        
+        img_bytes = fetcher.fetch(data['url'])
+    except FetchError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    try:
         # Convert to OpenCV format
-        img_bytes = response.content
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img, scale = _decode_image(img_bytes)
         
         if img is None:
             return jsonify({'error': 'Invalid image format'}), 400
         
         # Process the image
-        processed_img = camera.process_frame(img)
-        
-        # Convert the processed image to base64 for response
-        _, buffer = cv2.imencode('.jpg', processed_img)
-        img_str = base64.b64encode(buffer).decode('utf-8')
-        
-        # Get raw detection results
-        detections = camera.detect_objects(img)
-        detection_results = []
-        
-        for detection in detections:
-            x1, y1, x2, y2, conf, cls = detection
-            class_name = camera.yolo_model.names[int(cls)]
-            detection_results.append({
-                'class': class_name,
-                'confidence': float(conf),
-                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-            })
-        
-        return jsonify({
-            'success': True,
-            'detections': detection_results,
-            'processed_image': img_str
-        })
+        return detection_response(_infer(img, scale, quality, inference), options)
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/detect_batch', methods=['POST'])
+def detect_batch():
+    """API endpoint to process many images in one request.
+
+    Accepts several `images` files and/or an `archive` (zip or tar) and streams
+    one JSON object per image as newline-delimited JSON, in completion order.
+    The image/depth/jpeg_quality/max_width and classes/conf/iou/max_det/roi
+    options apply to every line.
+    """
+    uploads = [(f.filename, f.read()) for f in request.files.getlist('images') if f.filename]
+    archive_bytes = Config.BATCH_MAX_ARCHIVE_BYTES
+    try:
+        for archive in request.files.getlist('archive'):
+            for filename, img_bytes in _read_archive(archive, Config.BATCH_MAX_IMAGES - len(uploads),
+                                                     archive_bytes):
+                uploads.append((filename, img_bytes))
+                archive_bytes -= len(img_bytes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not uploads:
+        return jsonify({'error': 'No images provided'}), 400
+    try:
+        options = ResponseOptions.from_values(request.values)
+        inference = _inference_options(request.values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(uploads) > Config.BATCH_MAX_IMAGES:
+        return jsonify({'error': f'Too many images, the limit is {Config.BATCH_MAX_IMAGES}'}), 400
+    
+    quality = admission.admit()
+    items = [({'index': index, 'filename': filename}, img_bytes)
+             for index, (filename, img_bytes) in enumerate(uploads)]
+    return _stream_results(items, options, quality, inference)
+
+def _stream_results(items, options, quality, inference):
+    """Decode, queue and stream results for (fields, image bytes or error) pairs as NDJSON.
+
+    Each line is the item's fields (index, filename or url) plus its detection
+    payload or an error, in completion order. Every image is queued at the
+    quality level the request was admitted at, with the request's
+    InferenceOptions.
+    """
+    errors = [{**fields, 'error': str(body)} for fields, body in items if not isinstance(body, bytes)]
+    items = [(fields, body) for fields, body in items if isinstance(body, bytes)]
+    
+    # Decode in parallel and queue every valid frame right away, so the
+    # scheduler can group them into real batches
+    frames = list(decode_pool.map(_decode_image, [body for _, body in items]))
+    futures = {}
+    for (fields, _), (img, scale) in zip(items, frames):
+        if img is None:
+            errors.append({**fields, 'error': 'Invalid image format'})
+            continue
+        try:
+            frame, roi = inference.crop(img, scale)
+        except ValueError as e:
+            errors.append({**fields, 'error': str(e)})
+            continue
+        futures[scheduler.submit_async(frame, quality, inference)] = (fields, scale, roi)
+    del frames, items
+    
+    def generate():
+        for error in errors:
+            yield json.dumps(error) + '\n'
+        for future in as_completed(futures):
+            fields, scale, roi = futures[future]
+            try:
+                result = future.result()
+                result.source_scale = scale
+                result.source_roi = roi
+                line = {**fields, **detection_payload(result, options)}
+            except Exception as e:
+                line = {**fields, 'error': str(e)}
+            yield json.dumps(line) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+if Sock is not None:
+    app.config['SOCK_SERVER_OPTIONS'] = {'max_message_size': Config.SESSION_MAX_FRAME_BYTES,
+                                         'ping_interval': Config.SESSION_PING_INTERVAL}
+    sock = Sock(app)
+    
+    @sock.route('/api/session')
+    def frame_session(ws):
+        """Persistent binary frame-push session (protocol in app/sessions.py).
+        
+        Takes the detection options and depth_side/skip as query args.
+        """
+        try:
+            inference = _inference_options(request.args)
+            session = FrameSession.from_values(ws, request.args, scheduler, admission, inference,
+                                               camera.class_names)
+        except ValueError as e:
+            ws.send(json.dumps({'error': str(e)}))
+            return
+        session.run()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False) 
\ No newline at end of file
@@ -0,0 +1,115 @@
+import collections
+import math
+import threading
+import time
+
+import numpy as np
+
+from config import Config
+
+# Quality levels, cheapest last. Each level keeps the reductions of the ones before it:
+#   full               normal inference
+#   reduced_detection  YOLO at DEGRADED_YOLO_INPUT_SIZE, no tiled pass
+#   reduced_depth      depth kept at MiDaS output resolution
+#   no_depth           MiDaS skipped
+#   no_image           no rendered overlay in the response
+QUALITY_LEVELS = ('full', 'reduced_detection', 'reduced_depth', 'no_depth', 'no_image')
+FULL, REDUCED_DETECTION, REDUCED_DEPTH, NO_DEPTH, NO_IMAGE = range(len(QUALITY_LEVELS))
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionController.admit when a request is shed; retry_after is in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Server overloaded, retry in {retry_after} s')
+        self.retry_after = retry_after
+
+
+class LatencyWindow:
+    """Per-frame latencies (queue wait plus batch time) of the last window_seconds"""
+
+    def __init__(self, window_seconds=None):
+        self.window = window_seconds or Config.SLO_WINDOW_SECONDS
+        self._samples = collections.deque()
+        self._lock = threading.Lock()
+        # Exponentially weighted batch time per frame, seconds
+        self.frame_seconds = 0.0
+
+    def add(self, latencies, batch_seconds, batch_size):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.extend((now, latency) for latency in latencies)
+            per_frame = batch_seconds / batch_size
+            self.frame_seconds = per_frame if not self.frame_seconds else 0.8 * self.frame_seconds + 0.2 * per_frame
+
+    def percentile(self, q, since=0.0):
+        """Latency percentile over the window (and after `since`), or 0 if nothing finished in it"""
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            latencies = [latency for finished, latency in self._samples if finished >= since]
+        return float(np.percentile(latencies, q)) if latencies else 0.0
+
+
+class AdmissionController:
+    """Steps quality down, then sheds requests, to hold a latency target.
+
+    Pressure is the larger of the recent p95 frame latency and the expected
+    latency of a new frame (queued frames times the recent batch time per
+    frame), relative to target_ms. Above 1 the quality level goes one step
+    down QUALITY_LEVELS, below recover_ratio one step back up, at most once
+    per adjust_interval. Only latencies since the last step count, so each
+    step is judged by its own effect. At the lowest level, requests whose
+    expected latency exceeds shed_ratio times the target are rejected with
+    Overloaded. A target of 0 disables the controller.
+    """
+
+    def __init__(self, scheduler, target_ms=None, adjust_interval=None, recover_ratio=None, shed_ratio=None):
+        self.scheduler = scheduler
+        self.target = (Config.SLO_LATENCY_MS if target_ms is None else target_ms) / 1000.0
+        self.adjust_interval = Config.SLO_ADJUST_INTERVAL if adjust_interval is None else adjust_interval
+        self.recover_ratio = recover_ratio or Config.SLO_RECOVER_RATIO
+        self.shed_ratio = shed_ratio or Config.SLO_SHED_RATIO
+        self.level = FULL
+        self.rejected = 0
+        self._adjusted_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.target > 0
+
+    def expected_latency(self):
+        """Seconds until a frame queued now would be answered, from the queue and recent batch times"""
+        return (self.scheduler.pending() + 1) * self.scheduler.latencies.frame_seconds
+
+    def admit(self):
+        """Quality level for a new request, or raise Overloaded to shed it"""
+        if not self.enabled:
+            return FULL
+        expected = self.expected_latency()
+        now = time.monotonic()
+        with self._lock:
+            if now - self._adjusted_at >= self.adjust_interval:
+                recent = self.scheduler.latencies.percentile(95, since=self._adjusted_at)
+                pressure = max(expected, recent) / self.target
+                if pressure > 1 and self.level < NO_IMAGE:
+                    self.level += 1
+                    self._adjusted_at = now
+                elif pressure < self.recover_ratio and self.level > FULL:
+                    self.level -= 1
+                    self._adjusted_at = now
+            level = self.level
+            if level == NO_IMAGE and expected > self.shed_ratio * self.target:
+                self.rejected += 1
+                raise Overloaded(max(1, math.ceil(expected - self.target)))
+        return level
+
+    def stats(self):
+        return {
+            'target_ms': round(1000 * self.target),
+            'quality': QUALITY_LEVELS[self.level],
+            'rejected': self.rejected,
+            'expected_latency_ms': round(1000 * self.expected_latency(), 1),
+        }
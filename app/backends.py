@@ -0,0 +1,136 @@
+import os
+
+import cv2
+import numpy as np
+import torch
+
+from config import Config
+
+# CPU inference backends, selected per model in Config:
+#   torch              eager PyTorch YOLO / TorchScript MiDaS (default)
+#   onnx               exported ONNX graph run by ONNX Runtime
+#   onnx-int8          static INT8 (QDQ) quantization, calibrated on local images
+#   onnx-int8-dynamic  dynamic INT8 quantization, no calibration data needed
+# A backend only decides which artifact is loaded: YOLO exports go through
+# ultralytics (which runs ONNX with the same pre- and post-processing) and
+# MiDaS exports through OnnxDepthModel, so Camera itself is unchanged.
+# onnx/onnxruntime are optional and only imported when an ONNX backend is used.
+BACKENDS = ('torch', 'onnx', 'onnx-int8', 'onnx-int8-dynamic')
+
+_SUFFIXES = {
+    'onnx': '.onnx',
+    'onnx-int8': '.int8.onnx',
+    'onnx-int8-dynamic': '.int8-dynamic.onnx',
+}
+
+YOLO_INPUT_SIZE = 640
+
+
+def artifact_name(stem, backend, torch_name):
+    """File name of a model artifact for a backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return torch_name if backend == 'torch' else stem + _SUFFIXES[backend]
+
+
+class OnnxDepthModel:
+    """Runs an exported MiDaS graph with ONNX Runtime behind the torch module interface"""
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=Config.ONNX_PROVIDERS)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_batch):
+        output = self.session.run(None, {self.input_name: input_batch.cpu().numpy()})[0]
+        return torch.from_numpy(output)
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+
+def letterbox(image, size=YOLO_INPUT_SIZE):
+    """YOLO network input for a BGR image: letterboxed RGB, scaled to [0, 1], 1x3xSxS"""
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = round(width * scale), round(height * scale)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - new_height) // 2, (size - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = cv2.resize(image, (new_width, new_height),
+                                                                   interpolation=cv2.INTER_LINEAR)
+    rgb = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return np.ascontiguousarray(rgb)[None]
+
+
+def export_yolo_onnx(yolo_path):
+    """Export YOLO to ONNX with dynamic batch and image size; returns the ONNX path"""
+    from ultralytics import YOLO
+
+    return YOLO(yolo_path).export(format='onnx', dynamic=True, imgsz=YOLO_INPUT_SIZE)
+
+
+def export_midas_onnx(midas, path):
+    """Export MiDaS small to ONNX with dynamic batch and spatial axes"""
+    from app.registry import midas_small_transform
+
+    example = midas_small_transform(np.zeros((480, 640, 3), dtype=np.uint8))
+    torch.onnx.export(
+        midas, example, path,
+        input_names=['input'], output_names=['depth'],
+        dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'},
+                      'depth': {0: 'batch', 1: 'height', 2: 'width'}},
+        opset_version=17,
+    )
+    return path
+
+
+def quantize(source_path, target_path, calibration_inputs=None):
+    """INT8-quantize an ONNX model.
+
+    With calibration_inputs (a list of network input arrays) activation ranges
+    are calibrated statically and the result uses QDQ nodes; without them the
+    model is quantized dynamically.
+    """
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    if calibration_inputs is None:
+        quantize_dynamic(source_path, target_path, weight_type=QuantType.QInt8)
+        return target_path
+
+    import onnxruntime as ort
+    input_name = ort.InferenceSession(source_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._inputs = iter(calibration_inputs)
+
+        def get_next(self):
+            array = next(self._inputs, None)
+            return None if array is None else {input_name: array}
+
+    quantize_static(source_path, target_path, Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    return target_path
+
+
+def load_calibration_images(image_dir, limit=None):
+    """Read BGR images from a local directory for calibration and comparison"""
+    limit = limit or Config.CALIBRATION_IMAGES
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        image = cv2.imread(os.path.join(image_dir, name))
+        if image is not None:
+            images.append(image)
+        if len(images) >= limit:
+            break
+    if not images:
+        raise ValueError(f"No readable images in {image_dir}")
+    return images
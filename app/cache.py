@@ -0,0 +1,177 @@
+import collections
+import hashlib
+import os
+import queue
+import threading
+
+import numpy as np
+
+from config import Config
+
+
+class ResultCache:
+    """Content-addressed cache of inference results.
+
+    Keys are a BLAKE2b hash of the decoded pixels plus the model and threshold
+    settings, so re-submitted images skip both models. Entries hold the raw
+    detections and a float16 depth map in an in-memory LRU bounded by entry
+    count and bytes. If a directory is configured, entries are also written
+    through to a size-bounded on-disk tier that survives restarts. Disk
+    writes go through a bounded queue to a background writer thread, so
+    put() (called on the inference worker) only does the in-memory insert;
+    writes that find the queue full are dropped.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, disk_dir=None, disk_max_bytes=None):
+        self.max_entries = max_entries or Config.RESULT_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.RESULT_CACHE_MAX_BYTES
+        self.disk_dir = disk_dir if disk_dir is not None else Config.RESULT_CACHE_DIR
+        self.disk_max_bytes = disk_max_bytes or Config.RESULT_CACHE_DISK_MAX_BYTES
+        self.disk_queue_size = Config.RESULT_CACHE_DISK_QUEUE
+
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_dropped = 0
+
+        self._writes = None
+        self._writer_pid = None
+        self._disk_index = collections.OrderedDict()
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            files = sorted(os.scandir(self.disk_dir), key=lambda entry: entry.stat().st_mtime)
+            for entry in files:
+                if entry.name.endswith('.npz'):
+                    self._disk_index[entry.name[:-4]] = entry.stat().st_size
+                    self._disk_bytes += entry.stat().st_size
+
+    @staticmethod
+    def key(frame, settings):
+        """Hash of the decoded frame contents and the inference settings"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(frame.shape).encode())
+        digest.update(settings.encode())
+        digest.update(np.ascontiguousarray(frame).data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return (detections, depth_map) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            on_disk = key in self._disk_index
+
+        if on_disk:
+            try:
+                with np.load(self._disk_path(key)) as data:
+                    entry = (data['detections'], data['depth'])
+            except (OSError, ValueError, KeyError):
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, entry)
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, detections, depth_map):
+        entry = (np.asarray(detections), depth_map.astype(np.float16))
+        with self._lock:
+            self._store(key, entry)
+        if self.disk_dir:
+            try:
+                self._ensure_writer().put_nowait((key, entry))
+            except queue.Full:
+                with self._lock:
+                    self.disk_dropped += 1
+
+    def _ensure_writer(self):
+        # Started on first use by the process that uses it, like the scheduler's
+        # worker: threads are not inherited across fork
+        with self._lock:
+            if self._writer_pid != os.getpid():
+                self._writes = queue.Queue(maxsize=self.disk_queue_size)
+                threading.Thread(target=self._run_writer, args=(self._writes,), name='result-cache-writer',
+                                 daemon=True).start()
+                self._writer_pid = os.getpid()
+            return self._writes
+
+    def _run_writer(self, writes):
+        while True:
+            key, entry = writes.get()
+            try:
+                self._write_disk(key, entry)
+            finally:
+                writes.task_done()
+
+    def flush(self):
+        """Wait until every queued disk write has finished"""
+        if self._writes is not None and self._writer_pid == os.getpid():
+            self._writes.join()
+
+    def _store(self, key, entry):
+        size = entry[0].nbytes + entry[1].nbytes
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            old = self._entries.pop(key)
+            self._bytes -= old[0].nbytes + old[1].nbytes
+        self._entries[key] = entry
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old[0].nbytes + old[1].nbytes
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.npz')
+
+    def _write_disk(self, key, entry):
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, detections=entry[0], depth=entry[1])
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Result cache: could not write {path}: {e}")
+            return
+        size = os.path.getsize(path)
+        with self._lock:
+            self._disk_bytes += size - self._disk_index.pop(key, 0)
+            self._disk_index[key] = size
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk_index) > 1:
+                old_key, old_size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= old_size
+                try:
+                    os.remove(self._disk_path(old_key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'disk_entries': len(self._disk_index),
+                'disk_bytes': self._disk_bytes,
+                'disk_pending': self._writes.qsize() if self._writes is not None else 0,
+                'disk_dropped': self.disk_dropped,
+            }
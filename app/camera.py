@@ -1,111 +1,313 @@
-from ultralytics import YOLO
 import torch
 import cv2
-import numpy as np
 from flask import jsonify
+import threading
 import time
-import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from app import metrics
+from app.admission import FULL, NO_DEPTH, REDUCED_DEPTH, REDUCED_DETECTION
+from app.backends import YOLO_INPUT_SIZE
+from app.models import InferenceOptions, InferenceResult
+from app.preprocess import DepthInputs, SharedFrame
+from app.registry import ModelRegistry
+from app.serving import available_cores
+from app.tiling import extract_tiles, merge_detections, needs_tiles, plan_tiles
+from app.stream import StreamEngine
+from config import Config
 
 class Camera:
-    def __init__(self):
+    def __init__(self, pipeline_mode=None, loading=None):
         self.stream_active = False
         self.frame_count = 0
-        self.skip_frames = 2
+        self.skip_frames = Config.FRAME_SKIP
+        self.stream = None
+        
+        # 'serial' or 'parallel' execution of detection and depth estimation
+        self.pipeline_mode = pipeline_mode or Config.PIPELINE_MODE
+        self._executors = None
+        # Reusable MiDaS input tensors, one set per inference thread
+        self._thread_state = threading.local()
         
         # Initialize device
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"Using device: {self.device}")
         
-        # Load models
-        self.load_models()
+        # Load models: 'eager' blocks here, 'background' starts a loader thread,
+        # 'lazy' waits for the first inference call
+        self.status = 'cold'
+        self.load_error = None
+        self.load_time = None
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        loading = loading or Config.MODEL_LOADING
+        if loading == 'eager':
+            self.load_models()
+        elif loading == 'background':
+            threading.Thread(target=self._load_in_background, name='model-loader', daemon=True).start()
         
     def load_models(self):
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            self.status = 'warming'
+            start = time.perf_counter()
+            try:
+                registry = ModelRegistry(device=self.device)
+                
+                # Load YOLOv8s
+                self.yolo_model = registry.load_yolo()
+                print("YOLOv8s model loaded successfully!")
+                
+                # Load MiDaS
+                print("Loading MiDaS Small...")
+                self.midas, self.transform = registry.load_midas()
+                print("MiDaS Small loaded successfully!")
+            except Exception as e:
+                print(f"Error loading models: {e}")
+                self.status = 'error'
+                self.load_error = str(e)
+                raise
+            self.load_time = time.perf_counter() - start
+            self.status = 'ready'
+            self._loaded.set()
+
+    def _load_in_background(self):
         try:
-            # Get the absolute path to the model file
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            model_path = os.path.join(base_dir, "yolov8s.pt")
-            
-            # Load YOLOv8s
-            self.yolo_model = YOLO(model_path).to(self.device)
-            print("YOLOv8s model loaded successfully!")
-            
-            # Load MiDaS
-            print("Loading MiDaS Small...")
-            self.midas = torch.hub.load("intel-isl/MiDaS", "MiDaS_small")
-            self.midas.eval()
-            self.midas = self.midas.to(self.device)
-            self.midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms")
-            self.transform = self.midas_transforms.small_transform
-            print("MiDaS Small loaded successfully!")
-        except Exception as e:
-            print(f"Error loading models: {e}")
-            raise
-
-    def detect_objects(self, frame):
-        results = self.yolo_model(frame, conf=0.45)
-        return results[0].boxes.data.cpu().numpy()
+            self.load_models()
+        except Exception:
+            pass
+
+    def ensure_loaded(self):
+        """Block until the models are loaded, loading them now if nobody has started"""
+        if self._loaded.is_set():
+            return
+        if self.status == 'error':
+            raise RuntimeError(f"Models failed to load: {self.load_error}")
+        self.load_models()
+
+    @property
+    def class_names(self):
+        self.ensure_loaded()
+        return self.yolo_model.names
+
+    def settings_signature(self):
+        """Model settings that affect inference output (with InferenceOptions.signature, result cache keys)"""
+        return (f"yolov8s:{Config.DETECTION_BACKEND}|MiDaS_small:{Config.DEPTH_BACKEND}"
+                f"|depth={Config.DEPTH_RESOLUTION}|tiling={Config.DETECTION_TILING}")
+
+    @staticmethod
+    def yolo_input_size(side, input_size=None, options=None):
+        """YOLO imgsz for a frame whose long side is `side`, or None for the model default.
+
+        Decided per frame, so a frame's detections never depend on the frames
+        it is batched with: input_size if given (degraded quality), else a
+        crop to a region of interest smaller than the YOLO input runs at its
+        own size (rounded up to a multiple of 32) instead of being upscaled.
+        """
+        if input_size:
+            return input_size
+        if options is not None and options.roi is not None and side < YOLO_INPUT_SIZE:
+            return -(-side // 32) * 32
+        return None
+
+    def detect_objects(self, frame, options=None):
+        return self.detect_objects_batch([frame], options=options)[0]
+
+    def detect_objects_batch(self, frames, shared=None, input_size=None, options=None):
+        """Run YOLO over a list of frames in a single call.
+
+        YOLO reads the downscaled SharedFrame buffers; boxes are mapped back to
+        frame coordinates. The InferenceOptions thresholds, class filter and
+        detection limit go into the YOLO call, so filtered classes are dropped
+        inside NMS. The input size is chosen per frame (see yolo_input_size)
+        and frames are run in one call per input size. Large frames may then
+        get a tiled pass (see Config.DETECTION_TILING). A smaller input_size
+        than the default (degraded quality) also skips tiling.
+        """
+        self.ensure_loaded()
+        options = options or InferenceOptions()
+        shared = shared or [SharedFrame(frame) for frame in frames]
+        kwargs = options.yolo_kwargs()
+        sizes = [self.yolo_input_size(max(item.buffer.shape[:2]), input_size, options) for item in shared]
+        detections = [None] * len(shared)
+        with metrics.stage('yolo'):
+            for size in dict.fromkeys(sizes):
+                group = [i for i, item_size in enumerate(sizes) if item_size == size]
+                results = self.yolo_model([shared[i].buffer for i in group],
+                                          **(kwargs if size is None else {**kwargs, 'imgsz': size}))
+                for i, result in zip(group, results):
+                    detections[i] = shared[i].to_frame_coords(result.boxes.data.cpu().numpy())
+        if input_size:
+            return detections
+        for i, (frame, item) in enumerate(zip(frames, shared)):
+            if needs_tiles(frame, detections[i], item.scale[0]):
+                detections[i] = self.detect_tiles(frame, detections[i], options)
+        return detections
+
+    def detect_tiles(self, frame, detections, options=None):
+        """Run YOLO over overlapping tiles of a large frame in one call and merge with `detections`.
+
+        Tiles are at most TILE_MAX_TILES inputs of the YOLO input size, so the
+        extra memory does not grow with the frame. Detections from all tiles
+        and the global pass are merged by class-wise NMS, keeping at most
+        the options' max_det.
+        """
+        options = options or InferenceOptions()
+        height, width = frame.shape[:2]
+        side, origins = plan_tiles(height, width)
+        with metrics.stage('tiling'):
+            tiles = extract_tiles(frame, side, origins)
+        with metrics.stage('yolo_tiles'):
+            results = self.yolo_model(tiles, **options.yolo_kwargs())
+            detection_sets = [detections]
+            for (x, y), tile, result in zip(origins, tiles, results):
+                tile_detections = result.boxes.data.cpu().numpy().copy()
+                scale_x = min(side, width - x) / tile.shape[1]
+                scale_y = min(side, height - y) / tile.shape[0]
+                tile_detections[:, [0, 2]] = tile_detections[:, [0, 2]] * scale_x + x
+                tile_detections[:, [1, 3]] = tile_detections[:, [1, 3]] * scale_y + y
+                detection_sets.append(tile_detections)
+        with metrics.stage('tiling'):
+            return merge_detections(detection_sets)[:options.max_det]
 
     def estimate_depth(self, frame):
-        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        input_batch = self.transform(img).to(self.device)
+        return self.estimate_depth_batch([frame])[0]
+
+    @property
+    def depth_inputs(self):
+        inputs = getattr(self._thread_state, 'depth_inputs', None)
+        if inputs is None:
+            inputs = self._thread_state.depth_inputs = DepthInputs()
+        return inputs
+
+    def estimate_depth_batch(self, frames, full_resolution=None, shared=None):
+        """Run MiDaS over a list of frames, batching frames with the same input size.
+
+        With full_resolution False the normalized depth maps stay at network
+        resolution; InferenceResult maps boxes into depth coordinates and only
+        upsamples when a visualization is rendered.
+        """
+        self.ensure_loaded()
+        if full_resolution is None:
+            full_resolution = Config.DEPTH_RESOLUTION == 'full'
+        shared = shared or [SharedFrame(frame) for frame in frames]
         
+        # The MiDaS input keeps the aspect ratio, so only frames whose inputs
+        # share a shape can be stacked into one forward pass
+        depth_maps = [None] * len(frames)
+        with metrics.stage('preprocess'):
+            batches = self.depth_inputs.prepare([item.buffer for item in shared])
         with torch.no_grad():
-            prediction = self.midas(input_batch)
-            prediction = torch.nn.functional.interpolate(
-                prediction.unsqueeze(1),
-                size=img.shape[:2],
-                mode="bicubic",
-                align_corners=False,
-            ).squeeze()
-        
-        depth_map = prediction.cpu().numpy()
-        depth_map = cv2.normalize(depth_map, None, 0, 1, cv2.NORM_MINMAX)
-        return depth_map
+            for input_batch, indices in batches:
+                with metrics.stage('midas'):
+                    predictions = self.midas(input_batch.to(self.device))
+                with metrics.stage('depth_postprocess'):
+                    for i, prediction in zip(indices, predictions):
+                        if full_resolution and max(frames[i].shape[:2]) <= Config.DEPTH_FULL_MAX_SIDE:
+                            prediction = torch.nn.functional.interpolate(
+                                prediction[None, None],
+                                size=frames[i].shape[:2],
+                                mode="bicubic",
+                                align_corners=False,
+                            ).squeeze()
+                        depth_map = prediction.cpu().numpy()
+                        depth_maps[i] = cv2.normalize(depth_map, None, 0, 1, cv2.NORM_MINMAX)
+        return depth_maps
+
+    def _pipeline_executors(self):
+        """One single-worker pool per model, each with its own torch thread budget"""
+        if self._executors is None:
+            # Split this process's cores (a pinned worker's budget, not the whole machine)
+            cores = available_cores()
+            detection_threads = Config.DETECTION_THREADS or max(1, cores // 2)
+            depth_threads = Config.DEPTH_THREADS or max(1, cores - detection_threads)
+            # torch.set_num_threads only affects the calling thread's OpenMP pool,
+            # so each worker sets its own budget once when it starts
+            self._executors = (
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix='yolo',
+                                   initializer=torch.set_num_threads,
+                                   initargs=(detection_threads,)),
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix='midas',
+                                   initializer=torch.set_num_threads,
+                                   initargs=(depth_threads,)),
+            )
+        return self._executors
+
+    def infer(self, frame, options=None):
+        """Run detection and depth estimation once and return an InferenceResult"""
+        return self.infer_batch([frame], options=options)[0]
+
+    def infer_batch(self, frames, quality=FULL, options=None):
+        """Run one batched YOLO call and batched MiDaS pass over a list of frames.
+
+        quality is a level from app.admission.QUALITY_LEVELS: from
+        REDUCED_DETECTION on YOLO runs at a smaller input size, from
+        REDUCED_DEPTH depth stays at network resolution and from NO_DEPTH
+        MiDaS is skipped (depth_map is None), as it is for options with
+        depth off. options (InferenceOptions) apply to every frame of the
+        batch. Each result carries the batch's stage timings and its quality
+        level.
+        """
+        options = options or InferenceOptions()
+        input_size = Config.DEGRADED_YOLO_INPUT_SIZE if quality >= REDUCED_DETECTION else None
+        full_resolution = False if quality >= REDUCED_DEPTH else None
+        with metrics.collect() as trace:
+            # Both models read from the same downscaled buffers
+            with metrics.stage('preprocess'):
+                shared = [SharedFrame(frame, input_size) for frame in frames]
+            if quality >= NO_DEPTH or not options.depth:
+                detections = self.detect_objects_batch(frames, shared, input_size, options)
+                depth_maps = [None] * len(frames)
+            elif self.pipeline_mode == 'parallel':
+                # Each pool thread records into this batch's trace through a copy of the context
+                detection_pool, depth_pool = self._pipeline_executors()
+                detections_future = detection_pool.submit(contextvars.copy_context().run,
+                                                          self.detect_objects_batch, frames, shared, input_size,
+                                                          options)
+                depth_future = depth_pool.submit(contextvars.copy_context().run,
+                                                 self.estimate_depth_batch, frames, full_resolution, shared)
+                detections = detections_future.result()
+                depth_maps = depth_future.result()
+            else:
+                detections = self.detect_objects_batch(frames, shared, input_size, options)
+                depth_maps = self.estimate_depth_batch(frames, full_resolution, shared)
+        results = [InferenceResult(frame, frame_detections, self.class_names, depth_map)
+                   for frame, frame_detections, depth_map in zip(frames, detections, depth_maps)]
+        for result in results:
+            result.timings = dict(trace.timings)
+            result.quality = quality
+        return results
 
     def process_frame(self, frame):
-        # Make a copy of the frame to avoid modifying the original
-        processed_frame = frame.copy()
-        
-        # Detect objects
-        detections = self.detect_objects(frame)
-        
-        # Draw detections
-        for detection in detections:
-            x1, y1, x2, y2, conf, cls = detection
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            class_name = self.yolo_model.names[int(cls)]
-            
-            cv2.rectangle(processed_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            label = f'{class_name}: {conf:.2f}'
-            label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-            cv2.rectangle(processed_frame, (x1, y1-label_size[1]-10), (x1+label_size[0], y1), (0, 255, 0), -1)
-            cv2.putText(processed_frame, label, (x1, y1-5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-        
-        # Estimate depth
-        depth_map = self.estimate_depth(frame)
-        depth_colored = cv2.applyColorMap((depth_map * 255).astype(np.uint8), 
-                                        cv2.COLORMAP_MAGMA)
-        
-        cv2.putText(depth_colored, 'Depth Map', (10, 30), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        
-        combined = np.hstack([processed_frame, depth_colored])
-        return combined
+        return self.infer(frame).rendered
 
-    # Legacy methods kept for compatibility with the web interface
-    def initialize_camera(self):
-        pass
+    # Streaming for the web interface
+    def initialize_camera(self, source=None):
+        """Create the streaming engine for a webcam index, video file or stream URL"""
+        if self.stream is None or source is not None:
+            self.release_camera()
+            self.stream = StreamEngine(self, source=source, frame_skip=self.skip_frames)
+        return self.stream
 
     def release_camera(self):
-        pass
+        if self.stream is not None:
+            self.stream.stop()
+        self.stream_active = False
 
     def generate_frames(self):
-        yield b''
+        if self.stream is None:
+            return
+        yield from self.stream.frames()
 
-    def start_stream(self):
-        return jsonify({'status': 'error', 'message': 'Streaming not available in API mode'})
+    def start_stream(self, source=None):
+        try:
+            self.initialize_camera(source).start()
+        except IOError as e:
+            return jsonify({'status': 'error', 'message': str(e)})
+        self.stream_active = True
+        return jsonify({'status': 'success', 'message': 'Stream started'})
 
     def stop_stream(self):
-        return jsonify({'status': 'error', 'message': 'Streaming not available in API mode'})
\ No newline at end of file
+        self.release_camera()
+        return jsonify({'status': 'success', 'message': 'Stream stopped'})
@@ -0,0 +1,101 @@
+import cv2
+import numpy as np
+
+from config import Config
+
+
+class KeyframeDepth:
+    """Temporal depth reuse for video input.
+
+    MiDaS runs on a keyframe every `interval` frames, or earlier when a cheap
+    scene-change metric against the last keyframe crosses `threshold`. Frames
+    in between reuse the cached depth map ('reuse'), or shift it by the global
+    motion estimated with phase correlation on small grayscale thumbnails
+    ('shift').
+    """
+
+    THUMBNAIL_SIZE = (64, 48)
+
+    def __init__(self, camera, interval=None, threshold=None, metric=None, update=None):
+        self.camera = camera
+        self.interval = max(1, interval or Config.DEPTH_KEYFRAME_INTERVAL)
+        self.threshold = threshold if threshold is not None else Config.DEPTH_SCENE_CHANGE_THRESHOLD
+        self.metric = metric or Config.DEPTH_SCENE_METRIC
+        self.update = update or Config.DEPTH_UPDATE
+        self.reset()
+
+    def reset(self):
+        self.depth_map = None
+        self._frame_shape = None
+        self._key_thumb = None
+        self._key_hist = None
+        self._prev_thumb = None
+        self._thumb = None
+        self._since_keyframe = 0
+        self._offset = np.zeros(2)
+        self.keyframes = 0
+        self.frames = 0
+
+    def _thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def scene_change(self, thumb):
+        """Distance in [0, 1] between a frame thumbnail and the last keyframe"""
+        if self.metric == 'hist':
+            hist = cv2.calcHist([thumb], [0], None, [32], [0, 256])
+            cv2.normalize(hist, hist)
+            return cv2.compareHist(self._key_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+        return float(np.mean(np.abs(thumb - self._key_thumb))) / 255.0
+
+    def _is_keyframe(self, thumb):
+        if self.depth_map is None or self._since_keyframe >= self.interval:
+            return True
+        return self.threshold > 0 and self.scene_change(thumb) > self.threshold
+
+    def needs_keyframe(self, frame):
+        """Count frame as the next frame and tell whether MiDaS has to run on it.
+
+        For callers that run MiDaS themselves: pass its depth map to
+        set_keyframe, or use depth_map when this returns False.
+        """
+        self.frames += 1
+        self._thumb = self._thumbnail(frame)
+        if self._is_keyframe(self._thumb) or self._frame_shape != frame.shape[:2]:
+            return True
+        self._since_keyframe += 1
+        return False
+
+    def set_keyframe(self, frame, depth_map):
+        """Make depth_map, estimated on frame (just passed to needs_keyframe), the cached keyframe depth"""
+        thumb = self._thumb
+        self.depth_map = depth_map
+        self._frame_shape = frame.shape[:2]
+        self._key_thumb = thumb
+        if self.metric == 'hist':
+            self._key_hist = cv2.calcHist([thumb], [0], None, [32], [0, 256])
+            cv2.normalize(self._key_hist, self._key_hist)
+        self._prev_thumb = thumb
+        self._since_keyframe = 1
+        self._offset[:] = 0
+        self.keyframes += 1
+
+    def estimate(self, frame):
+        """Return a depth map for frame, running MiDaS only on keyframes"""
+        if self.needs_keyframe(frame):
+            self.set_keyframe(frame, self.camera.estimate_depth(frame))
+            return self.depth_map
+
+        if self.update != 'shift':
+            return self.depth_map
+        thumb = self._thumb
+
+        # Accumulate frame-to-frame global motion and translate the keyframe
+        # depth by it (scaled from thumbnail to depth-map coordinates, which
+        # may be network rather than frame resolution)
+        (dx, dy), _ = cv2.phaseCorrelate(self._prev_thumb, thumb)
+        self._prev_thumb = thumb
+        height, width = self.depth_map.shape[:2]
+        self._offset += (dx * width / self.THUMBNAIL_SIZE[0], dy * height / self.THUMBNAIL_SIZE[1])
+        matrix = np.float32([[1, 0, self._offset[0]], [0, 1, self._offset[1]]])
+        return cv2.warpAffine(self.depth_map, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
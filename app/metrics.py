@@ -0,0 +1,182 @@
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+from config import Config
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with an optional single label.
+
+    observe() is a bisect and three additions under a lock, cheap enough to
+    call on every stage of every request.
+    """
+
+    def __init__(self, name, help, label=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _labels(self, label_value, extra=''):
+        pairs = []
+        if self.label is not None:
+            pairs.append(f'{self.label}="{label_value}"')
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_value, (counts, total, count) in sorted(series.items(), key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{float(bound)!r}"'
+                lines.append(f'{self.name}_bucket{self._labels(label_value, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(label_value)} {total}')
+            lines.append(f'{self.name}_count{self._labels(label_value)} {count}')
+        return lines
+
+
+class Gauge:
+    """A value read from a callback whenever the metrics are scraped"""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {self.read()}']
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name, help, label=None, buckets=LATENCY_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help, label, buckets))
+
+    def gauge(self, name, help, read):
+        self._metrics[name] = Gauge(name, help, read)
+        return self._metrics[name]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _resident_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _peak_resident_bytes():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else 0
+
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.histogram(
+    'inference_stage_seconds', 'Time spent per pipeline stage (model stages once per batch)', label='stage')
+QUEUE_WAIT_SECONDS = registry.histogram(
+    'inference_queue_wait_seconds', 'Time a frame waited in the scheduler queue before its batch ran')
+BATCH_SIZE = registry.histogram(
+    'inference_batch_size', 'Frames per batched model call', buckets=(1, 2, 4, 8, 16, 32, 64))
+REQUEST_SECONDS = registry.histogram(
+    'http_request_seconds', 'Request duration per endpoint, until the body is sent for streamed responses',
+    label='endpoint')
+registry.gauge('process_resident_memory_bytes', 'Current resident set size', _resident_bytes)
+registry.gauge('process_peak_resident_memory_bytes', 'Peak resident set size since start', _peak_resident_bytes)
+
+
+class Trace:
+    """Stage timings (seconds) collected for one request or one batch"""
+
+    def __init__(self):
+        self.timings = {}
+        self.start = time.perf_counter()
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def merge(self, timings):
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds"""
+        return ', '.join(f'{name};dur={1000 * seconds:.2f}' for name, seconds in self.timings.items())
+
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+
+def start_trace():
+    """Start collecting stage timings for the current thread's request or batch"""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def collect():
+    """Collect the stage timings of the enclosed block into a fresh Trace, restoring the outer one after"""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a block: observed in the stage histogram and added to the current trace"""
+    if not Config.METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
@@ -0,0 +1,255 @@
+import numpy as np
+
+from app import overlay
+from config import Config
+
+
+def _values_list(value):
+    """A JSON list, or a comma-separated string, as a list of stripped strings"""
+    items = value if isinstance(value, (list, tuple)) else str(value).split(',')
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+class InferenceOptions:
+    """Per-request detection settings, pushed into the model calls.
+
+    classes  class ids YOLO keeps (None keeps all); applied inside YOLO's NMS
+    conf     confidence threshold (default Config.YOLO_CONFIDENCE)
+    iou      NMS IoU threshold (default Config.YOLO_IOU)
+    max_det  most detections kept per image (default Config.YOLO_MAX_DETECTIONS)
+    roi      (x1, y1, x2, y2) region of interest in original-image pixels; only
+             this crop of the frame goes through YOLO and MiDaS
+    depth    False skips MiDaS (for callers that reuse an earlier depth map)
+    """
+
+    def __init__(self, classes=None, conf=None, iou=None, max_det=None, roi=None, depth=True):
+        self.classes = tuple(sorted(set(classes))) if classes is not None else None
+        self.conf = Config.YOLO_CONFIDENCE if conf is None else conf
+        self.iou = Config.YOLO_IOU if iou is None else iou
+        self.max_det = max_det or Config.YOLO_MAX_DETECTIONS
+        self.roi = roi
+        self.depth = depth
+
+    @classmethod
+    def from_values(cls, values, class_names=None):
+        """Parse options from request args/form or a JSON body, raising ValueError if invalid.
+
+        classes may be class names or ids; names are looked up in class_names
+        (id -> name, as Camera.class_names).
+        """
+        classes = None
+        if values.get('classes'):
+            ids = {name: class_id for class_id, name in (class_names or {}).items()}
+            classes = []
+            for item in _values_list(values['classes']):
+                if item.isdigit() and (class_names is None or int(item) in class_names):
+                    classes.append(int(item))
+                elif item in ids:
+                    classes.append(ids[item])
+                else:
+                    raise ValueError(f'Unknown class {item!r}')
+        try:
+            conf = float(values['conf']) if 'conf' in values else None
+            iou = float(values['iou']) if 'iou' in values else None
+            max_det = int(values['max_det']) if 'max_det' in values else None
+            roi = tuple(float(value) for value in _values_list(values['roi'])) if values.get('roi') else None
+        except (TypeError, ValueError):
+            raise ValueError('conf, iou and roi must be numbers and max_det an integer')
+        if conf is not None and not 0 <= conf <= 1:
+            raise ValueError('conf must be between 0 and 1')
+        if iou is not None and not 0 < iou <= 1:
+            raise ValueError('iou must be between 0 and 1')
+        if max_det is not None and max_det < 1:
+            raise ValueError('max_det must be at least 1')
+        if roi is not None and (len(roi) != 4 or min(roi[:2]) < 0 or roi[2] <= roi[0] or roi[3] <= roi[1]):
+            raise ValueError('roi must be x1,y1,x2,y2 with 0 <= x1 < x2 and 0 <= y1 < y2')
+        return cls(classes, conf, iou, max_det, roi)
+
+    def signature(self):
+        """Settings that change model output for the same frame (batch grouping and cache keys).
+
+        The roi coordinates are not part of it, since the frame is cropped
+        before queueing. Whether a roi is set is, because a crop smaller than
+        the YOLO input runs at its own size (Camera.yolo_input_size) while the
+        same pixels uploaded as a whole image are letterboxed.
+        """
+        classes = ','.join(map(str, self.classes)) if self.classes is not None else 'all'
+        signature = f"classes={classes}|conf={self.conf:g}|iou={self.iou:g}|max_det={self.max_det}"
+        if self.roi is not None:
+            signature += '|roi=1'
+        return signature if self.depth else signature + '|depth=0'
+
+    def without_depth(self):
+        """The same options with MiDaS skipped"""
+        return InferenceOptions(self.classes, self.conf, self.iou, self.max_det, self.roi, depth=False)
+
+    def yolo_kwargs(self):
+        """Keyword arguments for the ultralytics YOLO call"""
+        return {'conf': self.conf, 'iou': self.iou, 'max_det': self.max_det,
+                'classes': list(self.classes) if self.classes is not None else None}
+
+    def crop(self, frame, scale=1.0):
+        """(frame cropped to the roi, roi in original-image pixels) for a frame decoded at 1/scale.
+
+        Without a roi the frame is returned as is, with a roi of None. Raises
+        ValueError if the roi does not overlap the frame.
+        """
+        if self.roi is None:
+            return frame, None
+        height, width = frame.shape[:2]
+        x1, y1 = (max(0, int(np.floor(value / scale))) for value in self.roi[:2])
+        x2 = min(width, int(np.ceil(self.roi[2] / scale)))
+        y2 = min(height, int(np.ceil(self.roi[3] / scale)))
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError('roi does not overlap the image')
+        # Contiguous, so the crop hashes and resizes like any decoded frame
+        return np.ascontiguousarray(frame[y1:y2, x1:x2]), (x1 * scale, y1 * scale, x2 * scale, y2 * scale)
+
+
+class InferenceResult:
+    """Output of a single inference pass over one frame.
+
+    Holds the raw YOLO detections (x1, y1, x2, y2, conf, cls), the class name
+    table and the normalized depth map, so the overlay drawing and the JSON
+    serialization share one forward pass of each model.
+    """
+
+    def __init__(self, frame, detections, class_names, depth_map):
+        self.frame = frame
+        self.detections = detections
+        self.class_names = class_names
+        self.depth_map = depth_map
+        # Factor from frame to original-image coordinates when the upload was decoded at reduced size
+        self.source_scale = 1.0
+        # (x1, y1, x2, y2) in original-image pixels when the frame is a crop to a region of interest
+        self.source_roi = None
+        # Stage durations of the batch that produced this result, in seconds
+        self.timings = {}
+        # Track id per detection when the frame went through a tracker (video input)
+        self.track_ids = None
+        # Quality level the frame was processed at (app.admission.QUALITY_LEVELS); depth_map
+        # is None when MiDaS was skipped
+        self.quality = 0
+        self._rendered = None
+
+    @property
+    def rendered(self):
+        """Detection overlay and colorized depth side by side (built on first access)"""
+        if self._rendered is None:
+            self._rendered = self.render()
+        return self._rendered
+
+    def depth_boxes(self):
+        """Detection boxes mapped into depth-map pixel coordinates, as an (N, 4) int array.
+
+        The depth map may be at network resolution rather than the frame's, so
+        boxes are scaled and clipped before indexing into it.
+        """
+        frame_height, frame_width = self.frame.shape[:2]
+        depth_height, depth_width = self.depth_map.shape[:2]
+        boxes = np.asarray(self.detections, dtype=np.float32).reshape(-1, 6)[:, :4]
+        scale = np.array([depth_width / frame_width, depth_height / frame_height] * 2, dtype=np.float32)
+        boxes = np.floor(boxes * scale).astype(np.int32)
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, depth_width - 1)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, depth_height - 1)
+        return boxes
+
+    def depth_stats(self, shrink=None, percentile=None):
+        """Exact depth statistics over every pixel of each detection box, in one vectorized pass.
+
+        Each box is mapped into depth coordinates and optionally shrunk by
+        `shrink` of its size on every side to stay clear of the background.
+        The pixels of all boxes are gathered into one flat array, one segment
+        per box, and sorted once by (segment, value). The median and the
+        percentile are then read at per-segment offsets, and min, max and mean
+        come from ufunc reduceat over the segments. Values are MiDaS relative
+        inverse depth normalized to [0, 1], so larger means closer.
+        """
+        shrink = Config.DEPTH_BOX_SHRINK if shrink is None else shrink
+        percentile = Config.DEPTH_PERCENTILE if percentile is None else percentile
+
+        boxes = self.depth_boxes().astype(np.float32)
+        if not len(boxes):
+            empty = np.zeros(0, dtype=np.float32)
+            return {'median': empty, 'min': empty, 'max': empty, 'mean': empty, 'percentile': empty}
+
+        # Inner box in whole pixels, never smaller than a single pixel
+        size = boxes[:, 2:] - boxes[:, :2]
+        x1, y1 = (boxes[:, :2] + size * shrink).astype(np.int32).T
+        x2, y2 = (boxes[:, 2:] - size * shrink).astype(np.int32).T
+        sizes = np.stack([np.maximum(y2, y1) - y1 + 1, np.maximum(x2, x1) - x1 + 1], axis=1)
+
+        heights, widths = sizes.astype(np.int64).T
+        areas = heights * widths
+        starts = np.cumsum(areas) - areas
+
+        # Flat depth-map index of every box pixel: each box row is a run of
+        # `width` consecutive pixels starting at (row, x1)
+        row_box = np.repeat(np.arange(len(boxes)), heights)
+        rows = y1[row_box] + np.arange(heights.sum()) - (np.cumsum(heights) - heights)[row_box]
+        run_lengths = widths[row_box]
+        run_starts = rows * self.depth_map.shape[1] + x1[row_box] - (np.cumsum(run_lengths) - run_lengths)
+        index = np.repeat(run_starts, run_lengths) + np.arange(areas.sum())
+        pixels = np.asarray(self.depth_map, dtype=np.float32).ravel()[index]
+
+        # One sort orders every segment: the key is the box number plus the value
+        # scaled into [0, 0.5], so segments keep their place and the values are
+        # recovered (to float64 rounding) by subtracting the box number again
+        low, span = float(pixels.min()), max(float(pixels.max() - pixels.min()), 1e-12)
+        segments = np.repeat(np.arange(len(boxes), dtype=np.float64), areas)
+        keys = segments + (pixels.astype(np.float64) - low) * (0.5 / span)
+        keys.sort()
+        ordered = (keys - segments) * (2 * span) + low
+
+        def order_statistic(q):
+            # Linear interpolation between the closest ranks, as np.percentile does
+            position = (areas - 1) * (q / 100.0)
+            below = np.floor(position).astype(np.int64)
+            above = np.minimum(below + 1, areas - 1)
+            fraction = position - below
+            return ordered[starts + below] * (1 - fraction) + ordered[starts + above] * fraction
+
+        return {
+            'median': order_statistic(50).astype(np.float32),
+            'min': np.minimum.reduceat(pixels, starts),
+            'max': np.maximum.reduceat(pixels, starts),
+            'mean': (np.add.reduceat(pixels, starts, dtype=np.float64) / areas).astype(np.float32),
+            'percentile': order_statistic(percentile).astype(np.float32),
+        }
+
+    def render(self, panel_size=None, out=None):
+        """Draw detections next to the colorized depth map.
+
+        panel_size is the (width, height) of each of the two panels and defaults
+        to the frame size. Both panels are written into one buffer, `out` if it
+        has the right shape (see app.overlay.OverlayRenderer).
+        """
+        return overlay.renderer.render(self.frame, self.detections, self.class_names, self.depth_map,
+                                       self.track_ids, panel_size, out)
+
+    def detection_dicts(self):
+        """Detections in the JSON shape returned by the API (without depth if MiDaS was skipped)"""
+        stats = self.depth_stats() if self.depth_map is not None else None
+        percentile_key = f'p{Config.DEPTH_PERCENTILE:g}'
+        offset_x, offset_y = self.source_roi[:2] if self.source_roi is not None else (0, 0)
+        detection_results = []
+        for i, detection in enumerate(self.detections):
+            x1, y1, x2, y2, conf, cls = detection
+            x1, x2 = (value * self.source_scale + offset_x for value in (x1, x2))
+            y1, y2 = (value * self.source_scale + offset_y for value in (y1, y2))
+            detection_results.append({
+                'class': self.class_names[int(cls)],
+                'confidence': float(conf),
+                'bbox': [int(x1), int(y1), int(x2), int(y2)],
+            })
+            if stats is not None:
+                detection_results[-1]['depth'] = {
+                    'median': round(float(stats['median'][i]), 4),
+                    'min': round(float(stats['min'][i]), 4),
+                    'max': round(float(stats['max'][i]), 4),
+                    'mean': round(float(stats['mean'][i]), 4),
+                    percentile_key: round(float(stats['percentile'][i]), 4),
+                }
+            if self.track_ids is not None:
+                detection_results[-1]['track_id'] = int(self.track_ids[i])
+        return detection_results
@@ -0,0 +1,143 @@
+import collections
+import threading
+
+import cv2
+import numpy as np
+
+from config import Config
+
+BOX_COLOR = (0, 255, 0)
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def preview_size(frame_shape, max_width):
+    """Panel (width, height) so both panels side by side fit max_width, or None if they already do"""
+    height, width = frame_shape[:2]
+    if not max_width or 2 * width <= max_width:
+        return None
+    panel_width = max_width // 2
+    return panel_width, max(1, round(height * panel_width / width))
+
+
+def _colormap_lut(colormap):
+    """The colormap as a (256, 1, 3) user colormap table for cv2.applyColorMap"""
+    return cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), colormap)
+
+
+class OverlayRenderer:
+    """Draws detections next to the colorized depth map into one output buffer.
+
+    Both panels are written straight into a single (height, 2 * width, 3)
+    array, which callers may pass in to reuse. Box outlines for all
+    detections are drawn in one polylines call. Labels are blitted from
+    pre-rasterized sprites (filled background plus text) for their pieces:
+    one per class name, one per confidence suffix at the displayed two
+    decimals and one per track-id character. The set of pieces stays small
+    however many distinct labels a scene produces, so a crowded or tracked
+    stream costs a few slice copies per label rather than text layout and
+    rasterization. The depth map is colorized through a precomputed
+    colormap table.
+    """
+
+    def __init__(self, colormap=cv2.COLORMAP_MAGMA, sprite_cache_size=None, box_thickness=2):
+        self.lut = _colormap_lut(colormap)
+        self.sprite_cache_size = sprite_cache_size or Config.OVERLAY_SPRITE_CACHE_SIZE
+        self.box_thickness = box_thickness
+        self._sprites = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # One text height for every piece, so pieces of a label line up
+        (_, self._text_height), _ = cv2.getTextSize('0', LABEL_FONT, 0.5, 2)
+
+    @staticmethod
+    def label_pieces(class_name, conf, track_id=None):
+        """A detection label split into the pieces it is drawn from"""
+        pieces = (class_name, f': {conf:.2f}')
+        return (*f'#{track_id} ', *pieces) if track_id is not None else pieces
+
+    def sprite(self, text):
+        """Sprite for one label piece: black text on a filled background in the box color"""
+        with self._lock:
+            sprite = self._sprites.get(text)
+            if sprite is not None:
+                self._sprites.move_to_end(text)
+                return sprite
+        (text_width, _), _ = cv2.getTextSize(text, LABEL_FONT, 0.5, 2)
+        sprite = np.empty((self._text_height + 11, text_width + 1, 3), dtype=np.uint8)
+        sprite[:] = BOX_COLOR
+        cv2.putText(sprite, text, (0, self._text_height + 5), LABEL_FONT, 0.5, (0, 0, 0), 2)
+        with self._lock:
+            self._sprites[text] = sprite
+            while len(self._sprites) > self.sprite_cache_size:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def draw_boxes(self, panel, boxes):
+        """Outline all (N, 4) integer boxes with a single cv2.polylines call"""
+        if not len(boxes):
+            return
+        x1, y1, x2, y2 = boxes.T
+        corners = np.stack([np.stack(corner, axis=1) for corner in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))],
+                           axis=1)
+        cv2.polylines(panel, corners, True, BOX_COLOR, self.box_thickness)
+
+    def draw_labels(self, panel, boxes, labels):
+        """Blit each label's piece sprites side by side above the top-left corner of its box.
+
+        labels are sequences of pieces (see label_pieces); sprites are clipped to the panel.
+        """
+        height, width = panel.shape[:2]
+        for (x1, y1, _, _), pieces in zip(boxes.tolist(), labels):
+            left = x1
+            for piece in pieces:
+                sprite = self.sprite(piece)
+                top = y1 - sprite.shape[0] + 1
+                src_top, src_left = max(0, -top), max(0, -left)
+                bottom, right = min(height, top + sprite.shape[0]), min(width, left + sprite.shape[1])
+                if bottom > top + src_top and right > left + src_left:
+                    panel[top + src_top:bottom, left + src_left:right] = \
+                        sprite[src_top:bottom - top, src_left:right - left]
+                left += sprite.shape[1] - 1
+
+    def colorize_depth(self, depth_map, panel):
+        """Write the colorized depth map into the panel, resizing the 8-bit single-channel map first"""
+        height, width = panel.shape[:2]
+        indices = cv2.convertScaleAbs(depth_map, alpha=255)
+        if indices.shape[:2] != (height, width):
+            indices = cv2.resize(indices, (width, height), interpolation=cv2.INTER_LINEAR)
+        cv2.applyColorMap(indices, self.lut, dst=panel)
+
+    def render(self, frame, detections, class_names, depth_map, track_ids=None, panel_size=None, out=None):
+        """Detections next to the colorized depth map, each panel panel_size (default: frame size)"""
+        frame_height, frame_width = frame.shape[:2]
+        width, height = panel_size or (frame_width, frame_height)
+        if out is None or out.shape != (height, 2 * width, 3):
+            out = np.empty((height, 2 * width, 3), dtype=np.uint8)
+        image_panel, depth_panel = out[:, :width], out[:, width:]
+
+        if (width, height) == (frame_width, frame_height):
+            image_panel[:] = frame
+        else:
+            cv2.resize(frame, (width, height), dst=image_panel, interpolation=cv2.INTER_AREA)
+
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        if len(detections):
+            scale = np.array([width / frame_width, height / frame_height] * 2, dtype=np.float32)
+            boxes = (detections[:, :4] * scale).astype(np.int32)
+            if track_ids is None:
+                track_ids = [None] * len(detections)
+            labels = [self.label_pieces(class_names[int(cls)], conf, track_id)
+                      for (conf, cls), track_id in zip(detections[:, 4:6].tolist(), track_ids)]
+            self.draw_boxes(image_panel, boxes)
+            self.draw_labels(image_panel, boxes, labels)
+
+        if depth_map is None:
+            # MiDaS was skipped to save time (degraded quality)
+            depth_panel[:] = 0
+            cv2.putText(depth_panel, 'No Depth', (10, 30), LABEL_FONT, 1, (255, 255, 255), 2)
+        else:
+            self.colorize_depth(depth_map, depth_panel)
+            cv2.putText(depth_panel, 'Depth Map', (10, 30), LABEL_FONT, 1, (255, 255, 255), 2)
+        return out
+
+
+renderer = OverlayRenderer()
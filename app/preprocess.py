@@ -0,0 +1,123 @@
+import collections
+import io
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from app.registry import MIDAS_MEAN, MIDAS_STD, midas_input_size
+from config import Config
+
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def decode_image(img_bytes, min_side=None):
+    """Decode image bytes once, at reduced resolution when the source is much larger than needed.
+
+    The header is read first to get the size; if the long side is at least
+    2x/4x/8x min_side the image is decoded with IMREAD_REDUCED_COLOR_*, which
+    for JPEG scales in the DCT domain instead of decoding every pixel.
+    Returns (frame, scale) where scale maps decoded coordinates back to the
+    original image, or (None, 1.0) if the bytes are not a valid image.
+    """
+    if min_side is None:
+        # Tiled detection keeps more of the source resolution than one downscaled pass needs
+        min_side = Config.TILE_DECODE_MIN_SIDE if Config.DETECTION_TILING != 'off' else Config.DECODE_MIN_SIDE
+    nparr = np.frombuffer(img_bytes, np.uint8)
+
+    reduction = 1
+    original_side = None
+    if min_side:
+        try:
+            original_side = max(Image.open(io.BytesIO(img_bytes)).size)
+        except Exception:
+            original_side = None
+        if original_side:
+            while reduction < 8 and original_side // (reduction * 2) >= min_side:
+                reduction *= 2
+
+    if reduction == 1:
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR), 1.0
+    frame = cv2.imdecode(nparr, _REDUCED_FLAGS[reduction])
+    if frame is None:
+        return None, 1.0
+    return frame, original_side / max(frame.shape[:2])
+
+
+class SharedFrame:
+    """A frame plus the downscaled working buffer that both models read from.
+
+    The frame is resized once (INTER_AREA) so its long side matches the YOLO
+    input size; YOLO then only pads it, and the MiDaS input is derived from
+    the same small buffer instead of from the full-resolution frame.
+    """
+
+    def __init__(self, frame, working_side=None):
+        self.frame = frame
+        working_side = working_side or Config.PREPROCESS_WORKING_SIDE
+        height, width = frame.shape[:2]
+        scale = working_side / max(height, width)
+        if scale < 1:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            self.buffer = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        else:
+            self.buffer = frame
+        self.scale = (width / self.buffer.shape[1], height / self.buffer.shape[0])
+
+    def to_frame_coords(self, detections):
+        """Map (x1, y1, x2, y2, ...) rows from buffer to frame coordinates"""
+        if self.scale == (1.0, 1.0) or not len(detections):
+            return detections
+        detections = detections.copy()
+        detections[:, :4] *= np.array(self.scale * 2, dtype=detections.dtype)
+        return detections
+
+
+class DepthInputs:
+    """Builds batched MiDaS inputs into reusable preallocated tensors.
+
+    Buffers are grouped by MiDaS input size; each group is written straight
+    into a cached (N, 3, H, W) float tensor (resize, BGR->RGB and ImageNet
+    normalization per channel, no intermediate CHW copy). Tensors are reused
+    across calls with the same shape, so a steady stream allocates nothing.
+    Not thread-safe: use one instance per inference thread.
+    """
+
+    def __init__(self, max_cached=8):
+        self._tensors = collections.OrderedDict()
+        self.max_cached = max_cached
+        self.allocations = 0
+        self._scale = (1.0 / (255.0 * MIDAS_STD)).astype(np.float32)
+        self._offset = (MIDAS_MEAN / MIDAS_STD).astype(np.float32)
+
+    def _tensor(self, shape):
+        tensor = self._tensors.get(shape)
+        if tensor is None:
+            tensor = torch.empty(shape, dtype=torch.float32)
+            self.allocations += 1
+            self._tensors[shape] = tensor
+            if len(self._tensors) > self.max_cached:
+                self._tensors.popitem(last=False)
+        else:
+            self._tensors.move_to_end(shape)
+        return tensor
+
+    def prepare(self, buffers):
+        """Return a list of (input_batch, indices) groups for BGR uint8 buffers"""
+        groups = collections.defaultdict(list)
+        for index, buffer in enumerate(buffers):
+            groups[midas_input_size(*buffer.shape[:2])].append(index)
+
+        batches = []
+        for (height, width), indices in groups.items():
+            tensor = self._tensor((len(indices), 3, height, width))
+            array = tensor.numpy()
+            for row, index in enumerate(indices):
+                small = cv2.resize(buffers[index], (width, height), interpolation=cv2.INTER_CUBIC)
+                # BGR channel 2 - c is RGB channel c
+                for c in range(3):
+                    np.multiply(small[:, :, 2 - c], self._scale[c], out=array[row, c], casting='unsafe')
+                    array[row, c] -= self._offset[c]
+            batches.append((tensor, indices))
+        return batches
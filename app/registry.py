@@ -0,0 +1,165 @@
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from app import backends
+from config import Config
+
+MIDAS_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+MIDAS_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def _multiple_of(x, multiple=32, max_val=None):
+    y = int(round(x / multiple) * multiple)
+    if max_val is not None and y > max_val:
+        y = int(np.floor(x / multiple) * multiple)
+    if y < multiple:
+        y = int(np.ceil(x / multiple) * multiple)
+    return y
+
+
+def midas_input_size(height, width, target=256):
+    """MiDaS small input (height, width): fit inside target x target, keep aspect, multiple of 32"""
+    scale = min(target / height, target / width)
+    return _multiple_of(scale * height, max_val=target), _multiple_of(scale * width, max_val=target)
+
+
+def midas_small_transform(img):
+    """Local equivalent of the hub's MiDaS `small_transform` for an RGB uint8 image.
+
+    Resize to fit 256x256 (keeping the aspect ratio, multiple of 32) with
+    bicubic interpolation, normalize with ImageNet statistics and return a
+    1x3xHxW float tensor, so no hub checkout is needed at runtime.
+    """
+    height, width = midas_input_size(*img.shape[:2])
+    resized = cv2.resize(img.astype(np.float32) / 255.0, (width, height), interpolation=cv2.INTER_CUBIC)
+    normalized = (resized - MIDAS_MEAN) / MIDAS_STD
+    return torch.from_numpy(np.ascontiguousarray(normalized.transpose(2, 0, 1))).unsqueeze(0)
+
+
+class ModelRegistry:
+    """Loads the models from a local artifact directory without network access.
+
+    YOLOv8s is read from `yolov8s.pt` and MiDaS small from a TorchScript
+    artifact (`midas_small.ts`), which deserializes in a fraction of the
+    time of a torch.hub load and needs no hub repo checkout. If the MiDaS
+    artifact is missing, loading fails unless MODEL_ALLOW_DOWNLOAD is set, in
+    which case the model is fetched once from torch.hub and the artifact
+    written for the next start.
+
+    DETECTION_BACKEND and DEPTH_BACKEND select exported ONNX or INT8 artifacts
+    instead (see app/backends.py); export() builds them.
+    """
+
+    YOLO_FILE = 'yolov8s.pt'
+    MIDAS_FILE = 'midas_small.ts'
+
+    def __init__(self, model_dir=None, device=None, allow_download=None,
+                 detection_backend=None, depth_backend=None):
+        self.model_dir = model_dir or Config.MODEL_DIR
+        self.device = device or torch.device('cpu')
+        self.allow_download = Config.MODEL_ALLOW_DOWNLOAD if allow_download is None else allow_download
+        self.detection_backend = detection_backend or Config.DETECTION_BACKEND
+        self.depth_backend = depth_backend or Config.DEPTH_BACKEND
+        self.timings = {}
+
+    def path(self, filename):
+        return os.path.join(self.model_dir, filename)
+
+    def yolo_path(self, backend=None):
+        return self.path(backends.artifact_name('yolov8s', backend or self.detection_backend, self.YOLO_FILE))
+
+    def midas_path(self, backend=None):
+        return self.path(backends.artifact_name('midas_small', backend or self.depth_backend, self.MIDAS_FILE))
+
+    def load_yolo(self):
+        from ultralytics import YOLO
+
+        model_path = self.yolo_path()
+        start = time.perf_counter()
+        if self.detection_backend == 'torch':
+            if not os.path.exists(model_path) and not self.allow_download:
+                raise FileNotFoundError(f"YOLO weights not found at {model_path}; run prepare_models.py")
+            model = YOLO(model_path).to(self.device)
+        else:
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"YOLO {self.detection_backend} artifact not found at {model_path}; "
+                                        f"run prepare_models.py --export {self.detection_backend}")
+            model = YOLO(model_path, task='detect')
+        self.timings['yolo'] = time.perf_counter() - start
+        return model
+
+    def load_midas(self):
+        """Return (model, transform) for MiDaS small"""
+        artifact = self.midas_path()
+        start = time.perf_counter()
+        if self.depth_backend != 'torch':
+            if not os.path.exists(artifact):
+                raise FileNotFoundError(f"MiDaS {self.depth_backend} artifact not found at {artifact}; "
+                                        f"run prepare_models.py --export {self.depth_backend}")
+            model = backends.OnnxDepthModel(artifact, threads=Config.DEPTH_THREADS)
+        elif os.path.exists(artifact):
+            model = torch.jit.load(artifact, map_location=self.device)
+        elif self.allow_download:
+            print(f"MiDaS artifact not found at {artifact}, loading from torch.hub...")
+            model = self.export_midas()
+            model = model.to(self.device)
+        else:
+            raise FileNotFoundError(f"MiDaS artifact not found at {artifact}; run prepare_models.py")
+        model.eval()
+        self.timings['midas'] = time.perf_counter() - start
+        return model, midas_small_transform
+
+    def export_midas(self):
+        """Fetch MiDaS small from torch.hub and save it as a traced TorchScript artifact"""
+        model = torch.hub.load("intel-isl/MiDaS", "MiDaS_small")
+        model.eval()
+        example = midas_small_transform(np.zeros((480, 640, 3), dtype=np.uint8))
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example, check_trace=False)
+        os.makedirs(self.model_dir, exist_ok=True)
+        tmp_path = self.path(self.MIDAS_FILE + '.tmp')
+        traced.save(tmp_path)
+        os.replace(tmp_path, self.path(self.MIDAS_FILE))
+        print(f"Saved MiDaS artifact to {self.path(self.MIDAS_FILE)}")
+        return traced
+
+    def export(self, backend_names, calibration_images=None):
+        """Build the ONNX / INT8 artifacts for the given backends from the torch artifacts.
+
+        Static INT8 needs calibration_images (BGR frames from a local image set).
+        """
+        backend_names = [name for name in backend_names if name != 'torch']
+        if not backend_names:
+            return
+        if 'onnx-int8' in backend_names and not calibration_images:
+            raise ValueError("onnx-int8 needs calibration images")
+
+        yolo_onnx, midas_onnx = self.yolo_path('onnx'), self.midas_path('onnx')
+        if not os.path.exists(yolo_onnx):
+            exported = backends.export_yolo_onnx(self.yolo_path('torch'))
+            if os.path.abspath(exported) != os.path.abspath(yolo_onnx):
+                os.replace(exported, yolo_onnx)
+            print(f"Exported {yolo_onnx}")
+        if not os.path.exists(midas_onnx):
+            if not os.path.exists(self.midas_path('torch')):
+                self.export_midas()
+            backends.export_midas_onnx(torch.jit.load(self.midas_path('torch')), midas_onnx)
+            print(f"Exported {midas_onnx}")
+
+        if 'onnx-int8' in backend_names:
+            yolo_inputs = [backends.letterbox(image) for image in calibration_images]
+            midas_inputs = [midas_small_transform(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).numpy()
+                            for image in calibration_images]
+            backends.quantize(yolo_onnx, self.yolo_path('onnx-int8'), yolo_inputs)
+            backends.quantize(midas_onnx, self.midas_path('onnx-int8'), midas_inputs)
+            print(f"Quantized (static, {len(calibration_images)} calibration images) "
+                  f"{self.yolo_path('onnx-int8')} and {self.midas_path('onnx-int8')}")
+        if 'onnx-int8-dynamic' in backend_names:
+            backends.quantize(yolo_onnx, self.yolo_path('onnx-int8-dynamic'))
+            backends.quantize(midas_onnx, self.midas_path('onnx-int8-dynamic'))
+            print(f"Quantized (dynamic) {self.yolo_path('onnx-int8-dynamic')} "
+                  f"and {self.midas_path('onnx-int8-dynamic')}")
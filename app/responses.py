@@ -0,0 +1,151 @@
+import base64
+import io
+import json
+import uuid
+
+import cv2
+import numpy as np
+from flask import Response, jsonify
+
+from app import metrics
+from app.admission import NO_DEPTH, NO_IMAGE, QUALITY_LEVELS
+from app.overlay import preview_size
+from config import Config
+
+
+class ResponseOptions:
+    """Per-request output options.
+
+    image         include the rendered overlay (default true); rendering and
+                  JPEG encoding are skipped entirely when false
+    depth         'none' (default), 'png16' (uint16 PNG) or 'npy' (float16)
+    format        'json' (binaries base64-encoded), 'multipart' (JSON part plus
+                  raw binary parts) or 'jpeg' (the rendered image alone)
+    jpeg_quality  JPEG quality of the rendered image
+    max_width     downscale the rendered image to at most this width
+    """
+
+    DEPTH_FORMATS = ('none', 'png16', 'npy')
+    FORMATS = ('json', 'multipart', 'jpeg')
+
+    def __init__(self, image=True, depth='none', format='json', jpeg_quality=None, max_width=None):
+        self.image = image
+        self.depth = depth
+        self.format = format
+        self.jpeg_quality = jpeg_quality or Config.JPEG_QUALITY
+        self.max_width = max_width
+
+    @classmethod
+    def from_values(cls, values):
+        """Parse options from request args/form or a JSON body, raising ValueError if invalid"""
+        image = str(values.get('image', 'true')).lower() not in ('0', 'false', 'no', 'none')
+        depth = values.get('depth', 'none')
+        format = values.get('format', 'json')
+        if depth not in cls.DEPTH_FORMATS:
+            raise ValueError(f"depth must be one of {', '.join(cls.DEPTH_FORMATS)}")
+        if format not in cls.FORMATS:
+            raise ValueError(f"format must be one of {', '.join(cls.FORMATS)}")
+        try:
+            jpeg_quality = int(values['jpeg_quality']) if 'jpeg_quality' in values else None
+            max_width = int(values['max_width']) if 'max_width' in values else None
+        except (TypeError, ValueError):
+            raise ValueError('jpeg_quality and max_width must be integers')
+        if jpeg_quality is not None and not 1 <= jpeg_quality <= 100:
+            raise ValueError('jpeg_quality must be between 1 and 100')
+        if max_width is not None and max_width < 2:
+            raise ValueError('max_width must be at least 2')
+        if format == 'jpeg':
+            image = True
+        return cls(image, depth, format, jpeg_quality, max_width)
+
+    def for_result(self, result):
+        """These options without the outputs a degraded result does not have (no depth, no image)"""
+        image = self.image and (result.quality < NO_IMAGE or self.format == 'jpeg')
+        depth = self.depth if result.quality < NO_DEPTH else 'none'
+        if (image, depth) == (self.image, self.depth):
+            return self
+        return ResponseOptions(image, depth, self.format, self.jpeg_quality, self.max_width)
+
+
+def encode_image(result, options):
+    """Render the overlay at the requested size and JPEG-encode it"""
+    panel_size = preview_size(result.frame.shape, options.max_width)
+    with metrics.stage('render'):
+        rendered = result.render(panel_size) if panel_size else result.rendered
+    with metrics.stage('jpeg_encode'):
+        _, buffer = cv2.imencode('.jpg', rendered, [cv2.IMWRITE_JPEG_QUALITY, options.jpeg_quality])
+    return buffer.tobytes()
+
+
+def encode_depth(depth_map, kind):
+    """Encode a normalized depth map as (bytes, mimetype)"""
+    if kind == 'png16':
+        _, buffer = cv2.imencode('.png', (depth_map * 65535).astype(np.uint16))
+        return buffer.tobytes(), 'image/png'
+    output = io.BytesIO()
+    np.save(output, depth_map.astype(np.float16))
+    return output.getvalue(), 'application/x-npy'
+
+
+def detection_payload(result, options=None, binaries=True):
+    """Build the JSON-serializable payload for a single inference result.
+
+    With binaries False the image and depth are left out of the payload so
+    the caller can send them as raw parts.
+    """
+    options = (options or ResponseOptions()).for_result(result)
+    with metrics.stage('depth_stats'):
+        detections = result.detection_dicts()
+    payload = {
+        'success': True,
+        'quality': QUALITY_LEVELS[result.quality],
+        'detections': detections
+    }
+    if result.source_roi is not None:
+        payload['roi'] = [int(round(value)) for value in result.source_roi]
+    if options.depth != 'none':
+        payload['depth_shape'] = list(result.depth_map.shape[:2])
+        payload['depth_format'] = options.depth
+    if binaries:
+        if options.image:
+            image_bytes = encode_image(result, options)
+            with metrics.stage('base64'):
+                payload['processed_image'] = base64.b64encode(image_bytes).decode('utf-8')
+        if options.depth != 'none':
+            depth_bytes, _ = encode_depth(result.depth_map, options.depth)
+            with metrics.stage('base64'):
+                payload['depth'] = base64.b64encode(depth_bytes).decode('utf-8')
+    return payload
+
+
+def _multipart(parts):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, mimetype, data in parts:
+        body.write(f'--{boundary}\r\n'
+                   f'Content-Disposition: form-data; name="{name}"\r\n'
+                   f'Content-Type: {mimetype}\r\n\r\n'.encode())
+        body.write(data)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return Response(body.getvalue(), mimetype=f'multipart/mixed; boundary={boundary}')
+
+
+def detection_response(result, options=None):
+    """Build the HTTP response for a single inference result in the requested format"""
+    options = (options or ResponseOptions()).for_result(result)
+    if options.format == 'jpeg':
+        return Response(encode_image(result, options), mimetype='image/jpeg',
+                        headers={'X-Quality': QUALITY_LEVELS[result.quality]})
+    if options.format == 'multipart':
+        parts = [('result', 'application/json',
+                  json.dumps(detection_payload(result, options, binaries=False)).encode())]
+        if options.image:
+            parts.append(('processed_image', 'image/jpeg', encode_image(result, options)))
+        if options.depth != 'none':
+            depth_bytes, mimetype = encode_depth(result.depth_map, options.depth)
+            parts.append(('depth', mimetype, depth_bytes))
+        return _multipart(parts)
+    payload = detection_payload(result, options)
+    with metrics.stage('json'):
+        return jsonify(payload)
@@ -1,8 +1,10 @@
-from flask import render_template, Response, jsonify
+from flask import render_template, Response, jsonify, request
 from app import app
 from app.camera import Camera
+from config import Config
 
-camera = Camera()
+# Models load on first use so importing the app package stays cheap
+camera = Camera(loading='lazy')
 
 @app.route('/')
 def index():
@@ -15,8 +17,19 @@ def video_feed():
 
 @app.route('/start_stream')
 def start_stream():
-    return camera.start_stream()
+    # Optional ?source= names one of Config.STREAM_SOURCES; clients never pass
+    # paths or URLs through to cv2.VideoCapture
+    name = request.args.get('source')
+    if name is not None and name not in Config.STREAM_SOURCES:
+        return jsonify({'status': 'error', 'message': f'Unknown source {name!r}'}), 400
+    return camera.start_stream(Config.STREAM_SOURCES[name] if name is not None else None)
 
 @app.route('/stop_stream')
 def stop_stream():
-    return camera.stop_stream()
\ No newline at end of file
+    return camera.stop_stream()
+
+@app.route('/stream_stats')
+def stream_stats():
+    if camera.stream is None:
+        return jsonify({'active': False})
+    return jsonify(camera.stream.stats())
\ No newline at end of file
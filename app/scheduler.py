@@ -0,0 +1,136 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from app import metrics
+from app.admission import FULL, LatencyWindow
+from app.cache import ResultCache
+from app.models import InferenceOptions, InferenceResult
+from config import Config
+
+
+class InferenceScheduler:
+    """Dynamic micro-batching in front of a shared Camera.
+
+    Request threads call submit() and block on the result. A single worker
+    thread collects queued frames until it has max_batch_size of them or the
+    oldest has waited max_wait_ms, then runs them through Camera.infer_batch
+    as one batch. All model access goes through that one worker, so
+    concurrent gunicorn threads never call the models at the same time.
+
+    With a ResultCache, frames whose content hash is cached are answered
+    without being queued, and fresh full-quality results are added to the
+    cache. Frames carry the quality level they were admitted at and their
+    request's InferenceOptions; a batch with mixed levels or options runs as
+    one model call per combination. Per-frame latencies go into a
+    LatencyWindow for the AdmissionController.
+    """
+
+    def __init__(self, camera, max_batch_size=None, max_wait_ms=None, cache=None):
+        self.camera = camera
+        self.cache = cache
+        self.max_batch_size = max_batch_size or Config.BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else Config.BATCH_MAX_WAIT_MS) / 1000.0
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.latencies = LatencyWindow()
+
+    def _ensure_worker(self):
+        # The worker thread is started on first use by the process that uses
+        # it: threads are not inherited across fork, so a scheduler created in
+        # a pre-fork server's master gets its own queue and thread per worker
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+                self._worker.start()
+                self._pid = os.getpid()
+
+    def submit(self, frame, quality=FULL, options=None):
+        """Queue a frame and wait for its InferenceResult"""
+        return self.submit_async(frame, quality, options).result()
+
+    def submit_async(self, frame, quality=FULL, options=None):
+        """Queue a frame and return a Future for its InferenceResult"""
+        options = options or InferenceOptions()
+        future = Future()
+        key = None
+        if self.cache is not None:
+            key = ResultCache.key(frame, self.camera.settings_signature() + '|' + options.signature())
+            cached = self.cache.get(key)
+            if cached is not None:
+                detections, depth_map = cached
+                future.set_result(InferenceResult(frame, detections, self.camera.class_names,
+                                                  depth_map.astype(np.float32)))
+                return future
+        self._ensure_worker()
+        self._queue.put((frame, key, future, time.perf_counter(), quality, options))
+        return future
+
+    def pending(self):
+        """Frames waiting for a batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _collect_batch(self):
+        # Block until there is work, then keep collecting until the batch is
+        # full or the first frame has waited long enough
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            groups = {}
+            for item in self._collect_batch():
+                groups.setdefault((item[4], item[5].signature()), []).append(item)
+            for (quality, _), batch in groups.items():
+                try:
+                    self._run_batch(batch, quality, batch[0][5])
+                except Exception as e:
+                    # Whatever failed (inference, bookkeeping, the cache), the
+                    # callers still waiting get the error and the worker keeps
+                    # serving the queue
+                    waiting = [future for _, _, future, _, _, _ in batch if not future.done()]
+                    for future in waiting:
+                        future.set_exception(e)
+                    if not waiting:
+                        print(f"Inference scheduler: error after a batch was answered: {e!r}")
+
+    def _run_batch(self, batch, quality, options):
+        frames = [frame for frame, _, _, _, _, _ in batch]
+        started = time.perf_counter()
+        if Config.METRICS_ENABLED:
+            metrics.BATCH_SIZE.observe(len(batch))
+        results = self.camera.infer_batch(frames, quality, options)
+        if len(results) != len(batch):
+            raise RuntimeError(f'infer_batch returned {len(results)} results for {len(batch)} frames')
+        finished = time.perf_counter()
+        cacheable = quality == FULL and options.depth
+        entries = [(key, result.detections, result.depth_map)
+                   for (_, key, _, _, _, _), result in zip(batch, results) if key is not None and cacheable]
+        for (_, _, future, queued, _, _), result in zip(batch, results):
+            result.timings['queue'] = started - queued
+            future.set_result(result)
+        # Bookkeeping runs after every caller has its result
+        self.latencies.add([finished - queued for _, _, _, queued, _, _ in batch], finished - started, len(batch))
+        if Config.METRICS_ENABLED:
+            for _, _, _, queued, _, _ in batch:
+                metrics.QUEUE_WAIT_SECONDS.observe(started - queued)
+        for key, detections, depth_map in entries:
+            self.cache.put(key, detections, depth_map)
@@ -0,0 +1,56 @@
+import gc
+import os
+
+import torch
+
+# Set in each pre-forked worker by init_worker(); reported by /api/health
+worker_info = {}
+
+
+def _affinity():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_cores():
+    """Number of cores this process may run on (its CPU affinity where supported)"""
+    return len(_affinity())
+
+
+def worker_cores(slot, workers, cores=None):
+    """Cores for worker `slot` of `workers`: an even, contiguous split of `cores`.
+
+    With more workers than cores each worker gets one core, assigned round-robin.
+    """
+    cores = _affinity() if cores is None else list(cores)
+    if workers >= len(cores):
+        return [cores[slot % len(cores)]]
+    return cores[slot * len(cores) // workers:(slot + 1) * len(cores) // workers]
+
+
+def prepare_parent():
+    """Call in the parent once the models are loaded, right before forking workers.
+
+    The model weights live in tensor storage that workers only read, so those
+    pages stay shared copy-on-write. gc.freeze() moves every object allocated
+    so far out of the collector's generations; otherwise the first collection
+    in each worker writes to their headers and un-shares the pages holding them.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def init_worker(slot, workers, pin=True):
+    """Give a freshly forked worker its core budget.
+
+    The worker is pinned to its cores (if pin and the platform supports it)
+    and torch's intra-op pool is sized to match, so N workers together use
+    each core once instead of N torch pools each spanning every core.
+    """
+    cores = worker_cores(slot, workers)
+    if pin and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    worker_info.update({'pid': os.getpid(), 'slot': slot, 'cores': cores})
+    return cores
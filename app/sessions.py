@@ -0,0 +1,190 @@
+import json
+import struct
+
+import cv2
+import numpy as np
+
+from app import metrics
+from app.admission import QUALITY_LEVELS, Overloaded
+from app.keyframes import KeyframeDepth
+from app.preprocess import decode_image
+from config import Config
+
+# Client -> server: uint32 frame id, then the encoded image (JPEG, PNG, WebP)
+FRAME_HEADER = struct.Struct('<I')
+# Server -> client: frame id, stale frames dropped so far, detection count,
+# depth height and width (0 when no depth map is attached), quality level, flags
+RESULT_HEADER = struct.Struct('<IIHHHBB')
+# Result flags
+DEPTH_ATTACHED = 1
+
+
+class FrameSession:
+    """A client's persistent frame-push session (binary WebSocket messages).
+
+    The client sends binary messages of a uint32 frame id followed by an
+    encoded image. For every frame it processes the server answers with a
+    binary result: RESULT_HEADER, then (x1, y1, x2, y2, conf, cls, depth)
+    float32 rows in original-image pixels (depth is the median over the box,
+    NaN without depth), then, when DEPTH_ATTACHED is set, the depth map as
+    uint8 at depth_side on its long side. Text messages from the client are
+    answered with the session stats; per-frame errors (invalid image,
+    overload) come back as JSON text.
+
+    Backpressure: only the newest waiting frame is processed, older ones are
+    dropped, so a client that outruns inference gets fresh results rather
+    than a growing delay. With skip N only every (N + 1)th frame taken from
+    the connection runs, whether or not the frames in between failed. MiDaS
+    runs on keyframes only (KeyframeDepth: every DEPTH_KEYFRAME_INTERVAL
+    frames or on a scene change); other frames go through the scheduler
+    detection-only and reuse the session's last depth map, which the client
+    already has. Frames are admitted through the
+    AdmissionController and batched with all other requests.
+
+    ws is any connection with receive(timeout) and send(data), as a
+    flask-sock / simple-websocket connection.
+    """
+
+    def __init__(self, ws, scheduler, admission, inference, class_names, depth_side=None, skip=0):
+        self.ws = ws
+        self.scheduler = scheduler
+        self.admission = admission
+        self.inference = inference
+        self.class_names = class_names
+        self.depth_side = Config.SESSION_DEPTH_SIDE if depth_side is None else depth_side
+        self.skip = skip
+        self.keyframes = KeyframeDepth(None, update='reuse') if self.depth_side else None
+        self.received = 0
+        # Frames past the header check, which the skip counter runs on
+        self.valid = 0
+        self.processed = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.shed = 0
+        self.errors = 0
+
+    @classmethod
+    def from_values(cls, ws, values, scheduler, admission, inference, class_names):
+        """Session for request args (depth_side, skip), raising ValueError if invalid"""
+        try:
+            depth_side = int(values.get('depth_side', Config.SESSION_DEPTH_SIDE))
+            skip = int(values.get('skip', 0))
+        except (TypeError, ValueError):
+            raise ValueError('depth_side and skip must be integers')
+        if depth_side < 0 or skip < 0:
+            raise ValueError('depth_side and skip must not be negative')
+        return cls(ws, scheduler, admission, inference, class_names, depth_side, skip)
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'shed': self.shed,
+            'errors': self.errors,
+            'keyframes': self.keyframes.keyframes if self.keyframes is not None else 0,
+        }
+
+    def run(self):
+        """Serve the session until the client disconnects (the connection raises on close)"""
+        self.ws.send(json.dumps({'session': {
+            'classes': {int(class_id): name for class_id, name in self.class_names.items()},
+            'depth_side': self.depth_side,
+            'skip': self.skip,
+        }}))
+        while True:
+            message = self._next_frame()
+            if message is not None:
+                self._process(message)
+
+    def _next_frame(self):
+        """Block for a frame, then drop every older one that is already waiting behind it"""
+        frame, timeout = None, None
+        while True:
+            message = self.ws.receive(timeout=timeout)
+            if message is None:
+                return frame
+            if isinstance(message, str):
+                self.ws.send(json.dumps({'stats': self.stats()}))
+                continue
+            self.received += 1
+            if frame is not None:
+                self.dropped += 1
+            frame, timeout = message, 0
+
+    def _error(self, frame_id, error, **fields):
+        self.errors += 1
+        self.ws.send(json.dumps({'frame': frame_id, 'error': error, **fields}))
+
+    def _process(self, message):
+        if len(message) <= FRAME_HEADER.size:
+            return self._error(None, 'Frames start with a uint32 frame id followed by the image')
+        frame_id, = FRAME_HEADER.unpack_from(message)
+        self.valid += 1
+        if self.skip and (self.valid - 1) % (self.skip + 1):
+            self.skipped += 1
+            return
+        try:
+            quality = self.admission.admit()
+        except Overloaded as e:
+            self.shed += 1
+            return self._error(frame_id, str(e), retry_after=e.retry_after)
+        with metrics.stage('decode'):
+            img, scale = decode_image(memoryview(message)[FRAME_HEADER.size:])
+        if img is None:
+            return self._error(frame_id, 'Invalid image format')
+        try:
+            frame, roi = self.inference.crop(img, scale)
+        except ValueError as e:
+            return self._error(frame_id, str(e))
+
+        keyframe = self.keyframes is not None and self.keyframes.needs_keyframe(frame)
+        options = self.inference if keyframe else self.inference.without_depth()
+        result = self.scheduler.submit(frame, quality, options)
+        self.processed += 1
+
+        depth = None
+        if result.depth_map is not None:
+            self.keyframes.set_keyframe(frame, result.depth_map)
+            depth = self._depth_bytes(result.depth_map)
+        elif self.keyframes is not None:
+            result.depth_map = self.keyframes.depth_map
+
+        detections = np.asarray(result.detections, dtype=np.float32).reshape(-1, 6)
+        rows = np.full((len(detections), 7), np.nan, dtype=np.float32)
+        rows[:, :6] = detections
+        rows[:, :4] *= scale
+        if roi is not None:
+            rows[:, [0, 2]] += roi[0]
+            rows[:, [1, 3]] += roi[1]
+        if result.depth_map is not None and len(rows):
+            rows[:, 6] = result.depth_stats()['median']
+
+        depth_height, depth_width = depth.shape if depth is not None else (0, 0)
+        header = RESULT_HEADER.pack(frame_id, self.dropped, len(rows), depth_height, depth_width,
+                                    result.quality, DEPTH_ATTACHED if depth is not None else 0)
+        self.ws.send(header + rows.tobytes() + (depth.tobytes() if depth is not None else b''))
+
+    def _depth_bytes(self, depth_map):
+        """The depth map as uint8 with its long side at depth_side"""
+        height, width = depth_map.shape[:2]
+        scale = self.depth_side / max(height, width)
+        if scale < 1:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            depth_map = cv2.resize(depth_map, size, interpolation=cv2.INTER_AREA)
+        return cv2.convertScaleAbs(depth_map, alpha=255)
+
+
+def parse_result(data):
+    """Decode a binary session result into a dict (for clients written in Python)"""
+    frame_id, dropped, count, depth_height, depth_width, quality, flags = RESULT_HEADER.unpack_from(data)
+    offset = RESULT_HEADER.size
+    rows = np.frombuffer(data, dtype=np.float32, count=count * 7, offset=offset).reshape(count, 7)
+    offset += rows.nbytes
+    depth = None
+    if flags & DEPTH_ATTACHED:
+        depth = np.frombuffer(data, dtype=np.uint8, count=depth_height * depth_width,
+                              offset=offset).reshape(depth_height, depth_width)
+    return {'frame': frame_id, 'dropped': dropped, 'quality': QUALITY_LEVELS[quality],
+            'detections': rows, 'depth': depth}
@@ -0,0 +1,85 @@
+import time
+
+import cv2
+import numpy as np
+
+from app import metrics
+from app.backends import YOLO_INPUT_SIZE
+from app.camera import Camera
+from app.models import InferenceOptions
+from app.registry import midas_input_size
+from config import Config
+from simulator import COCO_NAMES, CostModel, fake_depth, fake_detections, frame_rng
+
+
+class SimulatedCamera(Camera):
+    """Camera with simulated models, for load testing without weights or a GPU.
+
+    Detection and depth estimation are replaced by seeded fake outputs: the
+    same image always gets the same detections and depth map. Each model
+    call spends the time, CPU and memory of a simulator.CostModel configured
+    from the SIM_* settings, scaled by the network input area like the real
+    models (SIM_*_MS is the cost of a full-size input). Everything around
+    the models (shared
+    preprocessing, quality levels, parallel pipeline mode, results and
+    streaming) is Camera's, so the HTTP, batching and worker layers behave
+    as they do with the real models.
+    """
+
+    def __init__(self, pipeline_mode=None, loading=None, seed=None):
+        self.seed = Config.SIM_SEED if seed is None else seed
+        self.detection_cost = CostModel(Config.SIM_CALL_MS, Config.SIM_DETECTION_MS, seed=self.seed)
+        self.depth_cost = CostModel(Config.SIM_CALL_MS, Config.SIM_DEPTH_MS, seed=self.seed + 1)
+        super().__init__(pipeline_mode, loading)
+
+    def load_models(self):
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            self.status = 'warming'
+            start = time.perf_counter()
+            time.sleep(Config.SIM_LOAD_SECONDS)
+            self.load_time = time.perf_counter() - start
+            self.status = 'ready'
+            self._loaded.set()
+
+    @property
+    def class_names(self):
+        return dict(enumerate(COCO_NAMES))
+
+    def settings_signature(self):
+        return f"simulated:seed={self.seed}|max={Config.SIM_MAX_DETECTIONS}|depth={Config.DEPTH_RESOLUTION}"
+
+    def detect_objects_batch(self, frames, shared=None, input_size=None, options=None):
+        """Seeded fake detections, filtered by the options as YOLO's NMS would"""
+        self.ensure_loaded()
+        options = options or InferenceOptions()
+        # Input size per frame as in Camera, so a small region of interest costs less
+        sides = [self.yolo_input_size(max(frame.shape[:2]), input_size, options) or YOLO_INPUT_SIZE
+                 for frame in frames]
+        with metrics.stage('yolo'):
+            self.detection_cost.run(len(frames), np.mean([(side / YOLO_INPUT_SIZE) ** 2 for side in sides]))
+            detections = [fake_detections(frame.shape, frame_rng(frame, self.seed)) for frame in frames]
+        for i, frame_detections in enumerate(detections):
+            keep = frame_detections[:, 4] >= options.conf
+            if options.classes is not None:
+                keep &= np.isin(frame_detections[:, 5], options.classes)
+            detections[i] = frame_detections[keep][:options.max_det]
+        return detections
+
+    def estimate_depth_batch(self, frames, full_resolution=None, shared=None):
+        """Seeded fake depth maps at network resolution, upsampled like MiDaS output when full"""
+        self.ensure_loaded()
+        if full_resolution is None:
+            full_resolution = Config.DEPTH_RESOLUTION == 'full'
+        with metrics.stage('midas'):
+            # The cost per frame is for a full 256 x 256 MiDaS input
+            area = np.mean([np.prod(midas_input_size(*frame.shape[:2])) for frame in frames]) / 256 ** 2
+            self.depth_cost.run(len(frames), area)
+            depth_maps = [fake_depth(frame.shape, frame_rng(frame, self.seed, stream=1)) for frame in frames]
+        with metrics.stage('depth_postprocess'):
+            for i, frame in enumerate(frames):
+                if full_resolution and max(frame.shape[:2]) <= Config.DEPTH_FULL_MAX_SIDE:
+                    depth_maps[i] = cv2.resize(depth_maps[i], (frame.shape[1], frame.shape[0]),
+                                               interpolation=cv2.INTER_LINEAR)
+        return depth_maps
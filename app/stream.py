@@ -0,0 +1,239 @@
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from app.keyframes import KeyframeDepth
+from app.models import InferenceResult
+from app.overlay import preview_size
+from app.tracking import TrackedDetection
+from config import Config
+
+
+class DropOldestQueue:
+    """Bounded frame queue that discards the oldest frame when full.
+
+    A live source must never block on a slow consumer, so the capture thread
+    always succeeds and the inference worker always sees the freshest frames.
+    """
+
+    def __init__(self, maxsize):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Pop the oldest item, or return None if nothing arrives within timeout"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FrameSource:
+    """A cv2.VideoCapture over a webcam index, a video file or a stream URL (e.g. RTSP)"""
+
+    def __init__(self, source, width=None, height=None, realtime=None):
+        self.source = source
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video source {source!r}")
+
+        is_device = isinstance(source, int)
+        if is_device:
+            if width:
+                self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            if height:
+                self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        # Files are read as fast as the disk allows, so by default they are
+        # paced at their native frame rate to behave like a live camera
+        is_file = not is_device and '://' not in str(source)
+        self.realtime = is_file if realtime is None else realtime
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+
+    def read(self):
+        ok, frame = self.capture.read()
+        return frame if ok else None
+
+    def release(self):
+        self.capture.release()
+
+
+class StreamEngine:
+    """Capture -> drop-oldest queue -> inference -> MJPEG encoder.
+
+    The capture thread pushes (frame, capture_time) into a DropOldestQueue.
+    The inference worker runs MiDaS only on keyframes (every frame_skip + 1
+    frames, or on a scene change), reusing the last depth map in between.
+    With tracking enabled YOLO also runs on an adaptive subset of frames and
+    tracked boxes with stable ids fill the rest (see TrackedDetection);
+    otherwise it runs on every frame. Each rendered frame is JPEG-encoded
+    once and shared by every client reading frames().
+    """
+
+    def __init__(self, camera, source=None, frame_skip=None, queue_size=None,
+                 jpeg_quality=None, realtime=None, tracking=None):
+        self.camera = camera
+        self.source = Config.CAMERA_INDEX if source is None else source
+        self.frame_skip = Config.FRAME_SKIP if frame_skip is None else frame_skip
+        self.jpeg_quality = jpeg_quality or Config.STREAM_JPEG_QUALITY
+        self.preview_width = Config.STREAM_PREVIEW_WIDTH
+        self._buffer = None
+        self.realtime = realtime
+        self.queue = DropOldestQueue(queue_size or Config.STREAM_QUEUE_SIZE)
+        self.depth = KeyframeDepth(camera, interval=self.frame_skip + 1)
+        tracking = Config.TRACKING_ENABLED if tracking is None else tracking
+        self.tracking = TrackedDetection(camera) if tracking else None
+
+        self._running = threading.Event()
+        self._finished = threading.Event()
+        self._frame_cond = threading.Condition()
+        self._jpeg = None
+        self._frame_id = 0
+        self._threads = []
+
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self._latencies = collections.deque(maxlen=300)
+        self._started_at = None
+        self._stopped_at = None
+
+    @property
+    def active(self):
+        return self._running.is_set()
+
+    def start(self):
+        if self.active:
+            return
+        self._frame_source = FrameSource(self.source, Config.FRAME_WIDTH, Config.FRAME_HEIGHT,
+                                         realtime=self.realtime)
+        self._capture_done = False
+        self.depth.reset()
+        if self.tracking is not None:
+            self.tracking.reset()
+        self._running.set()
+        self._finished.clear()
+        self._started_at = time.perf_counter()
+        self._stopped_at = None
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='stream-capture', daemon=True),
+            threading.Thread(target=self._inference_loop, name='stream-inference', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running.clear()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        self._finish()
+
+    def wait(self, timeout=None):
+        """Block until the source is exhausted (or the stream is stopped)"""
+        return self._finished.wait(timeout)
+
+    def _finish(self):
+        if self._stopped_at is None:
+            self._stopped_at = time.perf_counter()
+        self._finished.set()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+
+    def _capture_loop(self):
+        source = self._frame_source
+        next_due = time.perf_counter()
+        try:
+            while self._running.is_set():
+                frame = source.read()
+                if frame is None:
+                    break
+                self.frames_captured += 1
+                self.queue.put((frame, time.perf_counter()))
+                if source.realtime and source.frame_interval:
+                    next_due += source.frame_interval
+                    delay = next_due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            source.release()
+            self._capture_done = True
+
+    def _inference_loop(self):
+        try:
+            while self._running.is_set():
+                item = self.queue.get(timeout=0.1)
+                if item is None:
+                    if self._capture_done:
+                        break
+                    continue
+                frame, captured_at = item
+
+                track_ids = None
+                if self.tracking is not None:
+                    detections, track_ids = self.tracking.detect(frame)
+                else:
+                    detections = self.camera.detect_objects(frame)
+                depth_map = self.depth.estimate(frame)
+
+                result = InferenceResult(frame, detections, self.camera.class_names, depth_map)
+                result.track_ids = track_ids
+                # Encoded right away, so the overlay buffer is reused for every frame
+                self._buffer = result.render(preview_size(frame.shape, self.preview_width), out=self._buffer)
+                _, buffer = cv2.imencode('.jpg', self._buffer, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                with self._frame_cond:
+                    self._jpeg = buffer.tobytes()
+                    self._frame_id += 1
+                    self._frame_cond.notify_all()
+
+                self.frames_processed += 1
+                self._latencies.append(time.perf_counter() - captured_at)
+        finally:
+            self._running.clear()
+            self._finish()
+
+    def frames(self):
+        """Yield multipart/x-mixed-replace chunks with the latest encoded frame"""
+        last_id = 0
+        while True:
+            with self._frame_cond:
+                while self._frame_id == last_id and not self._finished.is_set():
+                    self._frame_cond.wait(timeout=1.0)
+                if self._frame_id == last_id:
+                    return
+                last_id, jpeg = self._frame_id, self._jpeg
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+    def stats(self):
+        """Sustained FPS, end-to-end latency (capture to encoded JPEG) and queue drops"""
+        end = self._stopped_at or time.perf_counter()
+        elapsed = end - self._started_at if self._started_at else 0.0
+        latencies = np.array(self._latencies) * 1000
+        return {
+            'active': self.active,
+            'frames_captured': self.frames_captured,
+            'frames_processed': self.frames_processed,
+            'frames_dropped': self.queue.dropped,
+            'depth_runs': self.depth.keyframes,
+            'detection_runs': self.tracking.detections_run if self.tracking is not None else self.frames_processed,
+            'fps': self.frames_processed / elapsed if elapsed else 0.0,
+            'latency_ms_mean': float(latencies.mean()) if latencies.size else None,
+            'latency_ms_p95': float(np.percentile(latencies, 95)) if latencies.size else None,
+        }
@@ -0,0 +1,80 @@
+import math
+
+import cv2
+import numpy as np
+import torch
+import torchvision
+
+from config import Config
+
+
+def _starts(length, tile, stride):
+    """Tile offsets along one axis; the last tile is shifted back to end at the edge"""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - tile) / stride) + 1
+    return [min(round(i * stride), length - tile) for i in range(count)]
+
+
+def plan_tiles(height, width, tile_size=None, overlap=None, max_tiles=None):
+    """Overlapping square tiles covering a frame, as (tile side in frame pixels, [(x, y), ...]).
+
+    Tiles are tile_size pixels (the YOLO input size) at full resolution. If
+    that takes more than max_tiles, the tile side grows until it fits, so
+    each tile is downscaled to tile_size and the cost per image stays bounded.
+    """
+    tile_size = tile_size or Config.PREPROCESS_WORKING_SIDE
+    overlap = Config.TILE_OVERLAP if overlap is None else overlap
+    max_tiles = max_tiles or Config.TILE_MAX_TILES
+    side = tile_size
+    while True:
+        stride = side * (1 - overlap)
+        xs = _starts(width, min(side, width), stride)
+        ys = _starts(height, min(side, height), stride)
+        if len(xs) * len(ys) <= max_tiles or side >= max(height, width):
+            break
+        side = math.ceil(side * 1.25)
+    return side, [(x, y) for y in ys for x in xs]
+
+
+def needs_tiles(frame, detections, buffer_scale):
+    """Whether a frame should get a tiled detection pass after the global one.
+
+    'always' tiles every frame whose long side reaches TILE_MIN_SIDE. 'auto'
+    also looks at the global pass: only if it found nothing, or found an
+    object smaller than TILE_SMALL_OBJECT pixels in the network input, where
+    YOLO's recall drops.
+    """
+    if Config.DETECTION_TILING == 'off' or max(frame.shape[:2]) < Config.TILE_MIN_SIDE:
+        return False
+    if Config.DETECTION_TILING == 'always' or not len(detections):
+        return True
+    sides = np.minimum(detections[:, 2] - detections[:, 0], detections[:, 3] - detections[:, 1]) / buffer_scale
+    return bool((sides < Config.TILE_SMALL_OBJECT).any())
+
+
+def extract_tiles(frame, side, origins, tile_size=None):
+    """Cut the tiles out of the frame, each resized (INTER_AREA) to tile_size if larger"""
+    tile_size = tile_size or Config.PREPROCESS_WORKING_SIDE
+    tiles = []
+    for x, y in origins:
+        tile = frame[y:y + side, x:x + side]
+        if side > tile_size:
+            height, width = tile.shape[:2]
+            scale = tile_size / side
+            tile = cv2.resize(tile, (max(1, round(width * scale)), max(1, round(height * scale))),
+                              interpolation=cv2.INTER_AREA)
+        tiles.append(tile)
+    return tiles
+
+
+def merge_detections(detection_sets, iou_threshold=None):
+    """Class-wise NMS over (x1, y1, x2, y2, conf, cls) arrays in frame coordinates"""
+    iou_threshold = Config.TILE_NMS_IOU if iou_threshold is None else iou_threshold
+    detection_sets = [np.asarray(d, dtype=np.float32).reshape(-1, 6) for d in detection_sets]
+    detections = np.concatenate(detection_sets) if detection_sets else np.zeros((0, 6), np.float32)
+    if not len(detections):
+        return detections
+    boxes = torch.from_numpy(detections)
+    keep = torchvision.ops.batched_nms(boxes[:, :4], boxes[:, 4], boxes[:, 5].long(), iou_threshold)
+    return detections[keep.numpy()]
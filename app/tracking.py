@@ -0,0 +1,225 @@
+import numpy as np
+
+from config import Config
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy comes with ultralytics, but is not a direct requirement
+    linear_sum_assignment = None
+
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) x1, y1, x2, y2 box arrays"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def assign(iou, threshold):
+    """Match rows to columns maximizing total IoU; returns (rows, cols) of pairs above threshold.
+
+    Uses the Hungarian algorithm when scipy is available, otherwise greedy
+    matching in order of decreasing IoU.
+    """
+    if not iou.size:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-iou)
+    else:
+        order = np.argsort(-iou, axis=None)
+        rows, cols = np.unravel_index(order[iou.ravel()[order] >= threshold], iou.shape)
+        used_rows, used_cols, pairs = set(), set(), []
+        for row, col in zip(rows, cols):
+            if row not in used_rows and col not in used_cols:
+                used_rows.add(row)
+                used_cols.add(col)
+                pairs.append((row, col))
+        rows, cols = (np.array(values, dtype=np.intp) for values in zip(*pairs)) if pairs else (
+            np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+    keep = iou[rows, cols] >= threshold
+    return rows[keep], cols[keep]
+
+
+def _to_state(boxes):
+    """x1, y1, x2, y2 -> center x, center y, width, height"""
+    size = boxes[:, 2:4] - boxes[:, :2]
+    return np.concatenate([boxes[:, :2] + size / 2, size], axis=1)
+
+
+def _to_boxes(state):
+    half = state[:, 2:4] / 2
+    return np.concatenate([state[:, :2] - half, state[:, :2] + half], axis=1)
+
+
+class MultiObjectTracker:
+    """Kalman-filtered IoU tracker (SORT-style) over all tracks at once.
+
+    Each track's state is center, size and their velocities under a constant
+    velocity model. Means and covariances of all tracks are stacked into
+    (N, 8) and (N, 8, 8) arrays, so predict and update are a few batched
+    matrix products however many objects are in view. Detections are
+    associated with the predicted boxes by IoU (same class only), new
+    detections start tracks and tracks missing for more than max_age
+    detection rounds are dropped.
+    """
+
+    # Constant velocity over one frame; only center and size are observed
+    TRANSITION = np.eye(8) + np.eye(8, k=4)
+    OBSERVATION = np.eye(4, 8)
+
+    def __init__(self, iou_threshold=None, max_age=None, min_hits=None):
+        self.iou_threshold = Config.TRACK_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        self.max_age = Config.TRACK_MAX_AGE if max_age is None else max_age
+        self.min_hits = Config.TRACK_MIN_HITS if min_hits is None else min_hits
+        self.reset()
+
+    def reset(self):
+        self.mean = np.zeros((0, 8))
+        self.covariance = np.zeros((0, 8, 8))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.scores = np.zeros(0)
+        self.classes = np.zeros(0)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self._next_id = 1
+        # Results of the last update, for the adaptive detection schedule
+        self.last_motion = 0.0
+        self.last_loss = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _noise(self, size, position_weight, velocity_weight):
+        # Noise proportional to the box width/height, so it is scale invariant
+        scale = np.tile(np.maximum(size, 1.0), 2)
+        std = np.concatenate([position_weight * scale, velocity_weight * scale], axis=1)
+        return np.einsum('ni,ij->nij', std ** 2, np.eye(8))
+
+    def predict(self):
+        """Advance all tracks by one frame; returns their predicted boxes"""
+        if len(self):
+            self.mean = self.mean @ self.TRANSITION.T
+            self.mean[:, 2:4] = np.maximum(self.mean[:, 2:4], 1.0)
+            self.covariance = (self.TRANSITION @ self.covariance @ self.TRANSITION.T
+                               + self._noise(self.mean[:, 2:4], 0.05, 0.01))
+        return _to_boxes(self.mean)
+
+    def update(self, detections):
+        """Correct the predicted tracks with a frame's (x1, y1, x2, y2, conf, cls) detections"""
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+        predicted = _to_boxes(self.mean)
+        iou = box_iou(predicted, detections[:, :4])
+        iou[self.classes[:, None] != detections[None, :, 5]] = 0
+        rows, cols = assign(iou, self.iou_threshold)
+
+        if len(rows):
+            measured = _to_state(detections[cols, :4])
+            mean, covariance = self.mean[rows], self.covariance[rows]
+            innovation_cov = (self.OBSERVATION @ covariance @ self.OBSERVATION.T
+                              + self._noise(mean[:, 2:4], 0.05, 0.0)[:, :4, :4])
+            gain = covariance @ self.OBSERVATION.T @ np.linalg.inv(innovation_cov)
+            innovation = measured - mean[:, :4]
+            self.mean[rows] = mean + np.einsum('nij,nj->ni', gain, innovation)
+            self.covariance[rows] = covariance - gain @ self.OBSERVATION @ covariance
+            self.scores[rows] = detections[cols, 4]
+            # Per-frame speed of the matched objects relative to their size
+            self.last_motion = float(np.median(np.abs(self.mean[rows, 4:6]).max(axis=1)
+                                               / np.maximum(self.mean[rows, 2:4].min(axis=1), 1.0)))
+        else:
+            self.last_motion = 0.0
+
+        matched = np.zeros(len(self), dtype=bool)
+        matched[rows] = True
+        self.hits[matched] += 1
+        self.misses[matched] = 0
+        self.misses[~matched] += 1
+        # Share of tracks and detections that found no partner this round
+        unmatched_detections = len(detections) - len(cols)
+        total = len(self) + len(detections)
+        self.last_loss = ((len(self) - len(rows)) + unmatched_detections) / total if total else 0.0
+
+        keep = self.misses <= self.max_age
+        self._select(keep)
+
+        new = np.ones(len(detections), dtype=bool)
+        new[cols] = False
+        self._start(detections[new])
+
+    def _select(self, keep):
+        self.mean, self.covariance = self.mean[keep], self.covariance[keep]
+        self.ids, self.scores, self.classes = self.ids[keep], self.scores[keep], self.classes[keep]
+        self.hits, self.misses = self.hits[keep], self.misses[keep]
+
+    def _start(self, detections):
+        count = len(detections)
+        if not count:
+            return
+        state = np.zeros((count, 8))
+        state[:, :4] = _to_state(detections[:, :4])
+        # Velocity is unknown at first, so it starts with a large variance
+        covariance = self._noise(state[:, 2:4], 0.1, 0.5)
+        self.mean = np.concatenate([self.mean, state])
+        self.covariance = np.concatenate([self.covariance, covariance])
+        self.ids = np.concatenate([self.ids, np.arange(self._next_id, self._next_id + count)])
+        self._next_id += count
+        self.scores = np.concatenate([self.scores, detections[:, 4]])
+        self.classes = np.concatenate([self.classes, detections[:, 5]])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+        self.misses = np.concatenate([self.misses, np.zeros(count, dtype=np.int64)])
+
+    def active(self):
+        """Confirmed, currently matched tracks as ((N, 6) detections, (N,) track ids)"""
+        keep = (self.hits >= self.min_hits) & (self.misses == 0)
+        detections = np.concatenate([_to_boxes(self.mean[keep]), self.scores[keep, None],
+                                     self.classes[keep, None]], axis=1).astype(np.float32)
+        return detections, self.ids[keep]
+
+
+class TrackedDetection:
+    """Object detection for video that runs YOLO only on some frames and tracks in between.
+
+    YOLO runs every `interval` frames; frames in between get the boxes of the
+    tracks predicted by the motion model. The interval adapts: after each
+    detection it is halved when objects moved more than motion_threshold of
+    their size per frame, or when more than loss_threshold of tracks and
+    detections went unmatched, and it grows by one frame (up to
+    max_interval) otherwise.
+    """
+
+    def __init__(self, camera, max_interval=None, motion_threshold=None, loss_threshold=None, tracker=None):
+        self.camera = camera
+        self.max_interval = max(1, max_interval or Config.TRACK_DETECT_INTERVAL)
+        self.motion_threshold = Config.TRACK_MOTION_THRESHOLD if motion_threshold is None else motion_threshold
+        self.loss_threshold = Config.TRACK_LOSS_THRESHOLD if loss_threshold is None else loss_threshold
+        self.tracker = tracker or MultiObjectTracker()
+        self.reset()
+
+    def reset(self):
+        self.tracker.reset()
+        self.interval = 1
+        self._since_detection = 0
+        self._frame_shape = None
+        self.detections_run = 0
+        self.frames = 0
+
+    def _adapt(self):
+        if self.tracker.last_motion > self.motion_threshold or self.tracker.last_loss > self.loss_threshold:
+            self.interval = max(1, self.interval // 2)
+        else:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def detect(self, frame):
+        """Return (detections, track_ids) for the next frame of the video"""
+        self.frames += 1
+        self.tracker.predict()
+        if self._since_detection >= self.interval or self._frame_shape != frame.shape[:2]:
+            self.tracker.update(self.camera.detect_objects(frame))
+            self._frame_shape = frame.shape[:2]
+            self._since_detection = 0
+            self.detections_run += 1
+            self._adapt()
+        self._since_detection += 1
+        return self.tracker.active()
@@ -0,0 +1,252 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from app.models import InferenceResult
+from app.overlay import preview_size
+from app.tracking import TrackedDetection
+from config import Config
+
+_DONE = object()
+
+
+def completed_frames(jsonl_path):
+    """Number of frames already recorded in a results file, dropping a partial last line.
+
+    Lines are written in frame order, so the count of leading lines with
+    consecutive frame indices is where processing resumes.
+    """
+    if not os.path.exists(jsonl_path):
+        return 0
+    count = 0
+    valid_bytes = 0
+    with open(jsonl_path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n') or record.get('frame') != count:
+                break
+            count += 1
+            valid_bytes += len(line)
+    # Cut off whatever an interrupted run left after the last complete line
+    with open(jsonl_path, 'r+b') as f:
+        f.truncate(valid_bytes)
+    return count
+
+
+def segment_path(video_path, start_frame):
+    """Annotated-video path for a run starting at start_frame.
+
+    Video containers cannot be appended to, so a resumed run writes a new
+    segment (name.from000123.ext) next to the first one.
+    """
+    if not start_frame:
+        return video_path
+    root, ext = os.path.splitext(video_path)
+    return f'{root}.from{start_frame:06d}{ext}'
+
+
+class VideoProcessor:
+    """Offline video pipeline: decode -> batched inference -> encode, one thread per stage.
+
+    The stages are connected by bounded queues, so decoding runs ahead of
+    inference and encoding overlaps the next batch while memory stays capped
+    at a few batches of frames. Every frame is processed (unlike the live
+    StreamEngine, nothing is dropped). Per-frame detections with depth
+    statistics are appended to a JSONL file, one line per frame in order,
+    and written only after the frame is encoded, so the file is the resume
+    checkpoint.
+
+    With tracking, YOLO runs on an adaptive subset of frames and every
+    detection gets a track id (see TrackedDetection); MiDaS still runs
+    batched on every frame. A resumed run starts with fresh tracks.
+    """
+
+    def __init__(self, camera, video_path, jsonl_path, output_video=None, batch_size=None,
+                 queue_batches=None, resume=False, render_width=None, tracking=False):
+        self.camera = camera
+        self.video_path = video_path
+        self.jsonl_path = jsonl_path
+        self.output_video = output_video
+        self.batch_size = batch_size or Config.VIDEO_BATCH_SIZE
+        self.render_width = render_width
+        self._buffer = None
+        self.tracking = TrackedDetection(camera) if tracking else None
+        queue_batches = queue_batches or Config.VIDEO_QUEUE_BATCHES
+        self._decoded = queue.Queue(maxsize=queue_batches)
+        self._inferred = queue.Queue(maxsize=queue_batches)
+        self._stop = threading.Event()
+        self._errors = []
+
+        self.start_frame = completed_frames(jsonl_path) if resume else 0
+        self.frames_done = 0
+        self.stage_seconds = {'decode': 0.0, 'inference': 0.0, 'encode': 0.0}
+        self.fps = None
+        self.total_frames = None
+
+    def _put(self, q, item):
+        # Give up if another stage failed instead of blocking on a full queue forever
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _decode_loop(self, capture):
+        try:
+            index = self.start_frame
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                batch = []
+                while len(batch) < self.batch_size:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    batch.append((index, frame))
+                    index += 1
+                self.stage_seconds['decode'] += time.perf_counter() - start
+                if batch and not self._put(self._decoded, batch):
+                    return
+                if len(batch) < self.batch_size:
+                    break
+            self._put(self._decoded, _DONE)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            capture.release()
+
+    def _inference_loop(self):
+        try:
+            while True:
+                batch = self._get(self._decoded)
+                if batch is _DONE:
+                    break
+                start = time.perf_counter()
+                frames = [frame for _, frame in batch]
+                if self.tracking is not None:
+                    results = self._track_batch(frames)
+                else:
+                    results = self.camera.infer_batch(frames)
+                self.stage_seconds['inference'] += time.perf_counter() - start
+                if not self._put(self._inferred, [(index, result) for (index, _), result in zip(batch, results)]):
+                    return
+            self._put(self._inferred, _DONE)
+        except Exception as e:
+            self._fail(e)
+
+    def _track_batch(self, frames):
+        # Detection follows the tracker's schedule frame by frame; depth stays batched
+        tracked = [self.tracking.detect(frame) for frame in frames]
+        depth_maps = self.camera.estimate_depth_batch(frames)
+        results = []
+        for frame, (detections, track_ids), depth_map in zip(frames, tracked, depth_maps):
+            result = InferenceResult(frame, detections, self.camera.class_names, depth_map)
+            result.track_ids = track_ids
+            results.append(result)
+        return results
+
+    def _encode_loop(self, writer_factory, fps):
+        writer = None
+        try:
+            with open(self.jsonl_path, 'a') as jsonl:
+                while True:
+                    batch = self._get(self._inferred)
+                    if batch is _DONE:
+                        break
+                    start = time.perf_counter()
+                    for index, result in batch:
+                        if writer_factory is not None:
+                            image = self._render(result)
+                            if writer is None:
+                                writer = writer_factory(image.shape[1], image.shape[0])
+                            writer.write(image)
+                        record = {'frame': index, 'time': round(index / fps, 4) if fps else None,
+                                  'detections': result.detection_dicts()}
+                        jsonl.write(json.dumps(record) + '\n')
+                    jsonl.flush()
+                    self.frames_done += len(batch)
+                    self.stage_seconds['encode'] += time.perf_counter() - start
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def _render(self, result):
+        # Frames are written out right away, so one buffer is reused for every frame
+        self._buffer = result.render(preview_size(result.frame.shape, self.render_width), out=self._buffer)
+        return self._buffer
+
+    def run(self, progress=None, progress_interval=5.0):
+        """Process the video; progress(frames_done, total_frames, fps) is called periodically.
+
+        Returns the number of frames processed by this run.
+        """
+        capture = cv2.VideoCapture(self.video_path)
+        if not capture.isOpened():
+            raise IOError(f"Could not open video {self.video_path!r}")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.total_frames = total or None
+        # grab() skips frames without decoding them into images
+        for _ in range(self.start_frame):
+            if not capture.grab():
+                break
+
+        writer_factory = None
+        if self.output_video:
+            path = segment_path(self.output_video, self.start_frame)
+            fourcc = cv2.VideoWriter_fourcc(*Config.VIDEO_FOURCC)
+
+            def writer_factory(width, height):
+                return cv2.VideoWriter(path, fourcc, fps or 30.0, (width, height))
+
+        threads = [
+            threading.Thread(target=self._decode_loop, args=(capture,), name='video-decode', daemon=True),
+            threading.Thread(target=self._inference_loop, name='video-inference', daemon=True),
+            threading.Thread(target=self._encode_loop, args=(writer_factory, fps),
+                             name='video-encode', daemon=True),
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while threads[-1].is_alive():
+                threads[-1].join(timeout=progress_interval)
+                if progress is not None:
+                    elapsed = time.perf_counter() - started
+                    progress(self.start_frame + self.frames_done, self.total_frames,
+                             self.frames_done / elapsed if elapsed else 0.0)
+        except KeyboardInterrupt:
+            # Frames already in the JSONL file are kept; --resume continues after them
+            self._stop.set()
+            raise
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            self.fps = self.frames_done / elapsed if elapsed else 0.0
+        if self._errors:
+            raise self._errors[0]
+        return self.frames_done
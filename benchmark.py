@@ -0,0 +1,1288 @@
+import argparse
+import io
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+class CountingModel:
+    """Wraps a model and counts how many times it is called"""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.model(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def synthetic_image(width, height, seed=0):
+    """Generate a reproducible random BGR image"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def bench_forward_passes(image, requests_count):
+    """Check that each /api/detect request runs YOLO and MiDaS exactly once"""
+    import api
+
+    api.camera.ensure_loaded()
+    yolo = CountingModel(api.camera.yolo_model)
+    midas = CountingModel(api.camera.midas)
+    api.camera.yolo_model, api.camera.midas = yolo, midas
+    # The same image is sent every time, so bypass the result cache
+    cache, api.scheduler.cache = api.scheduler.cache, None
+
+    _, buffer = cv2.imencode('.jpg', image)
+    client = api.app.test_client()
+    latencies = []
+    try:
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            response = client.post('/api/detect', data={
+                'image': (io.BytesIO(buffer.tobytes()), 'bench.jpg')
+            })
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"Request failed: {response.get_data(as_text=True)}")
+    finally:
+        api.camera.yolo_model, api.camera.midas = yolo.model, midas.model
+        api.scheduler.cache = cache
+
+    print(f"Requests: {requests_count}")
+    print(f"YOLO forward passes per image: {yolo.calls / requests_count:.2f}")
+    print(f"MiDaS forward passes per image: {midas.calls / requests_count:.2f}")
+    print(f"Mean latency: {1000 * np.mean(latencies):.1f} ms")
+    return yolo.calls == requests_count and midas.calls == requests_count
+
+
+def bench_pipeline_modes(image, iterations):
+    """Compare serial and parallel execution of YOLO and MiDaS in Camera.infer"""
+    from app.camera import Camera
+
+    camera = Camera(loading='eager')
+    results = {}
+    for mode in ('serial', 'parallel'):
+        camera.pipeline_mode = mode
+        camera.infer(image)  # warm-up
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            camera.infer(image)
+            latencies.append(time.perf_counter() - start)
+        results[mode] = float(np.median(latencies))
+        print(f"{mode:>8}: median {1000 * results[mode]:.1f} ms over {iterations} runs")
+
+    print(f"Parallel speedup: {results['serial'] / results['parallel']:.2f}x")
+    return results
+
+
+def bench_batching(image, concurrency, requests_count, batch_sizes):
+    """Throughput of the micro-batching scheduler under concurrent submissions"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.camera import Camera
+    from app.scheduler import InferenceScheduler
+
+    camera = Camera(loading='eager')
+    camera.infer(image)  # warm-up
+    for batch_size in batch_sizes:
+        scheduler = InferenceScheduler(camera, max_batch_size=batch_size)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: scheduler.submit(image), range(requests_count)))
+        elapsed = time.perf_counter() - start
+        print(f"max batch {batch_size:>3}: {requests_count / elapsed:.2f} images/s "
+              f"({concurrency} concurrent clients)")
+
+
+def synthetic_video(path, width, height, frames=90, fps=30):
+    """Write a short synthetic video with a moving square for offline stream tests"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    background = synthetic_image(width, height)
+    for i in range(frames):
+        frame = background.copy()
+        x = (i * 5) % max(1, width - 100)
+        cv2.rectangle(frame, (x, height // 3), (x + 100, height // 3 + 100), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def bench_stream(video_path, realtime):
+    """Run the MJPEG streaming engine over a video file and report FPS and latency"""
+    import threading
+    from app.camera import Camera
+    from app.stream import StreamEngine
+
+    camera = Camera(loading='eager')
+    engine = StreamEngine(camera, source=video_path, realtime=realtime)
+    chunks = []
+
+    def consume():
+        for chunk in engine.frames():
+            chunks.append(len(chunk))
+
+    engine.start()
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    engine.wait()
+    consumer.join()
+
+    stats = engine.stats()
+    print(f"Frames captured: {stats['frames_captured']}, processed: {stats['frames_processed']}, "
+          f"dropped: {stats['frames_dropped']}, depth runs: {stats['depth_runs']}")
+    print(f"Sustained FPS: {stats['fps']:.2f}")
+    if stats['latency_ms_mean'] is not None:
+        print(f"End-to-end latency: mean {stats['latency_ms_mean']:.1f} ms, "
+              f"p95 {stats['latency_ms_p95']:.1f} ms")
+    print(f"MJPEG chunks delivered: {len(chunks)}")
+    return stats
+
+
+def read_video_frames(video_path, max_frames):
+    capture = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def bench_depth_keyframes(video_path, max_frames, intervals, threshold):
+    """FPS gain and depth error of keyframe depth against running MiDaS on every frame"""
+    from app.camera import Camera
+    from app.keyframes import KeyframeDepth
+
+    camera = Camera(loading='eager')
+    frames = read_video_frames(video_path, max_frames)
+    if not frames:
+        raise SystemExit(f"Error: no frames read from {video_path}")
+    camera.estimate_depth(frames[0])  # warm-up
+
+    start = time.perf_counter()
+    reference = [camera.estimate_depth(frame) for frame in frames]
+    baseline_fps = len(frames) / (time.perf_counter() - start)
+    print(f"Every frame: {baseline_fps:.2f} FPS over {len(frames)} frames")
+
+    for interval in intervals:
+        for update in ('reuse', 'shift'):
+            keyframes = KeyframeDepth(camera, interval=interval, threshold=threshold, update=update)
+            start = time.perf_counter()
+            depth_maps = [keyframes.estimate(frame) for frame in frames]
+            fps = len(frames) / (time.perf_counter() - start)
+            error = np.mean([np.abs(d - r).mean() for d, r in zip(depth_maps, reference)])
+            print(f"K={interval:<3} {update:<6} {fps:8.2f} FPS ({fps / baseline_fps:.2f}x), "
+                  f"keyframes {keyframes.keyframes:>4}, mean abs depth error {error:.4f}")
+
+
+def id_switches(reference, candidate, iou_threshold=0.5):
+    """ID switches of candidate tracks against reference tracks, MOT-style.
+
+    Both are per-frame (detections, track_ids) lists. Boxes are matched per
+    frame (same class, IoU >= threshold); a switch is a reference track
+    matched to a different candidate id than the last time it was matched.
+    Returns (switches, matched boxes, reference boxes).
+    """
+    from app.tracking import assign, box_iou
+
+    last_match = {}
+    switches = matched = total = 0
+    for (ref_boxes, ref_ids), (boxes, ids) in zip(reference, candidate):
+        total += len(ref_ids)
+        iou = box_iou(ref_boxes[:, :4], boxes[:, :4])
+        iou[ref_boxes[:, 5][:, None] != boxes[:, 5][None, :]] = 0
+        rows, cols = assign(iou, iou_threshold)
+        matched += len(rows)
+        for ref_id, track_id in zip(ref_ids[rows], ids[cols]):
+            if last_match.get(ref_id, track_id) != track_id:
+                switches += 1
+            last_match[ref_id] = track_id
+    return switches, matched, total
+
+
+def bench_tracking(video_path, max_frames, intervals):
+    """FPS gain and ID-switch rate of tracked detection against YOLO on every frame.
+
+    The reference runs YOLO on every frame through the same tracker, so its
+    ids serve as ground truth; recall is the share of its boxes the
+    scheduled run reproduces.
+    """
+    from app.camera import Camera
+    from app.tracking import TrackedDetection
+
+    camera = Camera(loading='eager')
+    frames = read_video_frames(video_path, max_frames)
+    if not frames:
+        raise SystemExit(f"Error: no frames read from {video_path}")
+    camera.detect_objects(frames[0])  # warm-up
+
+    every_frame = TrackedDetection(camera, max_interval=1)
+    start = time.perf_counter()
+    reference = [every_frame.detect(frame) for frame in frames]
+    baseline_fps = len(frames) / (time.perf_counter() - start)
+    print(f"Every frame: {baseline_fps:.2f} FPS over {len(frames)} frames, "
+          f"{len({track_id for _, ids in reference for track_id in ids})} tracks")
+
+    for interval in intervals:
+        tracking = TrackedDetection(camera, max_interval=interval)
+        start = time.perf_counter()
+        tracked = [tracking.detect(frame) for frame in frames]
+        fps = len(frames) / (time.perf_counter() - start)
+        switches, matched, total = id_switches(reference, tracked)
+        print(f"max K={interval:<3} {fps:8.2f} FPS ({fps / baseline_fps:.2f}x), "
+              f"YOLO on {tracking.detections_run:>4} frames, "
+              f"ID switches {switches} ({100 * switches / max(matched, 1):.2f}% of matches), "
+              f"recall {matched / max(total, 1):.3f}")
+
+
+def bench_depth_resolution(image, iterations):
+    """Latency and NumPy peak memory of full vs network-resolution depth on one image"""
+    import tracemalloc
+    from app.camera import Camera
+    from app.models import InferenceResult
+
+    camera = Camera(loading='eager')
+    detections = camera.detect_objects(image)
+    for mode in ('full', 'network'):
+        full_resolution = mode == 'full'
+        camera.estimate_depth_batch([image], full_resolution=full_resolution)  # warm-up
+        latencies = []
+        tracemalloc.start()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            depth_map = camera.estimate_depth_batch([image], full_resolution=full_resolution)[0]
+            result = InferenceResult(image, detections, camera.class_names, depth_map)
+            result.depth_boxes()
+            latencies.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{mode:>8}: depth {depth_map.shape[1]}x{depth_map.shape[0]}, "
+              f"median {1000 * np.median(latencies):.1f} ms, NumPy peak {peak / 2**20:.1f} MiB")
+
+
+def bench_tiling(image, iterations):
+    """Detections found, latency and peak traced memory of single-pass vs tiled detection"""
+    import tracemalloc
+    from app.camera import Camera
+    from config import Config
+
+    camera = Camera(loading='eager')
+    tiling = Config.DETECTION_TILING
+    print(f"Image {image.shape[1]}x{image.shape[0]}")
+    try:
+        for mode in ('off', 'auto', 'always'):
+            Config.DETECTION_TILING = mode
+            camera.detect_objects(image)  # warm-up
+            latencies = []
+            tracemalloc.start()
+            for _ in range(iterations):
+                start = time.perf_counter()
+                detections = camera.detect_objects(image)
+                latencies.append(time.perf_counter() - start)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            small = int(np.sum(np.minimum(detections[:, 2] - detections[:, 0],
+                                          detections[:, 3] - detections[:, 1]) < 64)) if len(detections) else 0
+            print(f"{mode:>7}: {len(detections):4d} detections ({small} under 64 px), "
+                  f"median {1000 * np.median(latencies):.1f} ms, NumPy peak {peak / 2**20:.1f} MiB")
+    finally:
+        Config.DETECTION_TILING = tiling
+
+
+RESPONSE_MODES = [
+    ('default', {}),
+    ('detections only', {'image': 'false'}),
+    ('png16 depth', {'image': 'false', 'depth': 'png16'}),
+    ('npy depth', {'image': 'false', 'depth': 'npy'}),
+    ('multipart', {'format': 'multipart', 'depth': 'png16'}),
+    ('jpeg only', {'format': 'jpeg'}),
+    ('small preview', {'max_width': '640', 'jpeg_quality': '70'}),
+]
+
+
+def bench_response_modes(image, iterations):
+    """Response size and CPU time spent building the response, per output mode"""
+    from flask import Flask
+    from app.camera import Camera
+    from app.models import InferenceResult
+    from app.responses import ResponseOptions, detection_response
+
+    camera = Camera(loading='eager')
+    base = camera.infer(image)
+    app = Flask(__name__)
+    for name, values in RESPONSE_MODES:
+        options = ResponseOptions.from_values(values)
+        cpu_times = []
+        with app.test_request_context():
+            for _ in range(iterations):
+                # A fresh result per run so the rendered overlay is not cached
+                result = InferenceResult(base.frame, base.detections, base.class_names, base.depth_map)
+                start = time.process_time()
+                body = detection_response(result, options).get_data()
+                cpu_times.append(time.process_time() - start)
+        print(f"{name:<16} {len(body) / 1024:9.1f} KiB  {1000 * np.median(cpu_times):7.2f} ms CPU")
+
+
+QUERY_MODES = [
+    ('all classes', {}),
+    ('people only', {'classes': 'person'}),
+    ('people, conf 0.6', {'classes': 'person', 'conf': '0.6'}),
+    ('top 5', {'max_det': '5'}),
+    ('roi', {'roi': None}),
+    ('people in roi', {'classes': 'person', 'roi': None}),
+]
+
+
+def bench_queries(image, iterations, roi):
+    """Inference latency, detections and response size of narrowed queries (classes, thresholds, roi)"""
+    from flask import Flask
+    from app.camera import Camera
+    from app.models import InferenceOptions
+    from app.responses import detection_response
+
+    camera = Camera(loading='eager')
+    height, width = image.shape[:2]
+    roi = roi or [width // 4, height // 4, 3 * width // 4, 3 * height // 4]
+    app = Flask(__name__)
+    print(f"Image {width}x{height}, roi {','.join(map(str, roi))}")
+    for name, values in QUERY_MODES:
+        if 'roi' in values:
+            values = {**values, 'roi': ','.join(map(str, roi))}
+        options = InferenceOptions.from_values(values, camera.class_names)
+        frame, source_roi = options.crop(image)
+        camera.infer(frame, options)  # warm-up
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            result = camera.infer(frame, options)
+            latencies.append(time.perf_counter() - start)
+        result.source_roi = source_roi
+        with app.test_request_context():
+            body = detection_response(result).get_data()
+        print(f"{name:<17} {1000 * np.median(latencies):8.1f} ms  {len(result.detections):4d} detections  "
+              f"{len(body) / 1024:8.1f} KiB")
+
+
+COLD_START_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+status = api.app.test_client().get('/api/health').get_json()['status']
+health = time.perf_counter()
+api.camera.ensure_loaded()
+ready = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'first_health_s': health - start,
+                  'first_health_status': status, 'ready_s': ready - start}))
+"""
+
+
+def bench_cold_start(runs):
+    """Time-to-health and time-to-ready of a fresh API process"""
+    import json
+    import subprocess
+    import sys
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT], cwd=project_dir,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    for key in ('import_s', 'first_health_s', 'ready_s'):
+        values = [sample[key] for sample in samples]
+        print(f"{key:<15} median {np.median(values):.3f} s  (min {min(values):.3f}, max {max(values):.3f})")
+    print(f"First health status: {samples[0]['first_health_status']}")
+    return samples
+
+
+def detection_agreement(reference, candidate, iou_threshold=0.5):
+    """F1 of candidate detections against reference ones (same class, IoU >= threshold)"""
+    from app.tracking import box_iou
+
+    if not len(reference) and not len(candidate):
+        return 1.0
+    if not len(reference) or not len(candidate):
+        return 0.0
+    iou = box_iou(reference[:, :4], candidate[:, :4])
+    iou[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0
+    matched = 0
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return 2 * matched / (len(reference) + len(candidate))
+
+
+def bench_backends(images, backend_names):
+    """Accuracy vs speed of each inference backend against eager torch on a local image set"""
+    from app.camera import Camera
+    from config import Config
+
+    reference = None
+    print(f"{'backend':<18} {'YOLO ms':>9} {'MiDaS ms':>9} {'det F1':>7} {'depth MAE':>10}")
+    for backend in ['torch'] + [name for name in backend_names if name != 'torch']:
+        Config.DETECTION_BACKEND = Config.DEPTH_BACKEND = backend
+        camera = Camera(loading='eager')
+        camera.infer(images[0])  # warm-up
+        detections, depth_maps, yolo_times, midas_times = [], [], [], []
+        for image in images:
+            start = time.perf_counter()
+            detections.append(camera.detect_objects(image))
+            yolo_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            depth_maps.append(camera.estimate_depth_batch([image], full_resolution=False)[0])
+            midas_times.append(time.perf_counter() - start)
+        if reference is None:
+            reference = (detections, depth_maps)
+        f1 = np.mean([detection_agreement(r, d) for r, d in zip(reference[0], detections)])
+        depth_error = np.mean([np.abs(r - d).mean() for r, d in zip(reference[1], depth_maps)])
+        print(f"{backend:<18} {1000 * np.median(yolo_times):9.1f} {1000 * np.median(midas_times):9.1f} "
+              f"{f1:7.3f} {depth_error:10.4f}")
+    Config.DETECTION_BACKEND = Config.DEPTH_BACKEND = 'torch'
+
+
+def _stage(stats, name, fn, *args):
+    """Run one preprocessing stage, recording its time and traced allocations"""
+    import tracemalloc
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = fn(*args)
+    elapsed = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    entry = stats.setdefault(name, {'ms': [], 'blocks': [], 'peak': []})
+    entry['ms'].append(1000 * elapsed)
+    entry['blocks'].append(blocks)
+    entry['peak'].append(peak)
+    return output
+
+
+def draw_overlay_per_box(frame, detections, class_names, depth_map):
+    """The overlay drawn box by box with text layout per label, for comparison with OverlayRenderer"""
+    processed_frame = frame.copy()
+    for x1, y1, x2, y2, conf, cls in detections:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        cv2.rectangle(processed_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f'{class_names[int(cls)]}: {conf:.2f}'
+        label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+        cv2.rectangle(processed_frame, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), (0, 255, 0), -1)
+        cv2.putText(processed_frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+    depth_colored = cv2.applyColorMap((depth_map * 255).astype(np.uint8), cv2.COLORMAP_MAGMA)
+    if depth_colored.shape[:2] != frame.shape[:2]:
+        depth_colored = cv2.resize(depth_colored, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_LINEAR)
+    cv2.putText(depth_colored, 'Depth Map', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    return np.hstack([processed_frame, depth_colored])
+
+
+def bench_overlay(image, counts, iterations, preview_width):
+    """Overlay render time by number of detections: per-box drawing vs the cached renderer.
+
+    Detections are random boxes over the image (no models run); the depth
+    map is random at MiDaS output resolution.
+    """
+    from app.overlay import OverlayRenderer, preview_size
+
+    height, width = image.shape[:2]
+    rng = np.random.default_rng(0)
+    depth_map = rng.random((256, 256), dtype=np.float32)
+    class_names = {i: f'class{i}' for i in range(80)}
+    renderer = OverlayRenderer()
+    panel_size = preview_size(image.shape, preview_width)
+    print(f"Image {width}x{height}, median of {iterations} runs"
+          + (f", preview {2 * panel_size[0]}x{panel_size[1]}" if panel_size else ''))
+    for count in counts:
+        corners = rng.uniform(0, [width * 0.9, height * 0.9], (count, 2))
+        sizes = rng.uniform(20, max(21, min(width, height) / 5), (count, 2))
+        detections = np.concatenate([corners, np.minimum(corners + sizes, [width - 1, height - 1]),
+                                     rng.uniform(0.25, 1.0, (count, 1)), rng.integers(0, 80, (count, 1))],
+                                    axis=1).astype(np.float32)
+        out = None
+        timings = {}
+        for name in ('per-box', 'renderer', 'renderer+out'):
+            samples = []
+            for _ in range(iterations + 1):
+                start = time.perf_counter()
+                if name == 'per-box':
+                    draw_overlay_per_box(image, detections, class_names, depth_map)
+                else:
+                    rendered = renderer.render(image, detections, class_names, depth_map,
+                                               panel_size=panel_size, out=out)
+                    if name == 'renderer+out':
+                        out = rendered
+                samples.append(time.perf_counter() - start)
+            # The first run is the warm-up (and fills the sprite cache)
+            timings[name] = 1000 * np.median(samples[1:])
+        print(f"{count:>5} detections: " + ', '.join(f"{name} {ms:.1f} ms" for name, ms in timings.items())
+              + f" ({timings['per-box'] / timings['renderer']:.2f}x)")
+
+
+def bench_preprocess(image, iterations):
+    """Per-stage time and allocations of the old per-model preprocessing vs the shared stage.
+
+    Only preprocessing runs (no models): decoding the upload, building the
+    YOLO input and building the MiDaS input.
+    """
+    from app.backends import letterbox
+    from app.preprocess import DepthInputs, SharedFrame, decode_image
+    from app.registry import midas_small_transform
+
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    img_bytes = encoded.tobytes()
+    depth_inputs = DepthInputs()
+
+    def old_path(stats):
+        frame = _stage(stats, 'decode', lambda: cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR))
+        _stage(stats, 'yolo input', letterbox, frame)
+        _stage(stats, 'midas input', lambda: midas_small_transform(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+
+    def new_path(stats):
+        frame, _ = _stage(stats, 'decode', decode_image, img_bytes)
+        shared = _stage(stats, 'shared resize', SharedFrame, frame)
+        _stage(stats, 'yolo input', letterbox, shared.buffer)
+        _stage(stats, 'midas input', depth_inputs.prepare, [shared.buffer])
+
+    print(f"Image {image.shape[1]}x{image.shape[0]}, JPEG {len(img_bytes) / 1024:.0f} KiB, "
+          f"{iterations} iterations (median per stage)")
+    for name, path in (('separate', old_path), ('shared', new_path)):
+        path({})  # warm-up
+        stats = {}
+        for _ in range(iterations):
+            path(stats)
+        print(f"\n{name}:")
+        print(f"  {'stage':<14} {'ms':>8} {'blocks':>8} {'peak MiB':>9}")
+        for stage, entry in stats.items():
+            print(f"  {stage:<14} {np.median(entry['ms']):8.2f} {int(np.median(entry['blocks'])):8d} "
+                  f"{np.median(entry['peak']) / 2**20:9.2f}")
+        total = sum(np.median(entry['ms']) for entry in stats.values())
+        print(f"  {'total':<14} {total:8.2f}")
+    print(f"\nMiDaS input tensors allocated by DepthInputs: {depth_inputs.allocations}")
+
+
+def _memory_mib(pid):
+    """(RSS, PSS) of a process in MiB; PSS splits shared pages between the processes sharing them"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in ('Rss:', 'Pss:'):
+                values[fields[0][:-1]] = int(fields[1]) / 1024
+    return values['Rss'], values['Pss']
+
+
+def _child_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def bench_workers(image, worker_counts, modes, concurrency, duration, port):
+    """Throughput and per-worker memory of the pre-forked gunicorn server by worker count (Linux).
+
+    'preload' loads the models in the master and forks the workers from it;
+    'per-worker' has every worker load its own copy. The result cache is
+    disabled so every request runs inference.
+    """
+    import subprocess
+    import sys
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    url = f'http://127.0.0.1:{port}'
+    _, encoded = cv2.imencode('.jpg', image)
+    body = encoded.tobytes()
+
+    def client(deadline):
+        latencies = []
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = session.post(f'{url}/api/detect', files={'image': ('bench.jpg', body)},
+                                        data={'image': 'false'})
+                if response.status_code != 200:
+                    raise RuntimeError(f"Request failed: {response.text}")
+                latencies.append(time.perf_counter() - start)
+        return latencies
+
+    print(f"{concurrency} concurrent clients, {duration:.0f} s per run, {os.cpu_count()} cores")
+    print(f"{'mode':<11} {'workers':>7} {'img/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'worker RSS':>11} {'worker PSS':>11} {'total PSS':>10}")
+    for mode in modes:
+        for workers in worker_counts:
+            env = dict(os.environ, SERVE_WORKERS=str(workers), SERVE_PRELOAD='1' if mode == 'preload' else '0',
+                       BIND=f'127.0.0.1:{port}', RESULT_CACHE_ENABLED='0')
+            server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'api:app'],
+                                      cwd=project_dir, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                # Every worker answers health once its models are loaded; wait
+                # until all of them have, then warm each one up
+                ready = set()
+                deadline = time.perf_counter() + 600
+                while len(ready) < workers:
+                    if server.poll() is not None or time.perf_counter() > deadline:
+                        raise RuntimeError(f"gunicorn with {workers} workers did not become ready")
+                    try:
+                        response = requests.get(f'{url}/api/health', timeout=5)
+                        if response.status_code == 200:
+                            ready.add(response.json().get('worker', {}).get('pid'))
+                    except requests.RequestException:
+                        pass
+                    time.sleep(0.2)
+                client(time.perf_counter() + 2)
+
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    start = time.perf_counter()
+                    runs = list(pool.map(client, [start + duration] * concurrency))
+                    elapsed = time.perf_counter() - start
+                latencies = [latency for run in runs for latency in run]
+
+                memory = [_memory_mib(pid) for pid in _child_pids(server.pid)]
+                master_pss = _memory_mib(server.pid)[1]
+                worker_rss = np.mean([rss for rss, _ in memory])
+                worker_pss = np.mean([pss for _, pss in memory])
+                total_pss = master_pss + sum(pss for _, pss in memory)
+                print(f"{mode:<11} {workers:>7} {len(latencies) / elapsed:7.2f} "
+                      f"{1000 * np.percentile(latencies, 50):8.1f} {1000 * np.percentile(latencies, 95):8.1f} "
+                      f"{worker_rss:8.0f} MiB {worker_pss:7.0f} MiB {total_pss:6.0f} MiB")
+            finally:
+                server.terminate()
+                server.wait()
+
+
+def bench_metrics(image, requests_count):
+    """Per-stage mean time from the /metrics histograms, and request latency with metrics on vs off"""
+    import api
+    from app import metrics
+    from config import Config
+
+    api.camera.ensure_loaded()
+    # The same image is sent every time, so bypass the result cache
+    cache, api.scheduler.cache = api.scheduler.cache, None
+    _, buffer = cv2.imencode('.jpg', image)
+    client = api.app.test_client()
+
+    def run():
+        latencies = []
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            response = client.post('/api/detect', data={'image': (io.BytesIO(buffer.tobytes()), 'bench.jpg')})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"Request failed: {response.get_data(as_text=True)}")
+        return latencies
+
+    enabled = Config.METRICS_ENABLED
+    try:
+        run()  # warm-up
+        results = {}
+        for setting in (False, True, False, True):
+            Config.METRICS_ENABLED = setting
+            results.setdefault(setting, []).extend(run())
+    finally:
+        Config.METRICS_ENABLED = enabled
+        api.scheduler.cache = cache
+
+    print(f"{'stage':<18} {'count':>6} {'mean ms':>8}")
+    with metrics.STAGE_SECONDS._lock:
+        series = dict(metrics.STAGE_SECONDS._series)
+    for name, (_, total, count) in series.items():
+        print(f"{name:<18} {count:6d} {1000 * total / count:8.2f}")
+    off, on = np.median(results[False]), np.median(results[True])
+    print(f"\nMedian request latency: metrics off {1000 * off:.1f} ms, on {1000 * on:.1f} ms "
+          f"({100 * (on - off) / off:+.2f}%)")
+
+
+def use_simulated_models(stand_in_ms=None):
+    """Make --stand-in runs use app.simulated.SimulatedCamera (call before importing api).
+
+    stand_in_ms, if given, is the simulated cost of a full-size image per
+    model, without per-call overhead; the other SIM_* settings apply as set.
+    """
+    from config import Config
+
+    Config.SIMULATED_INFERENCE = True
+    if stand_in_ms is not None:
+        Config.SIM_CALL_MS = 0.0
+        Config.SIM_DETECTION_MS = Config.SIM_DEPTH_MS = stand_in_ms
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def _rss_mib():
+    """(current, peak) resident set size of this process in MiB"""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        current = peak
+    return current, peak
+
+
+def _latency_record(suite, name, resolution, concurrency, latencies, elapsed, **extra):
+    current, peak = _rss_mib()
+    latencies_ms = 1000 * np.asarray(latencies)
+    return {
+        'suite': suite, 'name': name, 'resolution': resolution, 'concurrency': concurrency,
+        'count': len(latencies),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'throughput': len(latencies) / elapsed,
+        'rss_mib': current, 'peak_rss_mib': peak,
+        **extra,
+    }
+
+
+def _print_record(record):
+    print(f"{record['suite']:<7} {record['name']:<16} {record['resolution']:>10} {record['concurrency']:>4} "
+          f"{record['p50_ms']:9.1f} {record['p95_ms']:9.1f} {record['p99_ms']:9.1f} "
+          f"{record['throughput']:8.2f} {record['rss_mib']:8.0f}")
+
+
+def _print_header():
+    print(f"{'suite':<7} {'name':<16} {'resolution':>10} {'conc':>4} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per s':>8} {'RSS MiB':>8}")
+
+
+def _timed_calls(fn, inputs, concurrency):
+    """Call fn on every input from `concurrency` threads; returns (latencies, elapsed)"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = [timed(item) for item in inputs]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed, inputs))
+    return latencies, time.perf_counter() - start
+
+
+def bench_camera(resolutions, iterations, concurrency_levels, stand_in, stand_in_ms):
+    """Camera.detect_objects, estimate_depth and process_frame per resolution, alone and concurrently.
+
+    Each method is timed alone on synthetic images. Concurrent load goes
+    through the InferenceScheduler (submit and render), the way the API
+    runs it, since the models are not called from several threads at once.
+    """
+    from app.camera import Camera
+    from app.scheduler import InferenceScheduler
+
+    if stand_in:
+        use_simulated_models(stand_in_ms)
+        from app.simulated import SimulatedCamera
+        camera = SimulatedCamera(loading='eager')
+    else:
+        camera = Camera(loading='eager')
+    scheduler = InferenceScheduler(camera)
+    records = []
+    _print_header()
+    for width, height in resolutions:
+        resolution = f'{width}x{height}'
+        images = [synthetic_image(width, height, seed) for seed in range(iterations)]
+        camera.process_frame(images[0])  # warm-up
+        for name, method in (('detect_objects', camera.detect_objects),
+                             ('estimate_depth', camera.estimate_depth),
+                             ('process_frame', camera.process_frame)):
+            latencies, elapsed = _timed_calls(method, images, 1)
+            records.append(_latency_record('camera', name, resolution, 1, latencies, elapsed))
+            _print_record(records[-1])
+        for concurrency in concurrency_levels:
+            inputs = images * max(1, concurrency)
+            latencies, elapsed = _timed_calls(lambda image: scheduler.submit(image).rendered,
+                                              inputs, concurrency)
+            records.append(_latency_record('camera', 'scheduled_frame', resolution, concurrency,
+                                           latencies, elapsed))
+            _print_record(records[-1])
+    return records
+
+
+LOAD_MODES = {
+    'full': {},
+    'lean': {'image': 'false'},
+}
+
+
+def bench_load(resolutions, concurrency_levels, requests_count, modes, stand_in, stand_in_ms, port):
+    """Load-test /api/detect over real HTTP with concurrent clients, per resolution and response mode.
+
+    The API runs in-process on a threaded werkzeug server; every request
+    sends a distinct image and the result cache is bypassed.
+    """
+    import threading
+    import requests
+    from werkzeug.serving import make_server
+
+    if stand_in:
+        use_simulated_models(stand_in_ms)
+    import api
+
+    api.camera.ensure_loaded()
+    cache, api.scheduler.cache = api.scheduler.cache, None
+    server = make_server('127.0.0.1', port, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{port}/api/detect'
+    local = threading.local()
+
+    def post(item):
+        body, values = item
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        response = session.post(url, files={'image': ('bench.jpg', body)}, data=values)
+        if response.status_code != 200:
+            raise RuntimeError(f"Request failed: {response.text}")
+
+    records = []
+    _print_header()
+    try:
+        for width, height in resolutions:
+            resolution = f'{width}x{height}'
+            bodies = [cv2.imencode('.jpg', synthetic_image(width, height, seed))[1].tobytes()
+                      for seed in range(requests_count)]
+            for mode in modes:
+                values = LOAD_MODES[mode]
+                post((bodies[0], values))  # warm-up
+                for concurrency in concurrency_levels:
+                    latencies, elapsed = _timed_calls(post, [(body, values) for body in bodies], concurrency)
+                    records.append(_latency_record('load', f'detect_{mode}', resolution, concurrency,
+                                                   latencies, elapsed))
+                    _print_record(records[-1])
+    finally:
+        server.shutdown()
+        api.scheduler.cache = cache
+    return records
+
+
+def bench_session(resolutions, frames_count, concurrency_levels, stand_in, stand_in_ms, port):
+    """Per-frame round trip of /api/session (binary WebSocket) vs POST /api/detect, per resolution.
+
+    Every client sends a moving sequence of frames (a shifted image, like
+    video) and waits for each result before sending the next, so the
+    latencies are full round trips. Needs flask-sock. The result cache is
+    bypassed.
+    """
+    import threading
+    import requests
+    import simple_websocket
+    from werkzeug.serving import make_server
+
+    if stand_in:
+        use_simulated_models(stand_in_ms)
+    import api
+    from app.sessions import FRAME_HEADER
+
+    if api.Sock is None:
+        raise SystemExit("Error: /api/session needs flask-sock (pip install flask-sock)")
+    api.camera.ensure_loaded()
+    cache, api.scheduler.cache = api.scheduler.cache, None
+    server = make_server('127.0.0.1', port, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{port}'
+
+    def post(values):
+        local = threading.local()
+
+        def call(item):
+            index, body = item
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            response = session.post(f'{url}/api/detect', files={'image': ('bench.jpg', body)}, data=values)
+            if response.status_code != 200:
+                raise RuntimeError(f"Request failed: {response.text}")
+            return len(response.content)
+        return call
+
+    def websocket():
+        local = threading.local()
+        connections = []
+
+        def call(item):
+            index, body = item
+            ws = getattr(local, 'ws', None)
+            if ws is None:
+                ws = local.ws = simple_websocket.Client(f'ws://127.0.0.1:{port}/api/session')
+                connections.append(ws)
+                ws.receive()  # session description
+            ws.send(FRAME_HEADER.pack(index) + body)
+            result = ws.receive()
+            if isinstance(result, str):
+                raise RuntimeError(f"Frame failed: {result}")
+            return len(result)
+        return call, connections
+
+    records = []
+    _print_header()
+    try:
+        for width, height in resolutions:
+            resolution = f'{width}x{height}'
+            base = synthetic_image(width + frames_count, height)
+            bodies = [cv2.imencode('.jpg', base[:, i:i + width])[1].tobytes() for i in range(frames_count)]
+            for name in ('post_full', 'post_lean', 'websocket'):
+                for concurrency in concurrency_levels:
+                    connections = []
+                    if name == 'websocket':
+                        call, connections = websocket()
+                    else:
+                        call = post({} if name == 'post_full' else {'image': 'false'})
+                    sizes = []
+                    call((0, bodies[0]))  # warm-up
+                    latencies, elapsed = _timed_calls(lambda item: sizes.append(call(item)),
+                                                      list(enumerate(bodies)), concurrency)
+                    for ws in connections:
+                        ws.close()
+                    records.append(_latency_record('session', name, resolution, concurrency, latencies, elapsed,
+                                                   response_bytes=float(np.mean(sizes))))
+                    _print_record(records[-1])
+                    print(f"{'':<24} mean response {np.mean(sizes) / 1024:.1f} KiB")
+    finally:
+        server.shutdown()
+        api.scheduler.cache = cache
+    return records
+
+
+def bench_slo(target_ms, phases, duration, stand_in, stand_in_ms, port):
+    """Load generator for admission control: closed-loop clients in phases of rising and falling load.
+
+    Each phase runs `concurrency` clients posting /api/detect back to back for
+    `duration` seconds. Per phase it reports the latency of answered requests,
+    the share shed with 503 and the quality levels the answers came back at.
+    """
+    import collections
+    import threading
+    import requests
+    from werkzeug.serving import make_server
+
+    if stand_in:
+        use_simulated_models(stand_in_ms)
+    import api
+
+    api.camera.ensure_loaded()
+    api.admission.target = target_ms / 1000.0
+    cache, api.scheduler.cache = api.scheduler.cache, None
+    server = make_server('127.0.0.1', port, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{port}/api/detect'
+    bodies = [cv2.imencode('.jpg', synthetic_image(640, 480, seed))[1].tobytes() for seed in range(16)]
+
+    def client(deadline, outcomes, lock):
+        session = requests.Session()
+        sent = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = session.post(url, files={'image': ('bench.jpg', bodies[sent % len(bodies)])})
+            elapsed = time.perf_counter() - start
+            sent += 1
+            if response.status_code == 200:
+                outcome = (elapsed, response.json().get('quality'))
+            else:
+                outcome = (elapsed, response.status_code)
+                if response.status_code == 503:
+                    # Honor Retry-After, like a well-behaved client
+                    time.sleep(max(0.0, min(float(response.headers.get("Retry-After", 1)), deadline - time.perf_counter(), 1.0)))
+            with lock:
+                outcomes.append(outcome)
+
+    print(f"Latency target {target_ms:.0f} ms, {duration:.0f} s per phase")
+    print(f"{'clients':>7} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} {'shed':>6}  quality levels")
+    try:
+        for concurrency in phases:
+            outcomes, lock = [], threading.Lock()
+            deadline = time.perf_counter() + duration
+            clients = [threading.Thread(target=client, args=(deadline, outcomes, lock))
+                       for _ in range(concurrency)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            answered = [1000 * elapsed for elapsed, outcome in outcomes if isinstance(outcome, str)]
+            shed = sum(1 for _, outcome in outcomes if outcome == 503)
+            levels = collections.Counter(outcome for _, outcome in outcomes if isinstance(outcome, str))
+            p50, p95 = (np.percentile(answered, [50, 95]) if answered else (float('nan'),) * 2)
+            print(f"{concurrency:>7} {len(outcomes):>8} {p50:8.0f} {p95:8.0f} "
+                  f"{100 * shed / max(len(outcomes), 1):5.1f}%  "
+                  + ', '.join(f"{level} {count}" for level, count in levels.most_common()))
+    finally:
+        server.shutdown()
+        api.scheduler.cache = cache
+
+
+def run_metadata(args):
+    """Commit, machine and settings recorded next to the results so runs can be compared"""
+    import platform
+    import subprocess
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        import torch
+        torch_version = torch.__version__
+    except ImportError:
+        torch_version = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'torch': torch_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'args': {key: value for key, value in vars(args).items() if key != 'json'},
+    }
+
+
+def compare_results(baseline_path, candidate_path):
+    """Print p50/p95/throughput changes between two --json result files"""
+    import json
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    print(f"baseline  {baseline['meta'].get('commit')}\ncandidate {candidate['meta'].get('commit')}\n")
+
+    def key(record):
+        return record['suite'], record['name'], record['resolution'], record['concurrency']
+
+    reference = {key(record): record for record in baseline['results']}
+    print(f"{'suite':<7} {'name':<16} {'resolution':>10} {'conc':>4} {'p50':>8} {'p95':>8} {'per s':>8}")
+    for record in candidate['results']:
+        base = reference.get(key(record))
+        if base is None:
+            continue
+        changes = [100 * (record[field] - base[field]) / base[field] if base[field] else 0.0
+                   for field in ('p50_ms', 'p95_ms', 'throughput')]
+        print(f"{record['suite']:<7} {record['name']:<16} {record['resolution']:>10} {record['concurrency']:>4} "
+              + ' '.join(f"{change:+7.1f}%" for change in changes))
+
+
+def load_image(args):
+    image = cv2.imread(args.image) if args.image else synthetic_image(args.width, args.height)
+    if image is None:
+        raise SystemExit(f"Error: could not read image {args.image}")
+    return image
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline")
+    parser.add_argument("--image", help="Path to a test image (a synthetic one is used if omitted)")
+    parser.add_argument("--width", type=int, default=640, help="Width of the synthetic image")
+    parser.add_argument("--height", type=int, default=480, help="Height of the synthetic image")
+    parser.add_argument("--json", help="Write machine-readable results (camera and load suites) to this file")
+    parser.add_argument("--stand-in", action="store_true",
+                        help="Use the simulated models of app/simulated.py (camera, load, session and slo suites)")
+    parser.add_argument("--stand-in-ms", type=float, default=None,
+                        help="Simulated cost per full-size image and model (default: SIM_DETECTION_MS "
+                             "and SIM_DEPTH_MS)")
+    subparsers = parser.add_subparsers(dest="suite", required=True)
+
+    forward_parser = subparsers.add_parser("forward-passes", help="Check one forward pass per model per request")
+    forward_parser.add_argument("--requests", type=int, default=5, help="Number of requests to send")
+
+    modes_parser = subparsers.add_parser("pipeline-modes", help="Compare serial and parallel Camera.infer")
+    modes_parser.add_argument("--iterations", type=int, default=10, help="Timed runs per mode")
+
+    batching_parser = subparsers.add_parser("batching", help="Scheduler throughput by max batch size")
+    batching_parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    batching_parser.add_argument("--requests", type=int, default=32, help="Total images to submit")
+    batching_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8],
+                                 help="Max batch sizes to compare")
+
+    stream_parser = subparsers.add_parser("stream", help="Stream a video file through the MJPEG engine")
+    stream_parser.add_argument("--video", help="Video file to stream (a synthetic one is used if omitted)")
+    stream_parser.add_argument("--no-realtime", action="store_true",
+                               help="Read the file as fast as possible instead of at its native FPS")
+
+    keyframes_parser = subparsers.add_parser("depth-keyframes",
+                                             help="Keyframe depth reuse: FPS gain vs depth error")
+    keyframes_parser.add_argument("--video", help="Video file (a synthetic one is used if omitted)")
+    keyframes_parser.add_argument("--frames", type=int, default=90, help="Maximum frames to read")
+    keyframes_parser.add_argument("--intervals", type=int, nargs="+", default=[2, 4, 8],
+                                  help="Keyframe intervals to compare")
+    keyframes_parser.add_argument("--threshold", type=float, default=0.08,
+                                  help="Scene-change threshold (0 disables it)")
+
+    tracking_parser = subparsers.add_parser("tracking",
+                                            help="Tracked detection: FPS gain vs ID switches")
+    tracking_parser.add_argument("--video", help="Video file (a synthetic one is used if omitted)")
+    tracking_parser.add_argument("--frames", type=int, default=90, help="Maximum frames to read")
+    tracking_parser.add_argument("--intervals", type=int, nargs="+", default=[2, 4, 8],
+                                 help="Maximum detection intervals to compare")
+
+    resolution_parser = subparsers.add_parser("depth-resolution",
+                                              help="Full vs network-resolution depth on a large image")
+    resolution_parser.add_argument("--iterations", type=int, default=5, help="Timed runs per mode")
+
+    tiling_parser = subparsers.add_parser("tiling", help="Single-pass vs tiled detection on a large image")
+    tiling_parser.add_argument("--iterations", type=int, default=3, help="Timed runs per mode")
+
+    query_parser = subparsers.add_parser("queries",
+                                         help="Latency and response size of class, threshold and roi queries")
+    query_parser.add_argument("--iterations", type=int, default=5, help="Timed runs per query")
+    query_parser.add_argument("--roi", type=int, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                              help="Region of interest (default: the central quarter of the image)")
+
+    response_parser = subparsers.add_parser("response-modes", help="Response size and CPU time per output mode")
+    response_parser.add_argument("--iterations", type=int, default=5, help="Timed runs per mode")
+
+    overlay_parser = subparsers.add_parser("overlay", help="Overlay render time by number of detections")
+    overlay_parser.add_argument("--counts", type=int, nargs="+", default=[1, 20, 100, 500],
+                                help="Detections per image")
+    overlay_parser.add_argument("--iterations", type=int, default=10, help="Timed runs per renderer")
+    overlay_parser.add_argument("--preview-width", type=int,
+                                help="Render a downscaled preview of this total width")
+
+    preprocess_parser = subparsers.add_parser("preprocess",
+                                              help="Separate vs shared decode and preprocessing per stage")
+    preprocess_parser.add_argument("--iterations", type=int, default=10, help="Timed runs per path")
+
+    camera_parser = subparsers.add_parser("camera",
+                                          help="Camera methods per resolution, alone and under concurrency")
+    camera_parser.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720", "1920x1080"],
+                               help="Synthetic image sizes (WIDTHxHEIGHT)")
+    camera_parser.add_argument("--iterations", type=int, default=10, help="Images per method and resolution")
+    camera_parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8],
+                               help="Concurrent submitters through the scheduler")
+
+    load_parser = subparsers.add_parser("load", help="Load-test /api/detect over HTTP")
+    load_parser.add_argument("--resolutions", nargs="+", default=["640x480", "1920x1080"],
+                             help="Synthetic image sizes (WIDTHxHEIGHT)")
+    load_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrent clients")
+    load_parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    load_parser.add_argument("--modes", nargs="+", choices=sorted(LOAD_MODES), default=["full", "lean"],
+                             help="Response modes to request")
+    load_parser.add_argument("--port", type=int, default=5056, help="Port for the in-process server")
+
+    slo_parser = subparsers.add_parser("slo", help="Admission control under rising and falling load")
+    slo_parser.add_argument("--target-ms", type=float, default=500, help="Latency target per image")
+    slo_parser.add_argument("--phases", type=int, nargs="+", default=[1, 4, 16, 64, 16, 1],
+                            help="Concurrent clients per phase")
+    slo_parser.add_argument("--duration", type=float, default=10, help="Seconds per phase")
+    slo_parser.add_argument("--port", type=int, default=5057, help="Port for the in-process server")
+
+    session_parser = subparsers.add_parser("session", help="Round trip of /api/session frames vs POST /api/detect")
+    session_parser.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720"],
+                                help="Synthetic frame sizes (WIDTHxHEIGHT)")
+    session_parser.add_argument("--frames", type=int, default=60, help="Frames per client run")
+    session_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrent clients")
+    session_parser.add_argument("--port", type=int, default=5058, help="Port for the in-process server")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two --json result files")
+    compare_parser.add_argument("baseline", help="Results of the reference commit")
+    compare_parser.add_argument("candidate", help="Results to compare against it")
+
+    metrics_parser = subparsers.add_parser("metrics", help="Per-stage times and the overhead of instrumentation")
+    metrics_parser.add_argument("--requests", type=int, default=20, help="Requests per setting and round")
+
+    cold_parser = subparsers.add_parser("cold-start", help="Time-to-health and time-to-ready of a fresh process")
+    cold_parser.add_argument("--runs", type=int, default=3, help="Fresh processes to start")
+
+    workers_parser = subparsers.add_parser("workers",
+                                           help="Throughput and memory of the pre-forked server by worker count")
+    workers_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    workers_parser.add_argument("--modes", nargs="+", choices=["preload", "per-worker"],
+                                default=["preload", "per-worker"], help="How the workers get their models")
+    workers_parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    workers_parser.add_argument("--duration", type=float, default=20, help="Seconds of load per run")
+    workers_parser.add_argument("--port", type=int, default=5055, help="Port for the benchmark server")
+
+    backends_parser = subparsers.add_parser("backends", help="Accuracy vs speed of each inference backend")
+    backends_parser.add_argument("--images", help="Directory of local images (synthetic ones if omitted)")
+    backends_parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8", "onnx-int8-dynamic"],
+                                 help="Backends to compare against torch")
+
+    args = parser.parse_args()
+    image = load_image(args) if args.suite not in ("stream", "depth-keyframes", "tracking", "cold-start",
+                                                   "camera", "load", "slo", "session", "compare") else None
+    records = None
+    if getattr(args, "video", "") is None:
+        import tempfile
+        args.video = synthetic_video(os.path.join(tempfile.mkdtemp(), "synthetic.avi"),
+                                     args.width, args.height)
+
+    if args.suite == "forward-passes":
+        if bench_forward_passes(image, args.requests):
+            print("\n✅ One forward pass per model per image")
+        else:
+            raise SystemExit("\n❌ Models ran more than once per image")
+    elif args.suite == "pipeline-modes":
+        bench_pipeline_modes(image, args.iterations)
+    elif args.suite == "batching":
+        bench_batching(image, args.concurrency, args.requests, args.batch_sizes)
+    elif args.suite == "depth-resolution":
+        bench_depth_resolution(image, args.iterations)
+    elif args.suite == "tiling":
+        bench_tiling(image, args.iterations)
+    elif args.suite == "queries":
+        bench_queries(image, args.iterations, args.roi)
+    elif args.suite == "response-modes":
+        bench_response_modes(image, args.iterations)
+    elif args.suite == "overlay":
+        bench_overlay(image, args.counts, args.iterations, args.preview_width)
+    elif args.suite == "preprocess":
+        bench_preprocess(image, args.iterations)
+    elif args.suite == "backends":
+        if args.images:
+            from app.backends import load_calibration_images
+            images = load_calibration_images(args.images)
+        else:
+            images = [synthetic_image(args.width, args.height, seed) for seed in range(8)]
+        bench_backends(images, args.backends)
+    elif args.suite == "camera":
+        records = bench_camera([parse_resolution(text) for text in args.resolutions], args.iterations,
+                               args.concurrency, args.stand_in, args.stand_in_ms)
+    elif args.suite == "load":
+        records = bench_load([parse_resolution(text) for text in args.resolutions], args.concurrency,
+                             args.requests, args.modes, args.stand_in, args.stand_in_ms, args.port)
+    elif args.suite == "session":
+        records = bench_session([parse_resolution(text) for text in args.resolutions], args.frames,
+                                args.concurrency, args.stand_in, args.stand_in_ms, args.port)
+    elif args.suite == "slo":
+        bench_slo(args.target_ms, args.phases, args.duration, args.stand_in, args.stand_in_ms, args.port)
+    elif args.suite == "compare":
+        compare_results(args.baseline, args.candidate)
+    elif args.suite == "metrics":
+        bench_metrics(image, args.requests)
+    elif args.suite == "workers":
+        bench_workers(image, args.workers, args.modes, args.concurrency, args.duration, args.port)
+    elif args.suite == "cold-start":
+        bench_cold_start(args.runs)
+    elif args.suite == "stream":
+        bench_stream(args.video, realtime=not args.no_realtime)
+    elif args.suite == "depth-keyframes":
+        bench_depth_keyframes(args.video, args.frames, args.intervals, args.threshold)
+    elif args.suite == "tracking":
+        bench_tracking(args.video, args.frames, args.intervals)
+
+    if args.json and records is not None:
+        import json
+        with open(args.json, 'w') as f:
+            json.dump({'meta': run_metadata(args), 'results': records}, f, indent=2)
+        print(f"\nWrote {len(records)} results to {args.json}")
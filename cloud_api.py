@@ -1,24 +1,21 @@
 from flask import Flask, request, jsonify, render_template_string
 import os
-import requests
 import base64
 import io
 from PIL import Image
-import numpy as np
 import json
-import time
+from config import Config
+from fetch import FetchError, ImageFetcher
+from simulator import COCO_NAMES, CostModel, fake_detections, frame_rng
 
 # Initialize Flask app
 app = Flask(__name__)
 
-# Simple in-memory cache for demo purposes
-DEMO_OBJECTS = {
-    "person": {"name": "person", "confidence": 0.92},
-    "car": {"name": "car", "confidence": 0.89},
-    "dog": {"name": "dog", "confidence": 0.85},
-    "cat": {"name": "cat", "confidence": 0.87},
-    "bicycle": {"name": "bicycle", "confidence": 0.82},
-}
+# Pooled, bounded downloads for /api/detect_url
+fetcher = ImageFetcher()
+
+# Simulated inference cost per image (see the SIM_* settings in config.py)
+inference_cost = CostModel(Config.SIM_CALL_MS, Config.SIM_DETECTION_MS + Config.SIM_DEPTH_MS)
 
 @app.route('/')
 def index():
@@ -100,41 +97,18 @@ def _simulate_detection(image):
     """Simulate object detection on an image
     
     This function doesn't actually perform detection but returns simulated results
-    to demonstrate the API structure without requiring heavy ML libraries.
+    to demonstrate the API structure without requiring heavy ML libraries. The
+    detections are seeded by the image content (the same image always gets the
+    same results), and the call costs the simulated inference time, CPU and memory.
     """
-    # Get image dimensions
-    width, height = image.size
-    
-    # Simulate 1-3 random detections
-    num_detections = np.random.randint(1, 4)
-    detections = []
-    
-    for _ in range(num_detections):
-        # Pick a random object type
-        obj_type = np.random.choice(list(DEMO_OBJECTS.keys()))
-        obj_info = DEMO_OBJECTS[obj_type]
-        
-        # Create a random bounding box
-        x1 = np.random.randint(0, width - width//3)
-        y1 = np.random.randint(0, height - height//3)
-        w = np.random.randint(width//5, width//2)
-        h = np.random.randint(height//5, height//2)
-        
-        # Ensure box stays within image
-        x2 = min(x1 + w, width)
-        y2 = min(y1 + h, height)
-        
-        # Add slight randomness to confidence
-        confidence = obj_info["confidence"] * np.random.uniform(0.9, 1.1)
-        confidence = min(max(confidence, 0.7), 0.98)  # Keep between 0.7 and 0.98
-        
-        detections.append({
-            "class": obj_info["name"],
-            "confidence": round(confidence, 2),
-            "bbox": [int(x1), int(y1), int(x2), int(y2)]
-        })
-    
-    return detections
+    inference_cost.run(1)
+    rows = fake_detections((image.height, image.width), frame_rng(image, Config.SIM_SEED),
+                           min_confidence=Config.YOLO_CONFIDENCE)
+    return [{
+        "class": COCO_NAMES[int(cls)],
+        "confidence": round(float(confidence), 2),
+        "bbox": [int(x1), int(y1), int(x2), int(y2)]
+    } for x1, y1, x2, y2, confidence, cls in rows.tolist()]
 
 def _process_image_for_display(image, detections):
     """Add bounding boxes to the image based on detections"""
@@ -152,8 +126,9 @@ def _process_image_for_display(image, detections):
         # Draw rectangle
         draw.rectangle([x1, y1, x2, y2], outline="green", width=3)
         
-        # Draw label background
-        text_size = draw.textsize(label)
+        # Draw label background (textbbox replaces textsize, removed in Pillow 10)
+        left, top, right, bottom = draw.textbbox((0, 0), label)
+        text_size = (right - left, bottom - top)
         draw.rectangle([x1, y1-text_size[1]-5, x1+text_size[0], y1], fill="green")
         
         # Draw label text
@@ -180,9 +155,6 @@ def detect_objects():
         # Process the image
         img = Image.open(file.stream)
         
-        # Simulate processing time
-        time.sleep(1)
-        
         # Get simulated detections
         detections = _simulate_detection(img)
         
@@ -210,15 +182,13 @@ def detect_from_url():
     
     try:
         # Download the image
-        response = requests.get(image_url, stream=True)
-        if response.status_code != 200:
-            return jsonify({'error': f'Failed to download image, status code: {response.status_code}'}), 400
-        
+        img_bytes = fetcher.fetch(image_url)
+    except FetchError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    try:
         # Process the image
-        img = Image.open(io.BytesIO(response.content))
-        
-        # Simulate processing time
-        time.sleep(1)
+        img = Image.open(io.BytesIO(img_bytes))
         
         # Get simulated detections
         detections = _simulate_detection(img)
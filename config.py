@@ -1,7 +1,167 @@
+import os
+
+
 class Config:
     SECRET_KEY = 'your-secret-key-here'
     CAMERA_INDEX = 0
+    # Named sources /start_stream?source=<name> may open besides CAMERA_INDEX (a webcam
+    # index, video file path or stream URL each); clients can only pick from this list
+    STREAM_SOURCES = {}
+    # Default YOLO confidence and NMS IoU thresholds and detections per image (requests
+    # may override them, see app.models.InferenceOptions)
     YOLO_CONFIDENCE = 0.45
+    YOLO_IOU = 0.7
+    YOLO_MAX_DETECTIONS = 300
     FRAME_SKIP = 2
     FRAME_WIDTH = 640
-    FRAME_HEIGHT = 480
\ No newline at end of file
+    FRAME_HEIGHT = 480
+    # 'serial' runs YOLO then MiDaS; 'parallel' runs them concurrently
+    PIPELINE_MODE = 'serial'
+    # Torch intra-op threads per model in parallel mode (None splits the cores evenly)
+    DETECTION_THREADS = None
+    DEPTH_THREADS = None
+    # Admission control (app/admission.py): to hold SLO_LATENCY_MS per image (0 disables it),
+    # quality steps down (YOLO at DEGRADED_YOLO_INPUT_SIZE, network-resolution depth, no
+    # depth, no image) at most every SLO_ADJUST_INTERVAL seconds while the recent p95 or the
+    # expected latency exceeds the target, and back up below SLO_RECOVER_RATIO of it; at the
+    # lowest level requests expected to take over SLO_SHED_RATIO times the target get a 503
+    SLO_LATENCY_MS = float(os.environ.get('SLO_LATENCY_MS', 2000))
+    SLO_WINDOW_SECONDS = 5
+    SLO_ADJUST_INTERVAL = 1.0
+    SLO_RECOVER_RATIO = 0.5
+    SLO_SHED_RATIO = 1.0
+    DEGRADED_YOLO_INPUT_SIZE = 416
+    # Simulated inference for load tests without weights or a GPU: SIMULATED_INFERENCE makes
+    # api.py serve seeded fake detections and depth (app/simulated.py; cloud_api.py uses the
+    # same simulator). A model call costs SIM_CALL_MS plus SIM_DETECTION_MS / SIM_DEPTH_MS per
+    # frame, times a factor from SIM_LATENCY_DISTRIBUTION ('fixed', 'uniform' within
+    # +-SIM_LATENCY_JITTER or 'lognormal' with sigma SIM_LATENCY_JITTER). SIM_CPU_SHARE of that
+    # time burns CPU and the rest sleeps; SIM_MEMORY_MB of scratch memory is held per call
+    SIMULATED_INFERENCE = os.environ.get('SIMULATED_INFERENCE', '0') == '1'
+    SIM_CALL_MS = float(os.environ.get('SIM_CALL_MS', 10))
+    SIM_DETECTION_MS = float(os.environ.get('SIM_DETECTION_MS', 40))
+    SIM_DEPTH_MS = float(os.environ.get('SIM_DEPTH_MS', 30))
+    SIM_LATENCY_DISTRIBUTION = os.environ.get('SIM_LATENCY_DISTRIBUTION', 'lognormal')
+    SIM_LATENCY_JITTER = float(os.environ.get('SIM_LATENCY_JITTER', 0.25))
+    SIM_CPU_SHARE = float(os.environ.get('SIM_CPU_SHARE', 1.0))
+    SIM_MEMORY_MB = int(os.environ.get('SIM_MEMORY_MB', 0))
+    SIM_MAX_DETECTIONS = int(os.environ.get('SIM_MAX_DETECTIONS', 8))
+    SIM_LOAD_SECONDS = float(os.environ.get('SIM_LOAD_SECONDS', 0))
+    SIM_SEED = int(os.environ.get('SIM_SEED', 0))
+    # Micro-batching: collect up to BATCH_MAX_SIZE frames or wait at most BATCH_MAX_WAIT_MS
+    BATCH_MAX_SIZE = 8
+    BATCH_MAX_WAIT_MS = 10
+    # /api/detect_batch limits: images per request, size of one image and decompressed size
+    # of all archive members (checked before they are read), and the largest request body
+    BATCH_MAX_IMAGES = 256
+    BATCH_MAX_IMAGE_BYTES = 32 * 1024 * 1024
+    BATCH_MAX_ARCHIVE_BYTES = 512 * 1024 * 1024
+    MAX_CONTENT_LENGTH = 256 * 1024 * 1024
+    DECODE_WORKERS = 4
+    # /api/session frame-push sessions (needs flask-sock): default long side of the depth map
+    # sent with keyframe results, largest accepted frame message and WebSocket ping interval
+    SESSION_DEPTH_SIDE = 96
+    SESSION_MAX_FRAME_BYTES = 8 * 1024 * 1024
+    SESSION_PING_INTERVAL = 25
+    # /video_feed streaming: frames buffered between capture and inference, MJPEG quality
+    STREAM_QUEUE_SIZE = 2
+    STREAM_JPEG_QUALITY = 80
+    # Downscale the streamed overlay so both panels fit this width (None keeps the frame size)
+    STREAM_PREVIEW_WIDTH = None
+    # Pre-rasterized label piece sprites (class names, confidence suffixes, track id
+    # characters) kept by the overlay renderer
+    OVERLAY_SPRITE_CACHE_SIZE = 512
+    # process_video.py: frames per inference batch, batches buffered between stages and
+    # the FourCC of the annotated output video
+    VIDEO_BATCH_SIZE = 8
+    VIDEO_QUEUE_BATCHES = 4
+    VIDEO_FOURCC = 'mp4v'
+    # Keyframe depth for video: run MiDaS every DEPTH_KEYFRAME_INTERVAL frames or when the
+    # scene-change metric ('diff' or 'hist') exceeds the threshold (0 disables it);
+    # in between 'reuse' the cached depth or 'shift' it by the estimated global motion
+    DEPTH_KEYFRAME_INTERVAL = FRAME_SKIP + 1
+    DEPTH_SCENE_CHANGE_THRESHOLD = 0.08
+    DEPTH_SCENE_METRIC = 'diff'
+    DEPTH_UPDATE = 'reuse'
+    # Tracking for stream and video input: YOLO runs at most every TRACK_DETECT_INTERVAL frames
+    # and a Kalman/IoU tracker carries boxes (with stable ids) in between. The interval halves
+    # when objects move faster than TRACK_MOTION_THRESHOLD of their size per frame or more than
+    # TRACK_LOSS_THRESHOLD of tracks and detections go unmatched, and grows by one otherwise
+    TRACKING_ENABLED = os.environ.get('TRACKING_ENABLED', '1') == '1'
+    TRACK_DETECT_INTERVAL = 4
+    TRACK_MOTION_THRESHOLD = 0.05
+    TRACK_LOSS_THRESHOLD = 0.3
+    TRACK_IOU_THRESHOLD = 0.3
+    TRACK_MAX_AGE = 3
+    TRACK_MIN_HITS = 1
+    # 'full' upsamples depth to the input size; 'network' keeps it at MiDaS output
+    # resolution and only upsamples when a visualization is rendered. Frames whose long
+    # side exceeds DEPTH_FULL_MAX_SIDE always keep network resolution (bounded memory)
+    DEPTH_RESOLUTION = 'full'
+    DEPTH_FULL_MAX_SIDE = 2048
+    # Per-detection depth statistics: fraction trimmed from each side of the box and
+    # the reported percentile
+    DEPTH_BOX_SHRINK = 0.1
+    DEPTH_PERCENTILE = 90
+    # Default JPEG quality of rendered images in API responses
+    JPEG_QUALITY = 95
+    # Result cache keyed by image content hash; RESULT_CACHE_DIR enables the on-disk tier
+    RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1') == '1'
+    RESULT_CACHE_MAX_ENTRIES = 1024
+    RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    RESULT_CACHE_DIR = None
+    RESULT_CACHE_DISK_MAX_BYTES = 2 * 1024 * 1024 * 1024
+    # Disk writes waiting for the background writer; more are dropped rather than queued
+    RESULT_CACHE_DISK_QUEUE = 64
+    # Model artifacts (yolov8s.pt, midas_small.ts) are read from MODEL_DIR. With
+    # MODEL_ALLOW_DOWNLOAD=1 missing weights are fetched once instead of failing.
+    # MODEL_LOADING is 'background' (serve /api/health while warming), 'eager' or 'lazy'.
+    MODEL_DIR = os.environ.get('MODEL_DIR', os.path.dirname(os.path.abspath(__file__)))
+    MODEL_ALLOW_DOWNLOAD = os.environ.get('MODEL_ALLOW_DOWNLOAD', '0') == '1'
+    MODEL_LOADING = 'background'
+    # Inference backend per model: 'torch', 'onnx', 'onnx-int8' or 'onnx-int8-dynamic'
+    # (export the artifacts with prepare_models.py --export ...)
+    DETECTION_BACKEND = os.environ.get('DETECTION_BACKEND', 'torch')
+    DEPTH_BACKEND = os.environ.get('DEPTH_BACKEND', 'torch')
+    ONNX_PROVIDERS = ['CPUExecutionProvider']
+    # Images used to calibrate static INT8 quantization
+    CALIBRATION_IMAGES = 32
+    # Shared preprocessing: uploads whose long side is at least 2x DECODE_MIN_SIDE are
+    # decoded at reduced resolution (0 disables); both models read from one buffer
+    # resized so its long side is PREPROCESS_WORKING_SIDE (the YOLO input size)
+    DECODE_MIN_SIDE = 1280
+    PREPROCESS_WORKING_SIDE = 640
+    # Tiled detection for large images: 'off', 'auto' (tile when the global pass finds
+    # nothing or an object under TILE_SMALL_OBJECT px in the network input) or 'always'.
+    # Frames with a long side of at least TILE_MIN_SIDE are cut into overlapping tiles
+    # (at most TILE_MAX_TILES, run through YOLO in one call) and merged with the global
+    # pass by class-wise NMS. With tiling on, uploads are decoded with TILE_DECODE_MIN_SIDE
+    # instead of DECODE_MIN_SIDE so the tiles have pixels to work with
+    DETECTION_TILING = 'auto'
+    TILE_MIN_SIDE = 1920
+    TILE_OVERLAP = 0.2
+    TILE_MAX_TILES = 16
+    TILE_SMALL_OBJECT = 32
+    TILE_NMS_IOU = 0.5
+    TILE_DECODE_MIN_SIDE = 2560
+    # Pre-forked serving (gunicorn -c gunicorn.conf.py api:app): worker processes, request
+    # threads per worker, whether the models are loaded once in the master and shared
+    # copy-on-write, and whether each worker is pinned to its share of the cores
+    SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', '2'))
+    SERVE_THREADS = int(os.environ.get('SERVE_THREADS', '4'))
+    SERVE_PRELOAD = os.environ.get('SERVE_PRELOAD', '1') == '1'
+    SERVE_PIN_CORES = os.environ.get('SERVE_PIN_CORES', '1') == '1'
+    # /api/detect_url downloads: timeouts in seconds (the total one bounds slow-drip
+    # origins), body size cap, concurrent downloads per host and in total, and the
+    # size of the URL cache revalidated with ETag / Last-Modified
+    FETCH_CONNECT_TIMEOUT = 3.05
+    FETCH_READ_TIMEOUT = 10
+    FETCH_TOTAL_TIMEOUT = 30
+    FETCH_MAX_BYTES = 20 * 1024 * 1024
+    FETCH_PER_HOST_LIMIT = 4
+    FETCH_WORKERS = 16
+    FETCH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    # Per-stage latency histograms on /metrics; SERVER_TIMING adds a Server-Timing
+    # header with the request's stage durations to every API response
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
\ No newline at end of file
@@ -0,0 +1,176 @@
+import collections
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+
+class FetchError(Exception):
+    """An image URL could not be fetched; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ImageFetcher:
+    """Bounded, pooled image downloads for the detect_url endpoints.
+
+    One requests.Session keeps connections alive per host. At most
+    per_host_limit fetches run against a host at once; others wait for a
+    slot until the total deadline. Every fetch has connect and read timeouts
+    plus a total deadline, and the body is streamed and abandoned as soon as
+    it exceeds max_bytes, so a slow or huge origin cannot hold a worker.
+
+    Responses carrying an ETag or Last-Modified are kept in a small LRU
+    (cache_max_bytes in total) and revalidated with a conditional request;
+    a 304 answers from the cache without transferring the body again.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, connect_timeout=None, read_timeout=None, total_timeout=None, max_bytes=None,
+                 per_host_limit=None, cache_max_bytes=None, workers=None):
+        self.connect_timeout = connect_timeout or Config.FETCH_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or Config.FETCH_READ_TIMEOUT
+        self.total_timeout = total_timeout or Config.FETCH_TOTAL_TIMEOUT
+        self.max_bytes = max_bytes or Config.FETCH_MAX_BYTES
+        self.per_host_limit = per_host_limit or Config.FETCH_PER_HOST_LIMIT
+        self.cache_max_bytes = Config.FETCH_CACHE_MAX_BYTES if cache_max_bytes is None else cache_max_bytes
+        workers = workers or Config.FETCH_WORKERS
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=self.per_host_limit)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._cache = collections.OrderedDict()
+        self._cache_bytes = 0
+        self.revalidated = 0
+
+    def _host_slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return slot
+
+    def fetch(self, url):
+        """Return the body of an http(s) URL as bytes, raising FetchError on any failure"""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise FetchError('URL must be an http or https URL')
+        deadline = time.monotonic() + self.total_timeout
+
+        slot = self._host_slot(parts.netloc)
+        if not slot.acquire(timeout=self.total_timeout):
+            raise FetchError(f'Too many concurrent downloads from {parts.netloc}', 503)
+        try:
+            return self._fetch(url, deadline)
+        except requests.Timeout:
+            raise FetchError('Timed out downloading the image', 504)
+        except requests.RequestException as e:
+            raise FetchError(f'Failed to download image: {e}', 502)
+        finally:
+            slot.release()
+
+    def _fetch(self, url, deadline):
+        with self._lock:
+            cached = self._cache.get(url)
+        headers = {}
+        if cached is not None:
+            _, etag, last_modified = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        timeout = (self.connect_timeout, self.read_timeout)
+        with self.session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and cached is not None:
+                with self._lock:
+                    self.revalidated += 1
+                    if url in self._cache:
+                        self._cache.move_to_end(url)
+                return cached[0]
+            if response.status_code != 200:
+                raise FetchError(f'Failed to download image, status code: {response.status_code}')
+
+            # Reject early on a declared size, then enforce the budget while streaming
+            # in case the header is missing or wrong
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise FetchError(f'Image exceeds the {self.max_bytes} byte limit', 413)
+            body = self._read_body(response, deadline)
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self._store(url, (body, etag, last_modified))
+        return body
+
+    def _read_body(self, response, deadline):
+        # The read timeout only bounds each socket read, so an origin trickling
+        # a byte at a time would never trip it; a watchdog shuts the socket down
+        # at the deadline, which makes the blocked read fail
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            try:
+                # shutdown() acts on the connection itself, so a dup of the fd will do
+                with socket.fromfd(response.raw.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, ValueError):
+                pass
+
+        watchdog = threading.Timer(max(0.0, deadline - time.monotonic()), expire)
+        watchdog.daemon = True
+        watchdog.start()
+        body = bytearray()
+        try:
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                body += chunk
+                if len(body) > self.max_bytes:
+                    raise FetchError(f'Image exceeds the {self.max_bytes} byte limit', 413)
+        except Exception:
+            if expired.is_set():
+                raise FetchError('Timed out downloading the image', 504)
+            raise
+        finally:
+            watchdog.cancel()
+        if expired.is_set():
+            raise FetchError('Timed out downloading the image', 504)
+        return bytes(body)
+
+    def _store(self, url, entry):
+        size = len(entry[0])
+        if size > self.cache_max_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(url, None)
+            if old is not None:
+                self._cache_bytes -= len(old[0])
+            self._cache[url] = entry
+            self._cache_bytes += size
+            while self._cache_bytes > self.cache_max_bytes:
+                _, old = self._cache.popitem(last=False)
+                self._cache_bytes -= len(old[0])
+
+    def fetch_many(self, urls):
+        """Fetch several URLs concurrently; returns bytes or a FetchError per URL, in order"""
+        def fetch_one(url):
+            try:
+                return self.fetch(url)
+            except FetchError as e:
+                return e
+        return list(self._pool.map(fetch_one, urls))
@@ -0,0 +1,47 @@
+"""Gunicorn settings for the pre-forked API server:
+
+    gunicorn -c gunicorn.conf.py api:app
+
+With the torch backends the models are loaded once in the master and the
+workers are forked from it, sharing the weights copy-on-write. Each worker
+is pinned to its share of the cores and sizes torch's thread pool to it.
+Idle workers accept connections from the shared listening socket, which
+spreads requests across them; inside a worker, the request threads feed
+that worker's micro-batching scheduler.
+"""
+import os
+
+from config import Config
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = Config.SERVE_WORKERS
+worker_class = 'gthread'
+threads = Config.SERVE_THREADS
+timeout = 300
+
+# ONNX Runtime sessions own thread pools that do not survive a fork, so the
+# ONNX backends load their models in every worker instead
+preload_app = Config.SERVE_PRELOAD and Config.DETECTION_BACKEND == Config.DEPTH_BACKEND == 'torch'
+if preload_app:
+    # Load in the master before forking; a background loader thread would not
+    # be inherited by the workers
+    Config.MODEL_LOADING = 'eager'
+
+
+def when_ready(server):
+    if preload_app:
+        from app import serving
+        serving.prepare_parent()
+
+
+def pre_fork(server, worker):
+    # Reuse the lowest slot not held by a live worker, so a restarted worker
+    # takes over the cores of the one it replaces
+    used = {getattr(other, 'slot', None) for other in server.WORKERS.values()}
+    worker.slot = min(set(range(len(used) + 1)) - used)
+
+
+def post_fork(server, worker):
+    from app import serving
+    cores = serving.init_worker(worker.slot, server.num_workers, pin=Config.SERVE_PIN_CORES)
+    server.log.info("Worker %s (slot %s) pinned to cores %s", worker.pid, worker.slot, cores)
@@ -0,0 +1,41 @@
+import argparse
+import os
+import time
+
+from app import backends
+from app.registry import ModelRegistry
+from config import Config
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepare local model artifacts for offline startup")
+    parser.add_argument("--model-dir", default=Config.MODEL_DIR, help="Artifact directory")
+    parser.add_argument("--force", action="store_true", help="Re-export the MiDaS artifact if it exists")
+    parser.add_argument("--export", nargs="+", default=[], choices=backends.BACKENDS,
+                        help="Also build artifacts for these inference backends")
+    parser.add_argument("--calibration-images", help="Directory of local images for static INT8 calibration")
+
+    args = parser.parse_args()
+    registry = ModelRegistry(model_dir=args.model_dir, allow_download=True,
+                             detection_backend='torch', depth_backend='torch')
+
+    # YOLO downloads its weights on first load if they are missing
+    registry.load_yolo()
+    print(f"YOLOv8s weights: {registry.yolo_path()}")
+
+    if args.force or not os.path.exists(registry.midas_path()):
+        registry.export_midas()
+
+    calibration_images = None
+    if args.calibration_images:
+        calibration_images = backends.load_calibration_images(args.calibration_images)
+    registry.export(args.export, calibration_images)
+
+    # Check that everything loads offline and report the cold-load time
+    for backend in ['torch'] + [name for name in args.export if name != 'torch']:
+        registry = ModelRegistry(model_dir=args.model_dir, allow_download=False,
+                                 detection_backend=backend, depth_backend=backend)
+        start = time.perf_counter()
+        registry.load_yolo()
+        registry.load_midas()
+        print(f"Offline load ({backend}): {time.perf_counter() - start:.2f} s "
+              f"(YOLO {registry.timings['yolo']:.2f} s, MiDaS {registry.timings['midas']:.2f} s)")
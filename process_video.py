@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+
+from app.camera import Camera
+from app.video import VideoProcessor, segment_path
+from config import Config
+
+
+def report_progress(done, total, fps):
+    of_total = f"/{total}" if total else ''
+    print(f"  {done}{of_total} frames, {fps:.1f} FPS", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run detection and depth estimation over a video file, writing per-frame results as JSONL")
+    parser.add_argument("video", help="Input video file")
+    parser.add_argument("--output", help="Per-frame results file (default: <video>.jsonl)")
+    parser.add_argument("--annotated", help="Also write the annotated video (detections | depth) to this file")
+    parser.add_argument("--render-width", type=int,
+                        help="Width of the annotated video (default: twice the input width)")
+    parser.add_argument("--batch-size", type=int, default=Config.VIDEO_BATCH_SIZE,
+                        help="Frames per inference batch")
+    parser.add_argument("--queue-batches", type=int, default=Config.VIDEO_QUEUE_BATCHES,
+                        help="Batches buffered between pipeline stages")
+    parser.add_argument("--track", action="store_true",
+                        help="Track objects across frames (adds track ids, runs YOLO on fewer frames)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue after the frames already in the results file")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines")
+
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.video)[0] + '.jsonl'
+    if not args.resume and os.path.exists(output):
+        os.remove(output)
+
+    camera = Camera(loading='eager')
+    processor = VideoProcessor(camera, args.video, output, output_video=args.annotated,
+                               batch_size=args.batch_size, queue_batches=args.queue_batches,
+                               resume=args.resume, render_width=args.render_width, tracking=args.track)
+    if processor.start_frame:
+        print(f"Resuming after {processor.start_frame} frames already in {output}")
+    if args.annotated:
+        print(f"Annotated video: {segment_path(args.annotated, processor.start_frame)}")
+
+    start = time.perf_counter()
+    try:
+        frames = processor.run(report_progress, args.progress_interval)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after {processor.start_frame + processor.frames_done} frames; "
+              f"rerun with --resume to continue")
+        sys.exit(130)
+    elapsed = time.perf_counter() - start
+
+    print(f"Processed {frames} frames in {elapsed:.1f} s ({processor.fps:.1f} FPS) -> {output}")
+    busy = ', '.join(f"{stage} {seconds:.1f} s" for stage, seconds in processor.stage_seconds.items())
+    print(f"Stage busy time: {busy}")
+    if processor.tracking is not None:
+        print(f"YOLO ran on {processor.tracking.detections_run} of {processor.tracking.frames} frames")
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from config import Config
+
+# COCO class names in YOLO's order, for simulated detections
+COCO_NAMES = (
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat',
+    'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog',
+    'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella',
+    'handbag', 'tie', 'suitcase', 'frisbee', 'skis', 'snowboard', 'sports ball', 'kite',
+    'baseball bat', 'baseball glove', 'skateboard', 'surfboard', 'tennis racket', 'bottle',
+    'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange',
+    'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch', 'potted plant',
+    'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse', 'remote', 'keyboard', 'cell phone',
+    'microwave', 'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase', 'scissors',
+    'teddy bear', 'hair drier', 'toothbrush',
+)
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+# MiDaS small's output resolution (long side)
+DEPTH_NETWORK_SIDE = 256
+
+_BURN_BLOCK = bytes(64 * 1024)
+
+
+class CostModel:
+    """Time, CPU and memory that one simulated model call costs.
+
+    A call over n frames takes call_ms + n * frame_ms, times a random factor
+    with median 1 from the latency distribution: 'fixed', 'uniform' within
+    +-jitter or 'lognormal' with sigma jitter. The factors come from a
+    generator seeded with seed, so a run's sequence of latencies repeats.
+    cpu_share of the time is CPU time of the calling thread spent hashing a
+    buffer (hashlib releases the GIL for large inputs, as torch kernels do),
+    so calls competing for cores take longer, as real inference does; the
+    rest is spent sleeping, like a wait on a GPU. memory_mb of scratch
+    memory is allocated and touched for the duration of the call.
+    """
+
+    def __init__(self, call_ms, frame_ms, distribution=None, jitter=None, cpu_share=None, memory_mb=None,
+                 seed=None):
+        self.call = call_ms / 1000.0
+        self.frame = frame_ms / 1000.0
+        self.distribution = distribution or Config.SIM_LATENCY_DISTRIBUTION
+        if self.distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {self.distribution!r}, "
+                             f"expected one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.jitter = Config.SIM_LATENCY_JITTER if jitter is None else jitter
+        self.cpu_share = min(1.0, max(0.0, Config.SIM_CPU_SHARE if cpu_share is None else cpu_share))
+        self.memory_mb = Config.SIM_MEMORY_MB if memory_mb is None else memory_mb
+        self._rng = np.random.default_rng(Config.SIM_SEED if seed is None else seed)
+        self._lock = threading.Lock()
+
+    def sample(self, frames, scale=1.0):
+        """Seconds a call over `frames` frames takes; scale multiplies the per-frame cost"""
+        with self._lock:
+            if self.distribution == 'uniform':
+                factor = self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+            elif self.distribution == 'lognormal':
+                factor = self._rng.lognormal(0.0, self.jitter)
+            else:
+                factor = 1.0
+        return max(0.0, (self.call + frames * self.frame * scale) * factor)
+
+    def run(self, frames, scale=1.0):
+        """Spend one call's CPU, wait time and memory; returns the seconds it costs uncontended"""
+        seconds = self.sample(frames, scale)
+        scratch = None
+        if self.memory_mb:
+            scratch = np.empty(self.memory_mb * 1024 * 1024, dtype=np.uint8)
+            # Write one byte per page so the memory is actually resident
+            scratch[::4096] = 1
+        cpu_seconds = seconds * self.cpu_share
+        start = time.thread_time()
+        while time.thread_time() - start < cpu_seconds:
+            hashlib.sha256(_BURN_BLOCK)
+        if seconds > cpu_seconds:
+            time.sleep(seconds - cpu_seconds)
+        del scratch
+        return seconds
+
+
+def frame_rng(image, seed, stream=0):
+    """Generator seeded by the seed, an output stream and the image content.
+
+    The same image always gets the same simulated outputs, independent of
+    batching and call order; the content hash reads a subsampled grid only.
+    """
+    sample = np.ascontiguousarray(np.asarray(image)[::16, ::16])
+    return np.random.default_rng([seed, stream, zlib.crc32(sample.tobytes())])
+
+
+def fake_detections(shape, rng, max_detections=None, min_confidence=0.25):
+    """Random (N, 6) x1, y1, x2, y2, conf, cls detections inside a height x width frame"""
+    height, width = shape[:2]
+    max_detections = Config.SIM_MAX_DETECTIONS if max_detections is None else max_detections
+    count = int(rng.integers(0, max_detections + 1))
+    size = rng.uniform(0.05, 0.5, size=(count, 2)) * (width, height)
+    center = rng.uniform(0.0, 1.0, size=(count, 2)) * (width, height)
+    top_left = np.clip(center - size / 2, 0, (width, height))
+    bottom_right = np.clip(center + size / 2, 0, (width, height))
+    confidence = rng.uniform(min_confidence, 0.98, size=count)
+    classes = rng.integers(0, len(COCO_NAMES), size=count)
+    detections = np.column_stack([top_left, bottom_right, confidence, classes]).astype(np.float32)
+    return detections[np.argsort(-confidence)]
+
+
+def fake_depth(shape, rng, side=DEPTH_NETWORK_SIDE):
+    """Smooth random depth map normalized to [0, 1] at network resolution (long side `side`)"""
+    height, width = shape[:2]
+    scale = side / max(height, width)
+    height, width = max(1, round(height * scale)), max(1, round(width * scale))
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :]
+    # Nearer towards the bottom of the frame, plus a few low-frequency waves
+    depth = np.broadcast_to(y, (height, width)).copy()
+    for amplitude, fy, fx, phase in zip(rng.uniform(0.05, 0.2, 3), rng.uniform(0.5, 3, 3),
+                                        rng.uniform(0.5, 3, 3), rng.uniform(0, 2 * np.pi, 3)):
+        depth += amplitude * np.sin(2 * np.pi * (fy * y + fx * x) + phase)
+    depth -= depth.min()
+    return depth / max(float(depth.max()), 1e-6)
@@ -5,6 +5,7 @@ import cv2
 import numpy as np
 import argparse
 import os
+import time
 from PIL import Image
 import io
 
@@ -33,6 +34,7 @@ def test_detect_endpoint(base_url, image_path):
     
     if response.status_code == 200:
         result = response.json()
+        print(f"Quality level: {result.get('quality')}")
         print(f"Detected {len(result['detections'])} objects:")
         for detection in result['detections']:
             print(f"  - {detection['class']} (confidence: {detection['confidence']:.2f})")
@@ -50,6 +52,38 @@ def test_detect_endpoint(base_url, image_path):
     print("-" * 50)
     return response.status_code == 200
 
+def test_detect_query_endpoint(base_url, image_path):
+    """Test the detect endpoint with a class filter, detection limit and region of interest"""
+    url = f"{base_url}/api/detect"
+    
+    if not os.path.exists(image_path):
+        print(f"Error: Image file not found at {image_path}")
+        return False
+    
+    with open(image_path, 'rb') as img_file:
+        img_bytes = img_file.read()
+    width, height = Image.open(io.BytesIO(img_bytes)).size
+    roi = [width // 4, height // 4, 3 * width // 4, 3 * height // 4]
+    data = {'classes': 'person', 'max_det': '3', 'roi': ','.join(map(str, roi)), 'image': 'false'}
+    response = requests.post(url, files={'image': (os.path.basename(image_path), img_bytes, 'image/jpeg')},
+                             data=data)
+    
+    print(f"Detect Query Status: {response.status_code}")
+    
+    if response.status_code != 200:
+        print(f"Error: {response.text}")
+        print("-" * 50)
+        return False
+    
+    result = response.json()
+    detections = result['detections']
+    print(f"Detected {len(detections)} people in roi {result.get('roi')}")
+    inside = all(roi[0] <= d['bbox'][0] and roi[1] <= d['bbox'][1]
+                 and d['bbox'][2] <= roi[2] + 1 and d['bbox'][3] <= roi[3] + 1 for d in detections)
+    print("-" * 50)
+    return (result.get('roi') == roi and len(detections) <= 3 and inside
+            and all(d['class'] == 'person' for d in detections))
+
 def test_detect_url_endpoint(base_url, image_url):
     """Test the detect_url endpoint with an image URL"""
     url = f"{base_url}/api/detect_url"
@@ -80,6 +114,189 @@ def test_detect_url_endpoint(base_url, image_url):
     print("-" * 50)
     return response.status_code == 200
 
+def test_detect_batch_endpoint(base_url, image_path, count=4):
+    """Test the detect_batch endpoint with several copies of a local image, sent
+    both as multipart files and as a zip archive"""
+    import zipfile
+    
+    url = f"{base_url}/api/detect_batch"
+    
+    if not os.path.exists(image_path):
+        print(f"Error: Image file not found at {image_path}")
+        return False
+    
+    with open(image_path, 'rb') as img_file:
+        img_bytes = img_file.read()
+    
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for i in range(count):
+            zf.writestr(f"archive_{i}.jpg", img_bytes)
+    archive.seek(0)
+    
+    files = [('images', (f"upload_{i}.jpg", img_bytes, 'image/jpeg')) for i in range(count)]
+    files.append(('archive', ('images.zip', archive, 'application/zip')))
+    response = requests.post(url, files=files, stream=True)
+    
+    print(f"Detect Batch Endpoint Status: {response.status_code}")
+    
+    if response.status_code != 200:
+        print(f"Error: {response.text}")
+        print("-" * 50)
+        return False
+    
+    # Results arrive as newline-delimited JSON while the images complete
+    indices = set()
+    for line in response.iter_lines():
+        if not line:
+            continue
+        result = json.loads(line)
+        indices.add(result['index'])
+        if 'error' in result:
+            print(f"  - {result['filename']}: error {result['error']}")
+        else:
+            print(f"  - {result['filename']}: {len(result['detections'])} objects")
+    
+    print("-" * 50)
+    return indices == set(range(2 * count))
+
+class StandInImageServer:
+    """Local HTTP stand-in for an image origin, run on a background thread.
+
+    /image.jpg    the image with an ETag (answers 304 to a matching If-None-Match)
+    /slow.jpg     the image trickled out one byte every 0.5 s
+    /large.jpg    more bytes than the fetcher's limit, without a Content-Length
+    /missing.jpg  404
+    """
+
+    def __init__(self, image_bytes, host="127.0.0.1"):
+        import hashlib
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        etag = '"' + hashlib.md5(image_bytes).hexdigest() + '"'
+        stats = self.stats = {'requests': 0, 'not_modified': 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stats['requests'] += 1
+                try:
+                    self._respond()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The fetcher hung up on a slow or oversized body
+                    pass
+
+            def _respond(self):
+                if self.path == '/image.jpg':
+                    if self.headers.get('If-None-Match') == etag:
+                        stats['not_modified'] += 1
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', str(len(image_bytes)))
+                    self.end_headers()
+                    self.wfile.write(image_bytes)
+                elif self.path == '/slow.jpg':
+                    self.send_response(200)
+                    self.end_headers()
+                    for i in range(len(image_bytes)):
+                        self.wfile.write(image_bytes[i:i + 1])
+                        self.wfile.flush()
+                        time.sleep(0.5)
+                elif self.path == '/large.jpg':
+                    self.send_response(200)
+                    self.end_headers()
+                    for _ in range(64):
+                        self.wfile.write(b'\0' * 65536)
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def test_fetcher(image_path):
+    """Test the image fetcher (timeouts, size cap, revalidation, lists) against a local stand-in server"""
+    from fetch import FetchError, ImageFetcher
+    
+    if not os.path.exists(image_path):
+        print(f"Error: Image file not found at {image_path}")
+        return False
+    
+    with open(image_path, 'rb') as img_file:
+        img_bytes = img_file.read()
+    
+    server = StandInImageServer(img_bytes)
+    fetcher = ImageFetcher(read_timeout=1, total_timeout=2, max_bytes=1024 * 1024)
+    checks = {}
+    try:
+        checks['download'] = fetcher.fetch(f"{server.base_url}/image.jpg") == img_bytes
+        checks['revalidated from cache'] = (fetcher.fetch(f"{server.base_url}/image.jpg") == img_bytes
+                                            and server.stats['not_modified'] == 1)
+        for name, path, status in (('slow origin', '/slow.jpg', 504), ('size cap', '/large.jpg', 413),
+                                   ('origin error', '/missing.jpg', 400)):
+            start = time.perf_counter()
+            try:
+                fetcher.fetch(server.base_url + path)
+                checks[name] = False
+            except FetchError as e:
+                checks[name] = e.status == status and time.perf_counter() - start < 5
+        results = fetcher.fetch_many([f"{server.base_url}/image.jpg", f"{server.base_url}/missing.jpg"])
+        checks['url list'] = results[0] == img_bytes and isinstance(results[1], FetchError)
+    finally:
+        server.close()
+    
+    for name, ok in checks.items():
+        print(f"  - {name}: {'ok' if ok else 'FAILED'}")
+    print("-" * 50)
+    return all(checks.values())
+
+def test_detect_url_list_endpoint(base_url, image_path, count=3):
+    """Test the detect_url endpoint with a list of URLs served by a local stand-in server"""
+    url = f"{base_url}/api/detect_url"
+    
+    if not os.path.exists(image_path):
+        print(f"Error: Image file not found at {image_path}")
+        return False
+    
+    with open(image_path, 'rb') as img_file:
+        server = StandInImageServer(img_file.read())
+    try:
+        urls = [f"{server.base_url}/image.jpg"] * count + [f"{server.base_url}/missing.jpg"]
+        response = requests.post(url, json={"urls": urls, "image": False}, stream=True)
+        
+        print(f"Detect URL List Endpoint Status: {response.status_code}")
+        
+        if response.status_code != 200:
+            print(f"Error: {response.text}")
+            print("-" * 50)
+            return False
+        
+        results = [json.loads(line) for line in response.iter_lines() if line]
+    finally:
+        server.close()
+    
+    for result in results:
+        if 'error' in result:
+            print(f"  - {result['url']}: error {result['error']}")
+        else:
+            print(f"  - {result['url']}: {len(result['detections'])} objects")
+    
+    print("-" * 50)
+    errors = {result['index'] for result in results if 'error' in result}
+    return {result['index'] for result in results} == set(range(count + 1)) and errors == {count}
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test the Object Detection API")
     parser.add_argument("--url", default="http://localhost:5000", help="Base URL of the API")
@@ -95,15 +312,23 @@ if __name__ == "__main__":
     # Test all endpoints
     health_ok = test_health_endpoint(args.url)
     detect_ok = test_detect_endpoint(args.url, args.image)
+    detect_query_ok = test_detect_query_endpoint(args.url, args.image)
     detect_url_ok = test_detect_url_endpoint(args.url, args.image_url)
+    detect_batch_ok = test_detect_batch_endpoint(args.url, args.image)
+    fetcher_ok = test_fetcher(args.image)
+    detect_url_list_ok = test_detect_url_list_endpoint(args.url, args.image)
     
     # Summary
     print("Test Summary:")
     print(f"Health Endpoint: {'✅ Passed' if health_ok else '❌ Failed'}")
     print(f"Detect Endpoint: {'✅ Passed' if detect_ok else '❌ Failed'}")
+    print(f"Detect Query: {'✅ Passed' if detect_query_ok else '❌ Failed'}")
     print(f"Detect URL Endpoint: {'✅ Passed' if detect_url_ok else '❌ Failed'}")
+    print(f"Detect Batch Endpoint: {'✅ Passed' if detect_batch_ok else '❌ Failed'}")
+    print(f"Image Fetcher: {'✅ Passed' if fetcher_ok else '❌ Failed'}")
+    print(f"Detect URL List Endpoint: {'✅ Passed' if detect_url_list_ok else '❌ Failed'}")
     
-    if health_ok and detect_ok and detect_url_ok:
+    if health_ok and detect_ok and detect_query_ok and detect_url_ok and detect_batch_ok and fetcher_ok and detect_url_list_ok:
         print("\n🎉 All tests passed! The API is working correctly.")
     else:
         print("\n⚠️ Some tests failed. Please check the API configuration.") 
\ No newline at end of file